@@ -1,5 +1,7 @@
+import random
 import uuid
-from typing import NamedTuple, Any, Union, List
+from datetime import datetime
+from typing import NamedTuple, Any, Union, List, Optional, Tuple
 
 
 class Checkpoint(NamedTuple):
@@ -11,9 +13,26 @@ class Mutator(NamedTuple):
     keys: List[int]
 
 
+class KeyRange(NamedTuple):
+    # the keys `lo <= key < hi`
+    lo: int
+    hi: int
+
+
+class RangeMutator(NamedTuple):
+    """
+    A `Mutator` of whole key ranges, e.g. a scan or a bulk delete, which interferes with every command on a key within
+    any of its `ranges` without listing those keys.
+    """
+    op: str
+    keys: List[int]
+    ranges: List[KeyRange]
+
+
 CLASSES = [
     Checkpoint,
-    Mutator
+    Mutator,
+    RangeMutator,
 ]
 
 CLASSES_MAP = {k.__name__[:1]: k for k in CLASSES}
@@ -21,14 +40,80 @@ CLASSES_MAP_BACK = {k: k.__name__[:1] for k in CLASSES}
 
 
 class CommandID(uuid.UUID):
+    """
+    `TS | Leader | Instance | Nonce`: milliseconds since the epoch (48 bits), the replica leading the command (16 bits,
+    `0` if the client left it to the replica it sends the command to), the instance of the leader (32 bits) and
+    a random nonce (32 bits).
+
+    Clients allocate the IDs without an instance. The leader binds the ID to the slot it starts the command in, so that
+    the slot of a proposed command is known from its ID alone.
+    """
+
+    UNBOUND = 0xffffffff
+
+    @classmethod
+    def create(cls, leader: int = 0, at: Optional[datetime] = None, nonce: Optional[int] = None,
+               instance: int = UNBOUND) -> 'CommandID':
+        at = at if at is not None else datetime.now()
+        nonce = nonce if nonce is not None else random.getrandbits(32)
+        return cls.from_parts(int(at.timestamp() * 1000), leader, instance, nonce)
+
     @classmethod
-    def create(cls):
-        return uuid.uuid4()
+    def from_parts(cls, timestamp: int, leader: int, instance: int, nonce: int) -> 'CommandID':
+        return cls(int=(timestamp << 80) | (leader << 64) | (instance << 32) | nonce)
+
+    @property
+    def timestamp(self) -> int:
+        return self.int >> 80
+
+    @property
+    def leader(self) -> int:
+        return (self.int >> 64) & 0xffff
+
+    @property
+    def instance(self) -> int:
+        return (self.int >> 32) & 0xffffffff
+
+    @property
+    def nonce(self) -> int:
+        return self.int & 0xffffffff
+
+    @property
+    def slot(self) -> Optional[Tuple[int, int]]:
+        """
+        :return: `(replica_id, instance_id)` of the slot the ID is bound to
+        """
+        if self.instance == self.UNBOUND:
+            return None
+        return self.leader, self.instance
+
+    @property
+    def request(self) -> 'CommandID':
+        """
+        :return: the ID as allocated by the client, which identifies the request regardless of the slot it is bound to
+        """
+        return self.from_parts(self.timestamp, 0, self.UNBOUND, self.nonce)
+
+    def bind(self, leader: int, instance: int) -> 'CommandID':
+        return self.from_parts(self.timestamp, leader, instance, self.nonce)
+
+
+class CommandIDAllocator:
+    """
+    Allocates the IDs of the commands of a client. A seeded `random` and a virtual `clock` make them reproducible.
+    """
+
+    def __init__(self, clock=datetime.now, rng: Optional[random.Random] = None):
+        self.clock = clock
+        self.random = rng if rng is not None else random.Random()
+
+    def __call__(self, leader: int = 0) -> CommandID:
+        return CommandID.create(leader, self.clock(), self.random.getrandbits(32))
 
 
 class Command(NamedTuple):
     id: CommandID
-    payload: Union[Checkpoint, Mutator]
+    payload: Union[Checkpoint, Mutator, RangeMutator]
 
     def __repr__(self):
         return f'Command({self.id.hex},{self.payload})'
@@ -1,7 +1,7 @@
-from itertools import groupby
-from typing import NamedTuple, Dict, List, Optional
+from bisect import bisect_left, bisect_right
+from typing import NamedTuple, Dict, List, Optional, Callable, Union
 
-from dsm.epaxos.cmd.state import Command, Checkpoint, Mutator
+from dsm.epaxos.cmd.state import Command, Checkpoint, Mutator, RangeMutator
 from dsm.epaxos.inst.state import Slot
 
 
@@ -15,88 +15,241 @@ class CPCacheState(NamedTuple):
     deps: List[Slot]
 
 
+class RangeIndex:
+    """
+    The last writes of key ranges, as disjoint segments `starts[i] <= key < ends[i]` sorted by their start, each with
+    the last slot that wrote all of it. Both `starts` and `ends` are sorted, so the segments overlapping a range are
+    found with two bisections.
+    """
+
+    def __init__(self):
+        self.starts = []  # type: List[int]
+        self.ends = []  # type: List[int]
+        self.states = []  # type: List[CacheState]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def at(self, key: int) -> Optional[CacheState]:
+        i = bisect_right(self.starts, key) - 1
+
+        if i >= 0 and key < self.ends[i]:
+            return self.states[i]
+
+        return None
+
+    def _span(self, lo: int, hi: int):
+        return bisect_right(self.ends, lo), bisect_left(self.starts, hi)
+
+    def overlapping(self, lo: int, hi: int) -> List[CacheState]:
+        i, j = self._span(lo, hi)
+        return self.states[i:j]
+
+    def paint(self, lo: int, hi: int, state: CacheState):
+        """
+        Record `state` as the last write of the keys `lo <= key < hi`, except where a later slot has written them.
+        """
+        i, j = self._span(lo, hi)
+
+        new = []
+        right = None
+        at = lo
+
+        for s, e, x in zip(self.starts[i:j], self.ends[i:j], self.states[i:j]):
+            if x.slot < state.slot:
+                # what sticks out of the range stays
+                if s < lo:
+                    new.append((s, lo, x))
+                if e > hi:
+                    right = (hi, e, x)
+            else:
+                if at < s:
+                    new.append((at, s, state))
+                new.append((s, e, x))
+                at = max(at, e)
+
+        if at < hi:
+            new.append((at, hi, state))
+
+        if right:
+            new.append(right)
+
+        self.starts[i:j] = [s for s, _, _ in new]
+        self.ends[i:j] = [e for _, e, _ in new]
+        self.states[i:j] = [x for _, _, x in new]
+
+    def purge(self, earlier: Callable[[Slot], bool]):
+        keep = [i for i, x in enumerate(self.states) if not earlier(x.slot)]
+
+        self.starts = [self.starts[i] for i in keep]
+        self.ends = [self.ends[i] for i in keep]
+        self.states = [self.states[i] for i in keep]
+
+    def __repr__(self):
+        return f'RangeIndex({list(zip(self.starts, self.ends, self.states))})'
+
+
+MUTATOR_T = Union[Mutator, RangeMutator]
+
+
 class KeyedDepsCache:
     def __init__(self):
         self.store = {}  # type: Dict[int, CacheState]
         self.cp = None  # type: Optional[CPCacheState]
 
-    def _last_seq_max(self, slot, mut: Mutator):
-        # a checkpoint always depends on the previous checkpoint and the set of
+        # the last writes of the ranges of `RangeMutator`s
+        self.ranges = RangeIndex()
+        # the keys of `store` in order, built by the first range command, as the ones within a range are looked up
+        self.sorted_keys = None  # type: Optional[List[int]]
+
+        # the last slot of every replica and the highest seq recorded in `store` since the last checkpoint, so that
+        # a checkpoint does not need to look at every key
+        self.max_slots = {}  # type: Dict[int, Slot]
+        self.max_seq = -1
+
+    def _keys(self) -> List[int]:
+        if self.sorted_keys is None:
+            self.sorted_keys = sorted(self.store.keys())
+
+        return self.sorted_keys
+
+    def _conflicts(self, slot: Slot, mut: MUTATOR_T) -> List[CacheState]:
+        r = []
 
-        last_seq = -1
         for x in mut.keys:
             inter_val = self.store.get(x)
 
-            if inter_val and inter_val.slot != slot and inter_val.slot < slot:
-                last_seq = max(last_seq, inter_val.seq)
+            if inter_val and inter_val.slot < slot:
+                r.append(inter_val)
+
+            if len(self.ranges):
+                inter_val = self.ranges.at(x)
+
+                if inter_val and inter_val.slot < slot:
+                    r.append(inter_val)
+
+        if isinstance(mut, RangeMutator):
+            keys = self._keys()
+
+            for lo, hi in mut.ranges:
+                for x in keys[bisect_left(keys, lo):bisect_left(keys, hi)]:
+                    inter_val = self.store[x]
+
+                    if inter_val.slot < slot:
+                        r.append(inter_val)
+
+                r.extend(x for x in self.ranges.overlapping(lo, hi) if x.slot < slot)
+
+        return r
+
+    def _last_seq_max(self, conflicts: List[CacheState]):
+        # a checkpoint always depends on the previous checkpoint and the set of
+
+        last_seq = max((x.seq for x in conflicts), default=-1)
 
         if self.cp:
             last_seq = max(self.cp.state.seq, last_seq)
 
         return last_seq + 1
 
-    def _update_store(self, slot: Slot, mut: Mutator, seq: int):
-        r = []
+    def _update_store(self, slot: Slot, mut: MUTATOR_T, seq: int):
+        recorded = False
 
         for x in mut.keys:
             inter_val = self.store.get(x)
 
-            if inter_val and inter_val.slot != slot and inter_val.slot < slot:
-                r.append(inter_val.slot)
-
             if inter_val is None or inter_val.slot < slot:
+                if inter_val is None and self.sorted_keys is not None:
+                    self.sorted_keys.insert(bisect_left(self.sorted_keys, x), x)
+
                 self.store[x] = CacheState(
                     slot,
                     seq
                 )
+                recorded = True
 
-        return r
+        if isinstance(mut, RangeMutator):
+            keys = self._keys()
+
+            for lo, hi in mut.ranges:
+                if lo >= hi:
+                    continue
+
+                # a later command on one of these keys is ordered after the range, and so after the earlier writes
+                i, j = bisect_left(keys, lo), bisect_left(keys, hi)
+                keep = []
+
+                for x in keys[i:j]:
+                    if self.store[x].slot < slot:
+                        del self.store[x]
+                    else:
+                        keep.append(x)
+
+                keys[i:j] = keep
+                self.ranges.paint(lo, hi, CacheState(slot, seq))
+                recorded = True
+
+        if recorded:
+            if self.max_slots.get(slot.replica_id, slot) <= slot:
+                self.max_slots[slot.replica_id] = slot
+            self.max_seq = max(self.max_seq, seq)
+
+    def purge(self, earlier: Callable[[Slot], bool]):
+        """
+        Forget the keys last written by the slots `earlier` than a checkpoint: every replica has executed those.
+
+        `max_slots` and `max_seq` are left as they are: a checkpoint may depend on such a slot, which it is ordered
+        after anyway.
+        """
+        self.store = {k: v for k, v in self.store.items() if not earlier(v.slot)}
+        self.sorted_keys = None
+        self.ranges.purge(earlier)
 
     def xchange(self, slot: Slot, cmd: Command):
-        if isinstance(cmd.payload, Mutator):
-            seq = self._last_seq_max(slot, cmd.payload)
-            deps = self._update_store(
+        if isinstance(cmd.payload, (Mutator, RangeMutator)):
+            conflicts = self._conflicts(slot, cmd.payload)
+            seq = self._last_seq_max(conflicts)
+            self._update_store(
                 slot,
                 cmd.payload,
                 seq
             )
-            return seq, sorted(set(deps))
+            return seq, sorted({x.slot for x in conflicts})
         elif isinstance(cmd.payload, Checkpoint):
             # Checkpoint - "These are the last slots I know about."
+            # A slot of a replica recorded earlier may have been overwritten in `store` by the slot of another one, so
+            # `max_slots` may make the checkpoint depend on more slots than the keys do; it is ordered after them anyway.
 
-            if self.cp is None:
-                new_seq = max((x.seq for x in self.store.values()), default=-1) + 1
-                new_deps = [x.slot for x in self.store.values()]
+            new_deps = list(self.max_slots.values())
 
+            if self.cp is None:
+                new_seq = self.max_seq + 1
             elif self.cp.state.slot == slot:
-                new_seq = max(
-                    max((x.seq for x in self.store.values()), default=-1),
-                    self.cp.state.seq - 1
-                ) + 1
-                new_deps = [x.slot for x in self.store.values()] + self.cp.deps
+                new_seq = max(self.max_seq, self.cp.state.seq - 1) + 1
+                new_deps += self.cp.deps
             else:
-                new_seq = max(max((x.seq for x in self.store.values()), default=-1), self.cp.state.seq) + 1
-                new_deps = [x.slot for x in self.store.values()] + [self.cp.state.slot]
-
-            new_deps = sorted(set(new_deps))
+                new_seq = max(self.max_seq, self.cp.state.seq) + 1
+                new_deps += [self.cp.state.slot]
 
-            def last(xs):
-                r = None
-                for x in xs:
-                    r = x
-                return x
+            last = {}  # type: Dict[int, Slot]
 
-            new_deps = [last(xs) for x, xs in groupby(new_deps, key=lambda x: x.replica_id)]
+            for x in new_deps:
+                if last.get(x.replica_id, x) <= x:
+                    last[x.replica_id] = x
 
             self.cp = CPCacheState(
                 CacheState(
                     slot,
                     new_seq
                 ),
-                sorted(new_deps)
+                sorted(last.values())
             )
 
             self.store = {}
+            self.ranges = RangeIndex()
+            self.sorted_keys = None
+            self.max_slots = {}
+            self.max_seq = -1
             return self.cp.state.seq, self.cp.deps
         else:
             assert False, (slot, cmd)
@@ -17,6 +17,13 @@ class Slot(NamedTuple):
     def next(self):
         return Slot(self.replica_id, self.instance_id + 1)
 
+    def pack(self) -> int:
+        """
+        A single int ordered the way the slots are: a cheaper sort key than the tuple.
+        """
+        # by index, as the named fields are properties
+        return (self[0] << 32) + self[1]
+
     @classmethod
     def serializer(cls, sub_ser):
         return lambda obj: [obj.replica_id, obj.instance_id]
@@ -1,5 +1,5 @@
 import logging
-from typing import NamedTuple, Dict, Optional, Tuple
+from typing import NamedTuple, Dict, Optional, Tuple, List, Any, Iterator
 from uuid import UUID
 
 from dsm.epaxos.cmd.state import CommandID
@@ -45,15 +45,6 @@ class LoadResult(NamedTuple):
     inst: InstanceStoreState
 
 
-def between_checkpoints(old, new):
-    for x in new.keys():
-        max_slot = new.get(x, Slot(x, 0))
-        low_slot = old.get(x, Slot(x, 0))
-
-        for y in range(low_slot.instance_id, max_slot.instance_id):
-            yield Slot(x, y)
-
-
 CP_T = Dict[int, Slot]
 
 
@@ -88,18 +79,220 @@ class CheckpointCycle:
         return f'CheckpointCycle({o}, {m})'
 
 
+_EMPTY = object()
+
+
+class SlotWindow:
+    """
+    A mapping of slots to values, kept as a list per origin replica that starts at the instance ID `bases[origin]`.
+    The instance IDs of an origin are allocated in order, so the lists are dense, and a checkpoint drops everything
+    below it with a single slice instead of probing every slot of the recycled range.
+
+    A slot more than `max_gap` instances off the list of its origin, which a single packet of a faulty peer could name,
+    is kept in the dict `far` instead of growing the list up to it, and is moved into the list once the list reaches it.
+    """
+
+    def __init__(self, max_gap: int = 1 << 16):
+        self.bases = {}  # type: Dict[int, int]
+        self.lists = {}  # type: Dict[int, List[Any]]
+        self.far = {}  # type: Dict[int, Dict[int, Any]]
+        self.size = 0
+        self.max_gap = max_gap
+
+    def get(self, slot: Slot, default=None):
+        vals = self.lists.get(slot.replica_id)
+
+        if vals is None:
+            return default
+
+        i = slot.instance_id - self.bases[slot.replica_id]
+
+        if 0 <= i < len(vals):
+            r = vals[i]
+            return default if r is _EMPTY else r
+        elif slot.replica_id in self.far:
+            return self.far[slot.replica_id].get(slot.instance_id, default)
+        else:
+            return default
+
+    def __contains__(self, slot: Slot):
+        return self.get(slot, _EMPTY) is not _EMPTY
+
+    def __getitem__(self, slot: Slot):
+        r = self.get(slot, _EMPTY)
+
+        if r is _EMPTY:
+            raise KeyError(slot)
+
+        return r
+
+    def __setitem__(self, slot: Slot, value):
+        origin, instance_id = slot
+        vals = self.lists.get(origin)
+
+        if vals is None:
+            vals = self.lists[origin] = []
+            self.bases[origin] = instance_id
+
+        i = instance_id - self.bases[origin]
+
+        if i < -self.max_gap or i >= len(vals) + self.max_gap:
+            far = self.far.setdefault(origin, {})
+
+            if instance_id not in far:
+                self.size += 1
+
+            far[instance_id] = value
+            return
+
+        if i < 0:
+            # below everything we have had, but not below a checkpoint yet
+            vals[:0] = [_EMPTY] * -i
+            self.bases[origin] = instance_id
+            i = 0
+            self._near(origin)
+        elif i >= len(vals):
+            vals.extend([_EMPTY] * (i - len(vals) + 1))
+            self._near(origin)
+
+        if vals[i] is _EMPTY:
+            self.size += 1
+
+        vals[i] = value
+
+    def _near(self, origin: int):
+        """
+        Move the slots of `far` the list of `origin` has grown to into it.
+        """
+        far = self.far.get(origin)
+
+        if not far:
+            return
+
+        base, vals = self.bases[origin], self.lists[origin]
+
+        for k in [k for k in far.keys() if 0 <= k - base < len(vals)]:
+            vals[k - base] = far.pop(k)
+
+        if not len(far):
+            del self.far[origin]
+
+    def pop(self, slot: Slot, default=_EMPTY):
+        r = self.get(slot, _EMPTY)
+
+        if r is _EMPTY:
+            if default is _EMPTY:
+                raise KeyError(slot)
+            return default
+
+        vals = self.lists[slot.replica_id]
+        i = slot.instance_id - self.bases[slot.replica_id]
+
+        if 0 <= i < len(vals):
+            vals[i] = _EMPTY
+        else:
+            del self.far[slot.replica_id][slot.instance_id]
+
+        self.size -= 1
+        return r
+
+    def __delitem__(self, slot: Slot):
+        self.pop(slot)
+
+    def __len__(self):
+        return self.size
+
+    def items(self) -> Iterator[Tuple[Slot, Any]]:
+        for origin, vals in self.lists.items():
+            base = self.bases[origin]
+
+            for i, x in enumerate(vals):
+                if x is not _EMPTY:
+                    yield Slot(origin, base + i), x
+
+        for origin, far in self.far.items():
+            for instance_id, x in far.items():
+                yield Slot(origin, instance_id), x
+
+    def keys(self) -> Iterator[Slot]:
+        return (k for k, _ in self.items())
+
+    def __iter__(self):
+        return self.keys()
+
+    def values(self) -> Iterator[Any]:
+        return (v for _, v in self.items())
+
+    def purge(self, cp: CP_T) -> Dict[int, List[Any]]:
+        """
+        Drop the slots below the checkpoint `cp`.
+
+        :return: the values dropped, by origin replica
+        """
+        r = {}
+
+        for origin, slot in cp.items():
+            vals = self.lists.get(origin)
+
+            if vals is None:
+                continue
+
+            n = slot.instance_id - self.bases[origin]
+            dropped = []
+
+            if n > 0:
+                dropped = [x for x in vals[:n] if x is not _EMPTY]
+                del vals[:n]
+                self.bases[origin] = slot.instance_id
+
+            far = self.far.get(origin)
+
+            if far:
+                for k in sorted(k for k in far.keys() if k < slot.instance_id):
+                    dropped.append(far.pop(k))
+
+                if not len(far):
+                    del self.far[origin]
+
+            if len(dropped):
+                r[origin] = dropped
+                self.size -= len(dropped)
+
+        return r
+
+    def __repr__(self):
+        return f'SlotWindow({len(self)},{self.bases})'
+
+
+class InstanceStoreStats(NamedTuple):
+    total: int
+    stages: Dict[Stage, int]
+    origins: Dict[int, int]
+
+
 class InstanceStore:
     def __init__(self):
-        self.inst = {}  # type: Dict[Slot, InstanceStoreState]
-        self.cmd_to_slot = {}  # type: Dict[CommandID, Slot]
+        self.inst = SlotWindow()  # type: SlotWindow
         self.deps_cache = KeyedDepsCache()
         self.cp = CheckpointCycle()
 
+        # live counts of the instances in `inst`, kept up to date by `update` and `set_cp`
+        self.count_stages = {x: 0 for x in Stage}  # type: Dict[Stage, int]
+        self.count_origins = {}  # type: Dict[int, int]
+
+    def stats(self) -> InstanceStoreStats:
+        return InstanceStoreStats(len(self.inst), dict(self.count_stages), dict(self.count_origins))
+
     def set_cp(self, cp: Dict[int, Slot]):
-        for slot in between_checkpoints(*self.cp.cycle(cp)):
-            if slot in self.inst:
-                assert self.inst[slot].state.stage == Stage.Committed, 'Attempt to checkpoint before Commit'
-                del self.inst[slot]
+        self.cp.cycle(cp)
+        self.deps_cache.purge(self.cp.earlier)
+
+        for origin, insts in self.inst.purge(self.cp.cp_old).items():
+            self.count_stages[Stage.Committed] -= len(insts)
+            self.count_origins[origin] -= len(insts)
+
+            for inst in insts:
+                assert inst.state.stage == Stage.Committed, 'Attempt to checkpoint before Commit'
 
     def load(self, slot: Slot):
         if self.cp.earlier(slot):
@@ -123,11 +316,19 @@ class InstanceStore:
         return LoadResult(exists, r)
 
     def load_cmd_slot(self, id: CommandID) -> Optional[Tuple[Slot, InstanceStoreState]]:
-        r = self.cmd_to_slot.get(id)
-        if not r:
+        """
+        :return: the slot the command ID is bound to, if we know the command is there
+        """
+        if id.slot is None:
+            return None
+
+        slot = Slot(*id.slot)
+        exists, inst = self.load(slot)
+
+        if not exists or inst.state.command is None or inst.state.command.id.request != id.request:
             return None
         else:
-            return r, self.load(r).inst
+            return slot, inst
 
     def update(self, slot: Slot, new: InstanceStoreState):
         exists, old = self.load(slot)
@@ -159,13 +360,10 @@ class InstanceStore:
 
         self.inst[slot] = upd
 
-        if exists and old.state.command:
-            if old.state.command.id in self.cmd_to_slot:
-                del self.cmd_to_slot[old.state.command.id]
-            else:
-                logger.error(f'Command id {old.state.command} not found in self.cmd_to_slot')
-
-        if new.state.command:
-            self.cmd_to_slot[new.state.command.id] = slot
+        if exists:
+            self.count_stages[old.state.stage] -= 1
+        else:
+            self.count_origins[slot.replica_id] = self.count_origins.get(slot.replica_id, 0) + 1
+        self.count_stages[upd.state.stage] += 1
 
         return old, upd
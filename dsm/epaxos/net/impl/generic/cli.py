@@ -1,22 +1,25 @@
 import cProfile
 import logging
+import pickle
 import random
 import signal
 import time
-from collections import deque
 from setproctitle import setproctitle
-from typing import Dict, ClassVar
+from typing import Dict, ClassVar, List, Optional
 
 import sys
-from uuid import uuid4
 
-import numpy as np
 from datetime import datetime
 
-from dsm.epaxos.cmd.state import Command, Mutator
-from dsm.epaxos.net.impl.generic.client import ReplicaClient
+from dsm.epaxos.cmd.state import Command, Mutator, CommandID
+from dsm.epaxos.net.impl.generic.client import ReplicaClient, RequestRejected
+from dsm.epaxos.net.impl.generic.load import Workload, LoadGenerator, open_loop
 from dsm.epaxos.net.impl.generic.server import ReplicaServer
+from dsm.epaxos.net.shard import ShardMap
 from dsm.epaxos.replica.quorum.ev import ReplicaAddress
+from dsm.epaxos.stats.histogram import Histogram
+from dsm.epaxos.stats.profile import ProfileSwitch, SamplingProfiler
+from dsm.epaxos.stats.server import MetricsServer
 
 logger = logging.getLogger(__name__)
 
@@ -38,15 +41,21 @@ def cli_logger(level=logging.NOTSET):
     return logger
 
 
-def replica_server(cls: ClassVar[ReplicaServer], epoch: int, replica_id: int, replicas: Dict[int, ReplicaAddress]):
-    profile = True
-    if profile:
+def replica_server(cls: ClassVar[ReplicaServer], epoch: int, replica_id: int, replicas: Dict[int, ReplicaAddress],
+                   metrics_addr: str = None, profile: str = None, shards: ShardMap = ShardMap(),
+                   groups: Optional[List[int]] = None):
+    """
+    :param profile: `None` to only profile when asked to by a signal (see `ProfileSwitch`), `'sample'` to start the
+                    sampling profiler right away, or `'cprofile'` to run `cProfile` for the whole life of the replica
+                    and dump it into `<replica_id>.profile`
+    :param groups: the groups of `shards` run by this process, all of them by default
+    """
+    assert profile in (None, 'sample', 'cprofile'), profile
+
+    if profile == 'cprofile':
         pr = cProfile.Profile()
         pr.enable()
 
-    # print('Calibrating profiler')
-    # for i in range(5):
-    #     print(pr.calibrate(10000))
     def receive_signal(*args):
         raise KeyboardInterrupt()
         sys.exit()
@@ -56,18 +65,32 @@ def replica_server(cls: ClassVar[ReplicaServer], epoch: int, replica_id: int, re
 
     start_time = datetime.now()
 
-    with cls(epoch, replica_id, replicas) as server:
+    with cls(epoch, replica_id, replicas, shards, groups) as server:
+        # a process per group
+        name = f'{replica_id}' if shards.port_stride == 0 else f'{replica_id}-{server.groups[0]}'
+        switch = ProfileSwitch(server.replica.spans, SamplingProfiler(), f'replica-{name}').install()
+
         try:
-            setproctitle(f"replica-{replica_id}")
+            setproctitle(f'replica-{name}')
+
+            if profile == 'sample':
+                switch.toggle_sampler()
+
+            if metrics_addr:
+                MetricsServer(server.metrics, metrics_addr).start()
+                logger.info(f'Replica `{replica_id}` metrics at {metrics_addr}')
+
             server.run()
         except:
             logger.exception(f'Server {replica_id}')
         finally:
             tot_time = datetime.now() - start_time
             logger.info(f'{replica_id} {server.stats.total_sleep} {server.stats.total_timeouts} {server.stats.total_exec} {server.stats.total_recv} {tot_time.total_seconds()}')
-            if profile:
+            if switch.sampler.running:
+                switch.toggle_sampler()
+            if profile == 'cprofile':
                 pr.disable()
-                pr.dump_stats(f'{replica_id}.profile')
+                pr.dump_stats(f'{name}.profile')
 
 
 def replica_client(cls: ClassVar[ReplicaClient], peer_id: int, replicas: Dict[int, ReplicaAddress]):
@@ -76,41 +99,51 @@ def replica_client(cls: ClassVar[ReplicaClient], peer_id: int, replicas: Dict[in
 
         TOTAL = 20000
         EACH = 100
-        OP_CP = 1000
-        LAT_BUF = 10
 
         now = lambda: datetime.now()
         time_start = now()
 
-        latencies_mat = np.zeros(TOTAL + TOTAL // EACH)
+        latency = Histogram()
 
         with cls(peer_id, replicas) as client:
             time.sleep(0.5)
 
-            latencies = deque()
-
             for i in range(TOTAL):
                 command = Command(
-                    uuid4(),
+                    CommandID.create(),
                     Mutator(
                         'SET',
                         [random.randint(1, 10)]
                     )
                 )
-                lat, _ = client.request(command)
-                latencies.append(lat)
-                latencies_mat[i] = lat
-                # time.sleep(1.)
-                # print(lat)
+                try:
+                    lat, _ = client.request(command)
+                except RequestRejected as e:
+                    logger.error(f'Client `{peer_id}` {command} rejected: {e.reason}')
+                    continue
+
+                latency.record(lat)
 
                 if i % EACH == 0:
                     rps = (i+1) / (now() - time_start).total_seconds()
-                    # print(latencies)
-                    logger.info(f'Client `{peer_id}` DONE {i + 1} LAT_AVG={sum(latencies) / len(latencies)*1000:0.2f}ms RPS={rps:0.2f}')
+                    logger.info(f'Client `{peer_id}` DONE {i + 1} RPS={rps:0.2f} {latency}')
+            logger.info(f'Client `{peer_id}` DONE {latency}')
+
+        with open(f'latencies-{peer_id}.hist', 'wb') as f:
+            pickle.dump(latency, f)
+    except:
+        logger.exception(f'Client {peer_id}')
+
+
+def replica_load(cls: ClassVar[ReplicaClient], peer_id: int, replicas: Dict[int, ReplicaAddress], workload: Workload,
+                 duration: float, seed: int, results, shards: ShardMap = ShardMap()):
+    try:
+        cli_logger()
 
-                if len(latencies) > LAT_BUF:
-                    latencies.popleft()
-            logger.info(f'Client `{peer_id}` DONE')
-        np.save(f'latencies-{peer_id}.npy', latencies_mat)
+        with cls(peer_id, replicas, shards) as client:
+            point = open_loop(client, LoadGenerator(workload, seed), duration)
+            logger.info(f'Client `{peer_id}` {point}')
+            results.put(point)
     except:
         logger.exception(f'Client {peer_id}')
+        results.put(None)
@@ -1,81 +1,271 @@
 import random
-from datetime import datetime, timedelta
-from typing import Dict
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
 from dsm.epaxos.cmd.state import Command
-from dsm.epaxos.net.impl.generic.server import logger
+from dsm.epaxos.net.packet import Packet, Payload, ClientRequest, ClientResponse, ClientRejected, PingRequest, \
+    PongResponse, ClientStarted
+from dsm.epaxos.net.shard import ShardMap
 from dsm.epaxos.replica.quorum.ev import ReplicaAddress
 
 
+class ReplicaStats:
+    def __init__(self):
+        self.srtt = None  # type: Optional[float]
+        self.rttvar = 0.
+        self.errors = 0
+        self.outstanding = 0
+        self.down_until = 0.
+        self.last_done = None  # type: Optional[float]
+
+
+class ReplicaSelector:
+    """
+    Picks the replica a client sends a request to.
+
+    The response times of every replica are smoothed as TCP does with its RTT (RFC 6298), and a request is resent after
+    `srtt + 4 * rttvar`. While the replica keeps answering other requests it is only slow, and the request is resent
+    to it again. Otherwise it is an error and the request fails over to another replica. Once the client has the ID
+    bound to the slot of the request (`ClientStarted`), that replica finds the slot from the ID. Before that, or if it
+    has not seen the PreAccept yet, it starts the request again, and the executors skip the second copy (see
+    `ClientsActor.request`), so an early failover costs a slot but never a second execution. An error also
+    doubles the timeout of the replica and keeps it from being picked for as long, so that a dead replica is left
+    after a single timeout and is then retried with an exponential backoff. The timeouts are capped by `max_timeout`,
+    as the response times of a replica vary a lot while another one is being recovered. Every resend of a request
+    doubles its own timeout on top of that, so that an overloaded quorum is not overloaded any further.
+
+    Among the other replicas the one with the lowest `srtt * (outstanding + 1)` is picked, which spreads the load of
+    a client over the replicas with a similar RTT.
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+
+    def __init__(
+        self,
+        replicas: List[int],
+        clock=time.monotonic,
+        rng: Optional[random.Random] = None,
+        initial_rtt: float = 0.1,
+        min_timeout: float = 0.05,
+        max_timeout: float = 0.3,
+        max_errors: int = 10,
+        max_attempts: int = 4,
+    ):
+        self.stats = {k: ReplicaStats() for k in replicas}  # type: Dict[int, ReplicaStats]
+        self.clock = clock
+        self.random = rng if rng is not None else random.Random()
+        self.initial_rtt = initial_rtt
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.max_errors = max_errors
+        self.max_attempts = max_attempts
+
+    def timeout(self, replica_id: int, attempt: int = 0) -> float:
+        """
+        :param attempt: times the request has been resent
+        """
+        x = self.stats[replica_id]
+        rto = 2 * self.initial_rtt if x.srtt is None else x.srtt + 4 * x.rttvar
+        rto = min(max(rto, self.min_timeout) * (1 << x.errors), self.max_timeout)
+        return rto * (1 << min(attempt, self.max_attempts))
+
+    def score(self, replica_id: int) -> float:
+        x = self.stats[replica_id]
+        srtt = self.initial_rtt if x.srtt is None else x.srtt
+        return srtt * (x.outstanding + 1) * (1 << x.errors)
+
+    def best(self) -> int:
+        now = self.clock()
+        up = [k for k, x in self.stats.items() if x.down_until <= now] or list(self.stats.keys())
+        scores = {k: self.score(k) for k in up}
+        best = min(scores.values())
+        return self.random.choice(sorted(k for k, v in scores.items() if v == best))
+
+    def alive(self, replica_id: int, attempt: int = 0) -> bool:
+        x = self.stats[replica_id]
+        return x.last_done is not None and self.clock() - x.last_done < self.timeout(replica_id, attempt)
+
+    def sent(self, replica_id: int):
+        self.stats[replica_id].outstanding += 1
+
+    def done(self, replica_id: int, seconds: float):
+        x = self.stats[replica_id]
+        x.outstanding = max(0, x.outstanding - 1)
+
+        if x.srtt is None:
+            x.srtt = seconds
+            x.rttvar = seconds / 2
+        else:
+            x.rttvar = (1 - self.BETA) * x.rttvar + self.BETA * abs(x.srtt - seconds)
+            x.srtt = (1 - self.ALPHA) * x.srtt + self.ALPHA * seconds
+
+        x.errors = 0
+        x.down_until = 0.
+        x.last_done = self.clock()
+
+    def error(self, replica_id: int):
+        x = self.stats[replica_id]
+        x.outstanding = max(0, x.outstanding - 1)
+
+        # the requests sent at about the same time time out together, and only back off once
+        if x.down_until <= self.clock():
+            x.errors = min(x.errors + 1, self.max_errors)
+            x.down_until = self.clock() + self.timeout(replica_id)
+
+    def pong(self, replica_id: int, seconds: float):
+        """
+        A ping only tells that the replica is alive, and gives an RTT to start with - the response times include the
+        time the replicas need to agree on a command.
+        """
+        x = self.stats[replica_id]
+
+        if x.srtt is None:
+            x.srtt = seconds
+            x.rttvar = seconds / 2
+
+        x.errors = 0
+        x.down_until = 0.
+
+
+class RequestRejected(Exception):
+    def __init__(self, command: Command, reason: str):
+        super().__init__(command, reason)
+        self.command = command
+        self.reason = reason
+
+
 class ReplicaClient:
     def __init__(
         self,
         peer_id: int,
         peer_addr: Dict[int, ReplicaAddress],
+        shards: ShardMap = ShardMap(),
     ):
         self.peer_id = peer_id
         self.peer_addr = peer_addr
+        self.shards = shards
 
         self.leader_id = None
-        self.blacklisted = []
+        self.scores = ReplicaSelector(list(self.peer_addr.keys()))
+
+        self.ping_id = 0
+        self.pings = {}  # type: Dict[int, Tuple[int, float]]
 
     def connect(self, replica_id=None):
         if replica_id is None:
-            if len(self.blacklisted) == len(list(self.peer_addr.keys())):
-                self.blacklisted = []
-
-            while replica_id is None or replica_id in self.blacklisted:
-                replica_id = random.choice(list(self.peer_addr.keys()))
+            replica_id = self.scores.best()
 
         self.leader_id = replica_id
 
-
         # logger.info(f'Client `{self.peer_id}` -> {self.leader_id} Connect')
 
     def poll(self, max_wait) -> bool:
         raise NotImplementedError()
 
-    def send(self, command: Command):
+    def send_packet(self, replica_id: int, payload: Payload, group: int = 0):
         raise NotImplementedError()
 
-    def recv(self):
+    def send(self, command: Command):
+        # a command spanning several groups is sent to the first one, which rejects it
+        group = self.shards.route(command)
+        self.send_packet(self.leader_id, ClientRequest(command), group or 0)
+
+    def recv(self) -> Packet:
         raise NotImplementedError()
 
-    def request(self, command: Command, timeout=10, timeout_resend=0.3, retries_max=50):
-        # assert self.leader_id is not None
+    def ping(self):
+        """
+        Ping every replica; the replies are taken by `received`.
+        """
+        self.ping_id += 1
+
+        for replica_id in self.peer_addr.keys():
+            self.pings[replica_id] = (self.ping_id, self.scores.clock())
+            self.send_packet(replica_id, PingRequest(self.ping_id))
+
+    def received(self, rep: Packet) -> bool:
+        """
+        :return: True if the packet was a reply to `ping`
+        """
+        if isinstance(rep.payload, PongResponse):
+            ping = self.pings.get(rep.origin)
+
+            if ping is not None and ping[0] == rep.payload.id:
+                del self.pings[rep.origin]
+                self.scores.pong(rep.origin, self.scores.clock() - ping[1])
+            return True
+        return False
+
+    def request(self, command: Command, timeout=10, failover=1):
+        """
+        Resend the command until a reply arrives, and move to the next best replica after `failover` timeouts of
+        a replica that has not answered anything meanwhile. Once a replica has started the command, it is resent with
+        the ID bound to its slot (`ClientStarted`).
+
+        Late replies to the earlier commands are skipped.
 
+        :raises RequestRejected: if a replica would not start the command
+        """
         start = datetime.now()
+        clock = self.scores.clock
 
-        self.connect()
+        # the leader the client has chosen for the command, if any
+        self.connect(command.id.leader or None)
+
+        sent_at = {}  # type: Dict[int, float]
+        attempt = 0
+        errors = 0
 
         while True:
-            # self.connect()
             self.send(command)
-            retries = retries_max
-
-            while True:
-                poll_result = self.poll(timeout_resend)
-                retries -= 1
-
-                if poll_result:
-                    rtn = self.recv()
-                    # print(f'{self.peer_id} reply {rtn}')
-                    # logger.info(f'Client `{self.peer_id}` -> {self.replica_id} Send={command} Recv={rtn.payload}')
-
-                    end = datetime.now()
-                    latency = (end - start).total_seconds()
-                    return latency, rtn
-                elif retries <= 0:
-                    break
-                else:
-                    self.send(command)
-
-            self.blacklisted = [self.leader_id]
-
-            # logger.info(f'Client `{self.peer_id}` -> {self.leader_id} RetrySend={command} BL={self.blacklisted}')
-            # self.blacklisted = [self._replica_id]
-            # logger.info(f'{self.peer_id} Blacklisted {self._replica_id}')
-            self.connect()
+            sent_at[self.leader_id] = clock()
+            self.scores.sent(self.leader_id)
+
+            deadline = sent_at[self.leader_id] + self.scores.timeout(self.leader_id, attempt)
+
+            while self.poll(max(deadline - clock(), 0.)):
+                rtn = self.recv()
+
+                if self.received(rtn):
+                    continue
+
+                # print(f'{self.peer_id} reply {rtn}')
+                # logger.info(f'Client `{self.peer_id}` -> {self.replica_id} Send={command} Recv={rtn.payload}')
+
+                if isinstance(rtn.payload, ClientRejected):
+                    if rtn.payload.command.id.request == command.id.request:
+                        raise RequestRejected(command, rtn.payload.reason)
+                    continue
+                elif isinstance(rtn.payload, ClientStarted):
+                    if rtn.payload.command.id.request == command.id.request:
+                        # resent with the bound ID, which any replica finds the slot of
+                        command = rtn.payload.command
+                    continue
+                elif not isinstance(rtn.payload, ClientResponse) or rtn.payload.command is None or \
+                        rtn.payload.command.id.request != command.id.request:
+                    continue
+
+                if rtn.origin in sent_at:
+                    self.scores.done(rtn.origin, clock() - sent_at[rtn.origin])
+
+                end = datetime.now()
+                latency = (end - start).total_seconds()
+                return latency, rtn
+
+            if self.scores.alive(self.leader_id, attempt):
+                attempt += 1
+                continue
+
+            self.scores.error(self.leader_id)
+            attempt += 1
+            errors += 1
+
+            if errors >= failover:
+                # logger.info(f'Client `{self.peer_id}` -> {self.leader_id} RetrySend={command}')
+                errors = 0
+                self.connect()
 
     def close(self):
         pass
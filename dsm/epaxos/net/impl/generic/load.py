@@ -0,0 +1,218 @@
+import bisect
+import random
+from datetime import datetime
+from typing import NamedTuple, List, Dict, Iterable, Tuple
+
+from dsm.epaxos.cmd.state import Command, Mutator, CommandIDAllocator, CommandID
+from dsm.epaxos.net.impl.generic.client import ReplicaClient
+from dsm.epaxos.net.packet import ClientResponse, ClientRejected, ClientStarted
+from dsm.epaxos.stats.histogram import Histogram
+
+ARRIVALS = ('poisson', 'constant')
+DISTRIBUTIONS = ('uniform', 'zipf', 'hotspot')
+
+
+class Workload(NamedTuple):
+    rate: float
+    arrival: str = 'poisson'
+    keys: str = 'uniform'
+    keyspace: int = 1000
+    keys_per_command: int = 1
+    # share of the commands that draw their keys from the shared keyspace, the rest never interfere with anything
+    conflict: float = 1.
+    zipf_s: float = 0.99
+    hot_keys: float = 0.01
+    hot_share: float = 0.9
+
+
+class LoadPoint(NamedTuple):
+    rate: float
+    sent: int
+    duration: float
+    latency: Histogram
+
+    @property
+    def done(self):
+        return self.latency.count
+
+    @property
+    def throughput(self):
+        return self.done / self.duration
+
+    @classmethod
+    def merge(cls, points: List['LoadPoint']):
+        return cls(
+            sum(x.rate for x in points),
+            sum(x.sent for x in points),
+            max(x.duration for x in points),
+            Histogram.merged(x.latency for x in points),
+        )
+
+    def __str__(self):
+        return f'RATE={self.rate:0.0f} SENT={self.sent} DONE={self.done} RPS={self.throughput:0.2f} {self.latency}'
+
+
+class LoadGenerator:
+    """
+    Commands of a `Workload` together with their (open-loop) arrival times.
+
+    A command interferes with others only through its keys: with the probability of `Workload.conflict` the keys are
+    drawn from the shared keyspace, otherwise every key is one that is never used again.
+    """
+
+    def __init__(self, workload: Workload, seed: int = 0, clock=datetime.now):
+        assert workload.arrival in ARRIVALS, workload.arrival
+        assert workload.keys in DISTRIBUTIONS, workload.keys
+        assert workload.keys_per_command <= workload.keyspace, workload
+
+        self.workload = workload
+        self.random = random.Random(seed)
+        self.ids = CommandIDAllocator(clock, self.random)
+        # private keys of different generators don't overlap unless we are very unlucky
+        self.private_key = workload.keyspace + (self.random.getrandbits(31) << 32)
+
+        self.zipf_cdf = None  # type: List[float]
+
+        if workload.keys == 'zipf':
+            weights = [1. / (i ** workload.zipf_s) for i in range(1, workload.keyspace + 1)]
+            total = sum(weights)
+            acc = 0.
+            self.zipf_cdf = []
+            for w in weights:
+                acc += w / total
+                self.zipf_cdf.append(acc)
+
+    def interval(self) -> float:
+        if self.workload.arrival == 'poisson':
+            return self.random.expovariate(self.workload.rate)
+        else:
+            return 1. / self.workload.rate
+
+    def key(self) -> int:
+        w = self.workload
+
+        if w.keys == 'uniform':
+            return self.random.randrange(w.keyspace)
+        elif w.keys == 'zipf':
+            return min(bisect.bisect_left(self.zipf_cdf, self.random.random()), w.keyspace - 1)
+        else:
+            hot = max(1, int(w.keyspace * w.hot_keys))
+
+            if self.random.random() < w.hot_share or hot == w.keyspace:
+                return self.random.randrange(hot)
+            else:
+                return self.random.randrange(hot, w.keyspace)
+
+    def keys(self) -> List[int]:
+        if self.random.random() < self.workload.conflict:
+            keys = set()
+            while len(keys) < self.workload.keys_per_command:
+                keys.add(self.key())
+            return sorted(keys)
+        else:
+            keys = list(range(self.private_key, self.private_key + self.workload.keys_per_command))
+            self.private_key += self.workload.keys_per_command
+            return keys
+
+    def command(self) -> Command:
+        return Command(
+            self.ids(),
+            Mutator('SET', self.keys())
+        )
+
+    def schedule(self, duration: float) -> Iterable[Tuple[float, Command]]:
+        at = self.interval()
+        while at < duration:
+            yield at, self.command()
+            at += self.interval()
+
+
+def open_loop(client: ReplicaClient, gen: LoadGenerator, duration: float, drain=2., ping_every=1.,
+              recv_batch=64) -> LoadPoint:
+    """
+    Send the commands of `gen` at their arrival times regardless of the replies, and wait at most `drain` seconds for
+    the outstanding ones after the last one was sent.
+
+    The latency of a command is measured from its scheduled arrival, so that a client falling behind its schedule
+    shows up in the latencies instead of hiding them (coordinated omission). For the same reason at most `recv_batch`
+    replies are read before looking at the schedule again.
+
+    Every command goes to the best replica of `client.scores` and is resent to the next best one after a timeout.
+    """
+    now = lambda: (datetime.now() - start).total_seconds()
+
+    start = datetime.now()
+
+    # by `CommandID.request`
+    pending = {}  # type: Dict[CommandID, Tuple[float, float, Command, int, int]]
+    latency = Histogram()
+    sent = 0
+
+    def send(command, t, at=None):
+        # the leader chosen by the client, unless it is the one of the slot the command was started in
+        client.connect(command.id.leader if command.id.slot is None and command.id.leader else None)
+        client.send(command)
+        client.scores.sent(client.leader_id)
+
+        at = at if at is not None else t
+        started, _, _, _, attempt = pending.get(command.id.request, (at, t, command, 0, -1))
+        pending[command.id.request] = (started, t, command, client.leader_id, attempt + 1)
+
+    schedule = iter(gen.schedule(duration))
+    next_cmd = next(schedule, None)
+    next_ping = 0.
+
+    while next_cmd is not None or (len(pending) and now() < duration + drain):
+        t = now()
+
+        if ping_every and t >= next_ping:
+            client.ping()
+            next_ping = t + ping_every
+
+        while next_cmd is not None and next_cmd[0] <= t:
+            at, command = next_cmd
+            send(command, t, at)
+            sent += 1
+            next_cmd = next(schedule, None)
+
+        wait = next_cmd[0] - t if next_cmd is not None else drain
+
+        for cid, (started, last_sent, command, replica_id, attempt) in list(pending.items()):
+            if t - last_sent > client.scores.timeout(replica_id, attempt):
+                if client.scores.alive(replica_id, attempt):
+                    client.connect(replica_id)
+                    client.send(command)
+                    pending[cid] = (started, t, command, replica_id, attempt + 1)
+                else:
+                    client.scores.error(replica_id)
+                    send(command, t)
+
+            _, last_sent, _, replica_id, attempt = pending[cid]
+            wait = min(wait, last_sent + client.scores.timeout(replica_id, attempt) - t)
+
+        wait = max(wait, 0.)
+
+        received = 0
+
+        while received < recv_batch and client.poll(wait):
+            rep = client.recv()
+            wait = 0.
+            received += 1
+
+            if client.received(rep):
+                pass
+            elif isinstance(rep.payload, ClientResponse) and rep.payload.command:
+                x = pending.pop(rep.payload.command.id.request, None)
+
+                if x is not None:
+                    latency.record(now() - x[0])
+                    client.scores.done(rep.origin, now() - x[1])
+            elif isinstance(rep.payload, ClientRejected):
+                pending.pop(rep.payload.command.id.request, None)
+            elif isinstance(rep.payload, ClientStarted):
+                x = pending.get(rep.payload.command.id.request)
+
+                if x is not None:
+                    pending[rep.payload.command.id.request] = x[:2] + (rep.payload.command,) + x[3:]
+
+    return LoadPoint(gen.workload.rate, sent, duration, latency)
@@ -0,0 +1,146 @@
+import mmap
+import os
+import select
+import struct
+import time
+from typing import Optional
+
+# bytes written, bytes read, records dropped; every counter is only ever written by one of the sides
+_HEADER = struct.Struct('QQQ')
+_HEAD = 0
+_TAIL = 1
+_DROPPED = 2
+
+_LEN = struct.Struct('I')
+_WRAP = 0xffffffff
+
+
+def _align(x: int) -> int:
+    return (x + 3) & ~3
+
+
+class Ring:
+    """
+    A single-producer, single-consumer queue of byte strings in an anonymous shared mapping, so it must be created
+    before the two processes fork.
+
+    A record is its length followed by the data, and never wraps around the end of the buffer: when it does not fit,
+    a wrap marker is left and the record starts over at the beginning. The producer publishes a record by moving the
+    head after writing it, the consumer frees it by moving the tail after reading it. A push to a full ring is dropped,
+    as the datagrams it carries may be lost anyway.
+
+    A pipe wakes the consumer up: the producer `notify`s it after a batch of pushes, and the consumer `wait`s on it.
+    """
+
+    def __init__(self, size: int = 1 << 22):
+        assert size % 4 == 0, size
+
+        self.size = size
+        self.buf = mmap.mmap(-1, _HEADER.size + size)
+        # `struct.pack_into` zero-fills the memory before writing to it, which the other side could see
+        self.counters = memoryview(self.buf)[:_HEADER.size].cast('Q')
+
+        self.rfd, self.wfd = os.pipe()
+        os.set_blocking(self.rfd, False)
+        os.set_blocking(self.wfd, False)
+
+    def _get(self, at: int) -> int:
+        return self.counters[at]
+
+    def _set(self, at: int, x: int):
+        self.counters[at] = x
+
+    @property
+    def dropped(self) -> int:
+        return self._get(_DROPPED)
+
+    def empty(self) -> bool:
+        return self._get(_HEAD) == self._get(_TAIL)
+
+    def push(self, data: bytes) -> bool:
+        head = self._get(_HEAD)
+        tail = self._get(_TAIL)
+
+        n = _align(_LEN.size + len(data))
+        pos = head % self.size
+        pad = self.size - pos if pos + n > self.size else 0
+
+        if head + pad + n - tail > self.size:
+            self._set(_DROPPED, self.dropped + 1)
+            return False
+
+        if pad:
+            _LEN.pack_into(self.buf, _HEADER.size + pos, _WRAP)
+            head += pad
+            pos = 0
+
+        at = _HEADER.size + pos
+        _LEN.pack_into(self.buf, at, len(data))
+        self.buf[at + _LEN.size:at + _LEN.size + len(data)] = data
+
+        self._set(_HEAD, head + n)
+        return True
+
+    def pop(self) -> Optional[bytes]:
+        tail = self._get(_TAIL)
+
+        if tail == self._get(_HEAD):
+            return None
+
+        pos = tail % self.size
+        size, = _LEN.unpack_from(self.buf, _HEADER.size + pos)
+
+        if size == _WRAP:
+            tail += self.size - pos
+            pos = 0
+            size, = _LEN.unpack_from(self.buf, _HEADER.size)
+
+        at = _HEADER.size + pos + _LEN.size
+        data = self.buf[at:at + size]
+
+        self._set(_TAIL, tail + _align(_LEN.size + size))
+        return data
+
+    def notify(self):
+        try:
+            os.write(self.wfd, b'\0')
+        except BlockingIOError:
+            # the pipe is full of notifications the consumer has not seen yet
+            pass
+
+    def drain(self):
+        try:
+            while len(os.read(self.rfd, 4096)):
+                pass
+        except BlockingIOError:
+            pass
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        """
+        :return: `True` if there are records to `pop`
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        while True:
+            # a notification after this is seen by `select`, a record pushed before it by `empty`
+            self.drain()
+
+            if not self.empty():
+                return True
+
+            left = max(deadline - time.monotonic(), 0.) if deadline is not None else None
+
+            r, _, _ = select.select([self.rfd], [], [], left)
+
+            # a notification may be left over from records that were popped already
+            if not len(r):
+                return not self.empty()
+
+    def close(self):
+        if self.buf.closed:
+            return
+
+        os.close(self.rfd)
+        os.close(self.wfd)
+        self.counters.release()
+        self.buf.close()
@@ -2,12 +2,15 @@ import contextlib
 import logging
 from datetime import datetime, timedelta
 from time import sleep
-from typing import Dict, Iterable, NamedTuple
+from typing import Dict, Iterable, NamedTuple, List, Optional
 
-from dsm.epaxos.net.packet import Packet
+from dsm.epaxos.net.packet import Packet, ClientRequest, ClientRejected
+from dsm.epaxos.net.shard import ShardMap
 from dsm.epaxos.replica.inst import Replica
+from dsm.epaxos.replica.net.ev import Send
 from dsm.epaxos.replica.net.main import NetActor
 from dsm.epaxos.replica.quorum.ev import Configuration, Quorum, ReplicaAddress
+from dsm.epaxos.stats.metrics import Registries
 
 logger = logging.getLogger('cli')
 
@@ -37,29 +40,88 @@ class Stats:
 
 
 class ReplicaServer:
+    """
+    Runs the replicas of `groups` (see `ShardMap`) behind the transport of one process: every packet is handed to
+    the replica of its group, and a client request to the replica of the group owning its keys.
+
+    The first group is the one of `quorum`, `net_actor` and `replica`.
+    """
+
     def __init__(
         self,
         epoch: int,
         replica_id: int,
         peer_addr: Dict[int, ReplicaAddress],
+        shards: ShardMap = ShardMap(),
+        groups: Optional[List[int]] = None,
+        log_dir: Optional[str] = '.',
     ):
         self.peer_addr = peer_addr
-        self.quorum = Quorum(
-            [x for x in peer_addr.keys() if x != replica_id],
-            replica_id,
-            epoch,
-            peer_addr
-        )
+        self.shards = shards
+        self.groups = list(groups) if groups is not None else list(range(shards.groups))
+
+        assert len(self.groups) == 1 or shards.port_stride == 0, (self.groups, shards)
+
+        self.quorums = {
+            g: Quorum(
+                [x for x in peer_addr.keys() if x != replica_id],
+                replica_id,
+                epoch,
+                shards.addresses(peer_addr, g)
+            )
+            for g in self.groups
+        }  # type: Dict[int, Quorum]
+        self.quorum = self.quorums[self.groups[0]]
 
         self.config = Configuration()
 
-        self.net_actor = self.build_net_actor()
-        self.replica = Replica(self.quorum, self.config, self.net_actor)
+        self.net_actors = {g: self.build_net_actor(g) for g in self.groups}  # type: Dict[int, NetActor]
+        self.replicas = {
+            g: Replica(self.quorums[g], self.config, self.net_actors[g], log_dir=log_dir) for g in self.groups
+        }  # type: Dict[int, Replica]
+        self.net_actor = self.net_actors[self.groups[0]]
+        self.replica = self.replicas[self.groups[0]]
+        self.metrics = Registries([x.metrics for x in self.replicas.values()])
         self.stats = Stats()
 
-    def build_net_actor(self) -> NetActor:
+        metrics = self.replica.metrics
+        self.m_ticks = metrics.counter('ticks', 'Ticks of the main loop')
+        self.m_sleep = metrics.counter('loop_sleep_seconds', 'Time spent polling the sockets')
+        self.m_recv = metrics.counter('loop_recv_seconds', 'Time spent receiving and handling packets')
+        self.m_rejected = metrics.counter('shard_rejected', 'Client requests of keys not served by this process',
+                                          ('reason',))
+
+    def build_net_actor(self, group: int) -> NetActor:
         raise NotImplementedError()
 
+    def dispatch(self, x: Packet):
+        group = x.group
+
+        if isinstance(x.payload, ClientRequest):
+            group = self.shards.route(x.payload.command)
+
+            if group is None:
+                self.reject(x, 'CROSS_SHARD')
+                return
+            elif group not in self.replicas:
+                # the group runs in another process, which only a client knowing the `ShardMap` may reach
+                self.reject(x, 'WRONG_GROUP')
+                return
+        elif group not in self.replicas:
+            logger.error(f'Dropping packet {x} of group {group}')
+            return
+
+        self.replicas[group].packet(x._replace(group=group))
+
+    def reject(self, x: Packet, reason: str):
+        self.m_rejected.labels(reason).inc()
+        net_actor = self.net_actors.get(x.group, self.net_actor)
+        net_actor.send_counted(Send(x.origin, ClientRejected(x.payload.command, reason)))
+
+    def flush(self):
+        for x in self.net_actors.values():
+            x.flush()
+
     def poll(self, min_wait) -> bool:
         """
         Poll the clients and servers, then return `True` if we are ready
@@ -110,6 +172,7 @@ class ReplicaServer:
 
         def upd_recv(x):
             self.stats.total_recv += x.total_seconds()
+            self.m_recv.inc(x.total_seconds())
 
         while True:
             loop_start_time = datetime.now()
@@ -127,6 +190,7 @@ class ReplicaServer:
 
             loop_poll_time = datetime.now()
             self.stats.total_sleep += (loop_poll_time - loop_start_time).total_seconds()
+            self.m_sleep.inc((loop_poll_time - loop_start_time).total_seconds())
 
             # print(self.state.ticks)
 
@@ -138,10 +202,13 @@ class ReplicaServer:
 
             if loop_poll_time > next_tick_time:
                 self.stats.ticks += 1
-                self.replica.tick(self.stats.ticks)
+                self.m_ticks.inc()
+                for replica in self.replicas.values():
+                    replica.tick(self.stats.ticks)
                 next_tick_time = next_tick_time + td_tick
 
 
+            self.flush()
             pkts_sent += self.send()
 
             # if (datetime.now() - start_time).total_seconds() > 20 and self.quorum.replica_id == 5 and not has_slept:
@@ -158,7 +225,7 @@ class ReplicaServer:
                     for i, x in enumerate(self.recv()):
 
                         # with timeit() as tmr2:
-                        self.replica.packet(x)
+                        self.dispatch(x)
                             # if tmr2.passed().total_seconds() > 1:
                             #     logger.debug(f'{self.quorum.replica_id} {tmr2.passed()} HW {x}')
                         rcvd_a += 1
@@ -177,6 +244,7 @@ class ReplicaServer:
             else:
                 pass
 
+            self.flush()
             pkts_sent += self.send()
 
     def run(self):
@@ -0,0 +1,227 @@
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple, Optional, Callable
+
+from dsm.epaxos.cmd.state import Command, Mutator, CommandIDAllocator, CommandID
+from dsm.epaxos.inst.state import Stage, Slot
+from dsm.epaxos.net.impl.generic.client import ReplicaSelector
+from dsm.epaxos.net.impl.generic.load import LoadGenerator, LoadPoint
+from dsm.epaxos.net.impl.sim.network import SimNetwork, LinkConfig
+from dsm.epaxos.net.impl.sim.server import SimNetActor
+from dsm.epaxos.net.packet import Packet, ClientRequest, ClientResponse, ClientRejected, ClientStarted
+from dsm.epaxos.replica.inst import Replica
+from dsm.epaxos.replica.quorum.ev import Quorum, Configuration, ReplicaAddress
+from dsm.epaxos.stats.histogram import Histogram
+from dsm.epaxos.stats.trace import Level
+
+EPOCH = datetime(2000, 1, 1)
+
+
+class SimCluster:
+    """
+    Several `Replica`s in one process, connected by a `SimNetwork` and driven by a virtual clock: one `step` delivers
+    the packets due before the next tick and then ticks every live replica.
+
+    Clients are simulated too - a request goes to the leader in its ID, or to the best replica of a `ReplicaSelector`
+    shared by the clients, and is resent to the next best one after a timeout until a `ClientResponse` or
+    a `ClientRejected` arrives, with the ID bound by a `ClientStarted` if one has. Time spent inside the replicas is measured with `time.process_time`, so `cpu` is the CPU
+    cost of the protocol alone.
+    """
+
+    def __init__(
+        self,
+        size: int = 5,
+        seed: int = 0,
+        link: LinkConfig = LinkConfig(),
+        config: Configuration = Configuration(),
+        serialize: bool = False,
+        log_dir: Optional[str] = None,
+        trace_level: Level = Level.INFO,
+    ):
+        # the replicas draw their timeouts from the global generator
+        random.seed(seed)
+
+        self.random = random.Random(seed)
+        self.network = SimNetwork(seed, link, serialize)
+        self.config = config
+
+        ids = list(range(1, size + 1))
+        addrs = {i: ReplicaAddress(f'sim://{i}', f'sim://{i}') for i in ids}
+
+        self.replicas = {}  # type: Dict[int, Replica]
+
+        for i in ids:
+            quorum = Quorum([x for x in ids if x != i], i, 0, addrs)
+            self.replicas[i] = Replica(quorum, config, SimNetActor(quorum, self.network), clock=self.clock,
+                                       log_dir=log_dir, trace_level=trace_level)
+
+        self.ticks = 0
+        self.cpu = 0.
+
+        self.ids = CommandIDAllocator(self.clock, self.random)
+        self.selector = ReplicaSelector(ids, lambda: self.now, self.random)
+
+        # by `CommandID.request`
+        self.pending = {}  # type: Dict[CommandID, Tuple[int, Command, int, float, int]]
+        self.latencies = {}  # type: Dict[CommandID, float]
+        self.rejected = {}  # type: Dict[CommandID, str]
+        self.sent_at = {}  # type: Dict[CommandID, float]
+        self.latency = Histogram()
+
+    def clock(self):
+        return EPOCH + timedelta(seconds=self.network.now)
+
+    @property
+    def now(self):
+        return self.network.now
+
+    @property
+    def alive(self) -> List[int]:
+        return [k for k in self.replicas.keys() if k not in self.network.down]
+
+    def command(self, keys: List[int], op='SET', leader: int = 0) -> Command:
+        return Command(self.ids(leader), Mutator(op, keys))
+
+    def _send(self, client_id: int, command: Command, replica_id: int, attempt: int = 0, resend: bool = False):
+        self.pending[command.id.request] = (client_id, command, replica_id, self.now, attempt)
+        if not resend:
+            self.selector.sent(replica_id)
+        self.network.send(Packet(client_id, replica_id, ClientRequest.__name__, ClientRequest(command)))
+
+    def request(self, command: Command, client_id: int = 100, replica_id: Optional[int] = None):
+        if replica_id is None:
+            replica_id = command.id.leader or self.selector.best()
+
+        self.sent_at[command.id.request] = self.now
+        self._send(client_id, command, replica_id)
+
+    def kill(self, replica_id: int):
+        self.network.down.add(replica_id)
+
+    def _resend(self):
+        for cid, (client_id, command, replica_id, last_sent, attempt) in list(self.pending.items()):
+            if self.now - last_sent > self.selector.timeout(replica_id, attempt):
+                if self.selector.alive(replica_id, attempt):
+                    self._send(client_id, command, replica_id, attempt + 1, resend=True)
+                else:
+                    self.selector.error(replica_id)
+                    self._send(client_id, command, self.selector.best(), attempt + 1)
+
+    def _client(self, packet: Packet):
+        if isinstance(packet.payload, ClientResponse) and packet.payload.command:
+            cid = packet.payload.command.id.request
+
+            if cid in self.pending:
+                self.selector.done(packet.origin, self.now - self.pending.pop(cid)[3])
+                self.latencies[cid] = self.now - self.sent_at.pop(cid)
+                self.latency.record(self.latencies[cid])
+        elif isinstance(packet.payload, ClientRejected):
+            cid = packet.payload.command.id.request
+
+            if cid in self.pending:
+                del self.pending[cid]
+                del self.sent_at[cid]
+                self.rejected[cid] = packet.payload.reason
+        elif isinstance(packet.payload, ClientStarted):
+            cid = packet.payload.command.id.request
+
+            if cid in self.pending:
+                # resent with the bound ID from now on
+                self.pending[cid] = self.pending[cid][:1] + (packet.payload.command,) + self.pending[cid][2:]
+
+    def _deliver(self, until: float):
+        for packet in self.network.deliver(until):
+            if packet.destination in self.replicas:
+                s = time.process_time()
+                self.replicas[packet.destination].packet(packet)
+                self.cpu += time.process_time() - s
+            else:
+                self._client(packet)
+
+    def step(self):
+        self._deliver((self.ticks + 1) * self.config.seconds_per_tick)
+
+        self.ticks += 1
+
+        for replica_id in self.alive:
+            s = time.process_time()
+            self.replicas[replica_id].tick(self.ticks)
+            self.cpu += time.process_time() - s
+
+        self._resend()
+
+    def advance(self, until: float):
+        while (self.ticks + 1) * self.config.seconds_per_tick <= until:
+            self.step()
+
+        self._deliver(until)
+
+    def run(self, ticks: int):
+        for _ in range(ticks):
+            self.step()
+
+    def run_until(self, fn: Callable[[], bool], max_ticks: int) -> bool:
+        for _ in range(max_ticks):
+            if fn():
+                return True
+            self.step()
+        return fn()
+
+    def load(self, gen: LoadGenerator, duration: float, drain: float = 2.) -> LoadPoint:
+        """
+        Issue the commands of `gen` at their arrival times on the virtual clock (open-loop).
+        """
+        start = self.now
+        sent = []
+
+        for at, command in gen.schedule(duration):
+            self.advance(start + at)
+            self.request(command, client_id=100 + len(sent) % 10)
+            sent.append(command.id.request)
+
+        self.run_until(lambda: len(self.pending) == 0 or self.now > start + duration + drain, 1 << 30)
+
+        latency = Histogram()
+
+        for x in sent:
+            if x in self.latencies:
+                latency.record(self.latencies[x])
+
+        return LoadPoint(gen.workload.rate, len(sent), duration, latency)
+
+    def diverged(self) -> Dict[Slot, set]:
+        """
+        :return: slots that are committed with different attributes on different live replicas
+        """
+        seen = defaultdict(set)
+
+        for replica_id in self.alive:
+            for slot, inst in self.replicas[replica_id].store.inst.items():
+                if Stage.Committed <= inst.state.stage < Stage.Purged:
+                    seen[slot].add(repr((inst.state.command, inst.state.seq, sorted(inst.state.deps))))
+
+        return {k: v for k, v in seen.items() if len(v) > 1}
+
+    def phases(self) -> Dict[str, Histogram]:
+        """
+        :return: per-phase latencies merged over all replicas
+        """
+        return {
+            'fast': Histogram.merged(x.main.leader.lat_fast for x in self.replicas.values()),
+            'slow': Histogram.merged(x.main.leader.lat_slow for x in self.replicas.values()),
+            'execute': Histogram.merged(x.main.executor.lat_execute for x in self.replicas.values()),
+        }
+
+    def report(self):
+        done = self.latency.count
+        cpu_per = self.cpu / done * 1e6 if done else 0.
+        pkts = sum(self.network.stats.send.values())
+        pkts_per = pkts / done if done else 0.
+        phases = ' '.join(f'{k}={v}' for k, v in self.phases().items())
+
+        return (
+            f'Done={done} Pending={len(self.pending)} Time={self.now:0.2f}s CPU={self.cpu:0.2f}s '
+            f'CPU/cmd={cpu_per:0.1f}us Pkts/cmd={pkts_per:0.1f} client={self.latency} {phases}'
+        )
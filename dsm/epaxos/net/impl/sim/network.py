@@ -0,0 +1,77 @@
+import heapq
+import random
+from collections import defaultdict
+from itertools import count
+from typing import NamedTuple, Dict, Tuple, List, Set, Iterable
+
+from dsm.epaxos.net.impl.udp.util import serialize, deserialize
+from dsm.epaxos.net.packet import Packet
+
+
+class LinkConfig(NamedTuple):
+    latency: float = 0.0005
+    jitter: float = 0.0002
+    loss: float = 0.
+
+
+class SimStats:
+    def __init__(self):
+        self.send = defaultdict(int)
+        self.drop = defaultdict(int)
+        self.traffic_send = 0
+
+
+class SimNetwork:
+    """
+    A network on a virtual clock. Every packet is delivered after the latency of its link plus a uniform jitter, so
+    packets sent close enough together are reordered. Packets are lost with the probability of the link or when either
+    end is down.
+
+    All of the randomness comes from a `random.Random(seed)`, so a run is reproduced by its seed.
+    """
+
+    def __init__(self, seed: int, link: LinkConfig = LinkConfig(), serialize: bool = False):
+        self.random = random.Random(seed)
+        self.link_default = link
+        self.links = {}  # type: Dict[Tuple[int, int], LinkConfig]
+        self.down = set()  # type: Set[int]
+        self.serialize = serialize
+
+        self.now = 0.
+        self.queue = []  # type: List[Tuple[float, int, Packet]]
+        self.seq = count()
+
+        self.stats = SimStats()
+
+    def link(self, origin: int, destination: int) -> LinkConfig:
+        return self.links.get((origin, destination), self.link_default)
+
+    def send(self, packet: Packet):
+        self.stats.send[packet.type] += 1
+
+        if self.serialize:
+            body = serialize(packet)
+            self.stats.traffic_send += len(body)
+            packet = deserialize(body[4:])
+
+        link = self.link(packet.origin, packet.destination)
+
+        if packet.origin in self.down or packet.destination in self.down or self.random.random() < link.loss:
+            self.stats.drop[packet.type] += 1
+            return
+
+        at = self.now + link.latency + self.random.uniform(0, link.jitter)
+        heapq.heappush(self.queue, (at, next(self.seq), packet))
+
+    def deliver(self, until: float) -> Iterable[Packet]:
+        while len(self.queue) and self.queue[0][0] <= until:
+            at, _, packet = heapq.heappop(self.queue)
+            self.now = at
+
+            if packet.destination in self.down:
+                self.stats.drop[packet.type] += 1
+                continue
+
+            yield packet
+
+        self.now = until
@@ -0,0 +1,23 @@
+from dsm.epaxos.net.impl.sim.network import SimNetwork
+from dsm.epaxos.net.packet import Packet
+from dsm.epaxos.replica.net.ev import Send
+from dsm.epaxos.replica.net.main import NetActor
+from dsm.epaxos.replica.quorum.ev import Quorum
+
+
+class SimNetActor(NetActor):
+    def __init__(self, quorum: Quorum, network: SimNetwork):
+        super().__init__()
+        self.quorum = quorum
+        self.network = network
+
+    def send(self, s: Send):
+        self.network.send(
+            Packet(
+                self.quorum.replica_id,
+                s.dest,
+                s.payload.__class__.__name__,
+                s.payload,
+                self.group
+            )
+        )
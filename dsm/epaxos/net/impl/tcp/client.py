@@ -0,0 +1,106 @@
+import select
+import time
+from collections import deque
+from typing import Dict, Deque
+
+from dsm.epaxos.net.impl.generic.client import ReplicaClient
+from dsm.epaxos.net.impl.tcp.util import Connection, create_connect
+from dsm.epaxos.net.impl.udp.util import serialize
+from dsm.epaxos.net.packet import Packet, Payload
+from dsm.serializer import deserialize_json
+
+
+class TCPReplicaClient(ReplicaClient):
+    """
+    Connects to every replica address it sends to, and is answered on the same connection. A connection that breaks
+    is opened again by the next packet to its address.
+    """
+
+    def __init__(
+        self,
+        *args
+    ):
+        super().__init__(*args)
+        self.conns = {}  # type: Dict[str, Connection]
+        self.packets = deque()  # type: Deque[Packet]
+
+        self.replica_addrs = {
+            g: {k: x.replica_addr for k, x in self.shards.addresses(self.peer_addr, g).items()}
+            for g in range(self.shards.groups)
+        }
+
+    def _conn(self, addr: str) -> Connection:
+        conn = self.conns.get(addr)
+
+        if conn is None:
+            conn = self.conns[addr] = Connection(create_connect(addr), self.peer_id)
+            conn.hello(self.peer_id)
+
+        return conn
+
+    def _drop(self, addr: str):
+        self.conns.pop(addr).close()
+
+    def _read(self, addr: str, conn: Connection):
+        try:
+            alive = conn.fill()
+        except OSError:
+            alive = False
+
+        if not alive:
+            self._drop(addr)
+            return
+
+        for frame in conn.frames():
+            self.packets.append(deserialize_json(Packet, frame))
+
+    def poll(self, max_wait) -> bool:
+        deadline = time.monotonic() + max_wait
+
+        while not len(self.packets):
+            for addr, conn in list(self.conns.items()):
+                try:
+                    conn.flush()
+                except OSError:
+                    self._drop(addr)
+
+            addrs = {conn: addr for addr, conn in self.conns.items()}
+            r, _, _ = select.select(list(addrs), [], [], max(0., deadline - time.monotonic()))
+
+            for conn in r:
+                self._read(addrs[conn], conn)
+
+            if time.monotonic() >= deadline:
+                break
+
+        return len(self.packets) > 0
+
+    def send_packet(self, replica_id: int, payload: Payload, group: int = 0):
+        packet = Packet(
+            self.peer_id,
+            replica_id,
+            payload.__class__.__name__,
+            payload,
+            group
+        )
+
+        addr = self.replica_addrs[group][replica_id]
+
+        try:
+            conn = self._conn(addr)
+            conn.push(serialize(packet))
+            conn.flush()
+        except OSError:
+            # a replica that is gone, the request times out
+            if addr in self.conns:
+                self._drop(addr)
+
+    def recv(self):
+        while not len(self.packets):
+            self.poll(1.)
+
+        return self.packets.popleft()
+
+    def close(self):
+        for x in self.conns.values():
+            x.close()
@@ -0,0 +1,186 @@
+import logging
+import select
+import time
+from typing import Dict, List
+
+from dsm.epaxos.net.impl.generic.server import ReplicaServer
+from dsm.epaxos.net.impl.tcp.util import Connection, create_listen, create_connect, close_listen
+from dsm.epaxos.net.impl.udp.util import serialize
+from dsm.epaxos.net.packet import Packet
+from dsm.epaxos.replica.net.ev import Send
+from dsm.epaxos.replica.net.main import NetActor
+from dsm.epaxos.replica.quorum.ev import Quorum
+from dsm.serializer import deserialize_json
+
+logger = logging.getLogger(__name__)
+
+
+class TCPNetActor(NetActor):
+    """
+    Queues the packets of a group on the connection to their destination, for `TCPReplicaServer.send` to write.
+    """
+
+    def __init__(self, quorum: Quorum, group: int, conns: Dict[int, Connection]):
+        super().__init__(group)
+        self.quorum = quorum
+        self.conns = conns
+
+    def send(self, s: Send):
+        packet = Packet(
+            self.quorum.replica_id,
+            s.dest,
+            s.payload.__class__.__name__,
+            s.payload,
+            self.group
+        )
+
+        conn = self.conns.get(packet.destination)
+
+        if conn is None:
+            # a peer that is not connected yet or any more, as if the packet was lost
+            logger.debug(f'Dropping packet {packet} due to no connection')
+            return
+
+        body = serialize(packet)
+        self.m_bytes_sent.inc(len(body))
+        conn.push(body)
+
+
+class TCPReplicaServer(ReplicaServer):
+    """
+    Keeps one connection per peer and per client, which carries the packets of every group both ways: a replica
+    connects to the peers of lower ID, every `reconnect` seconds while it is not connected, and is connected to by the
+    others and by the clients.
+
+    The packets queued on a connection are written once per loop by `send`. A connection that breaks is dropped along
+    with what was queued on it, as datagrams would be.
+
+    The replica addresses are either `tcp://host:port`, or `unix:///path` for UNIX sockets between processes of one
+    host, which skip the IP stack.
+    """
+
+    def __init__(self, *args, reconnect: float = 1., **kwargs):
+        self.conns = {}  # type: Dict[int, Connection]
+        self.accepted = []  # type: List[Connection]
+        self.readable = []  # type: List[Connection]
+
+        super().__init__(*args, **kwargs)
+
+        self.listener = create_listen(self.quorum.peer_addrs[self.quorum.replica_id].replica_addr)
+        self.reconnect = reconnect
+        self.connected_at = 0.
+
+        self.m_dropped = self.replica.metrics.counter('tcp_dropped', 'Connections dropped', ('reason',))
+
+    def build_net_actor(self, group: int) -> NetActor:
+        return TCPNetActor(self.quorums[group], group, self.conns)
+
+    def _connect(self):
+        replica_id = self.quorum.replica_id
+
+        for peer, addr in self.quorum.peer_addrs.items():
+            if peer >= replica_id or peer in self.conns:
+                continue
+
+            try:
+                sock = create_connect(addr.replica_addr)
+            except OSError:
+                continue
+
+            conn = self.conns[peer] = Connection(sock, peer)
+            conn.hello(replica_id)
+
+    def _drop(self, conn: Connection, reason: str):
+        self.m_dropped.labels(reason).inc()
+
+        if self.conns.get(conn.peer) is conn:
+            del self.conns[conn.peer]
+        elif conn in self.accepted:
+            self.accepted.remove(conn)
+
+        conn.close()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except BlockingIOError:
+                return
+
+            self.accepted.append(Connection(sock))
+
+    def poll(self, min_wait):
+        now = time.monotonic()
+
+        if now - self.connected_at > self.reconnect:
+            self.connected_at = now
+            self._connect()
+
+        conns = list(self.conns.values())
+
+        # a packet left in a buffer by an earlier `recv`
+        if any(x.ready() for x in conns):
+            min_wait = 0.
+
+        r, _, _ = select.select([self.listener] + conns + self.accepted, [], [], min_wait)
+
+        self.readable = r + [x for x in conns if x not in r and x.ready()]
+        return len(self.readable) > 0
+
+    def send(self):
+        sent = 0
+
+        for conn in list(self.conns.values()):
+            n = len(conn.out)
+
+            if not n:
+                continue
+
+            try:
+                conn.flush()
+            except OSError:
+                self._drop(conn, 'SEND')
+                continue
+
+            sent += n - len(conn.out)
+
+        return sent
+
+    def recv(self):
+        readable, self.readable = self.readable, []
+
+        for conn in readable:
+            if conn is self.listener:
+                self._accept()
+                continue
+
+            try:
+                alive = conn.fill()
+            except OSError:
+                alive = False
+
+            if not alive:
+                self._drop(conn, 'RECV')
+                continue
+
+            if conn in self.accepted and conn.greet():
+                # the peer or the client has said who it is
+                self.accepted.remove(conn)
+                prev = self.conns.get(conn.peer)
+                if prev is not None:
+                    self._drop(prev, 'REPLACED')
+                self.conns[conn.peer] = conn
+
+            for frame in conn.frames():
+                t = self.net_actor.spans.start()
+                x = deserialize_json(Packet, frame)
+                self.net_actor.spans.stop('decode', t)
+
+                self.net_actor.m_bytes_recv.inc(len(frame))
+
+                yield x
+
+    def close(self):
+        close_listen(self.listener)
+        for x in list(self.conns.values()) + self.accepted:
+            x.close()
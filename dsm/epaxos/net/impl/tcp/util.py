@@ -0,0 +1,207 @@
+import os
+import socket
+import struct
+from typing import Optional, List, Iterator, Tuple, Any
+from urllib.parse import urlparse
+
+from dsm.epaxos.net.impl.udp.util import _addr_conv
+
+# the length of a packet on the wire, see `udp.util.serialize`
+_LEN = struct.Struct('I')
+# the ID of the peer that opened the connection, the first thing it sends
+_HELLO = struct.Struct('i')
+
+_IOV_MAX = os.sysconf('SC_IOV_MAX')
+
+
+def _sock_addr(addr: str) -> Tuple[int, Any]:
+    """
+    :return: the address family and the socket address of a URL, which is a UNIX socket path for `unix:///path`
+    """
+    url = urlparse(addr)
+
+    if url.scheme == 'unix':
+        return socket.AF_UNIX, url.path
+
+    return socket.AF_INET, _addr_conv(addr)
+
+
+def create_listen(addr: str, backlog: int = 128) -> socket.socket:
+    family, sock_addr = _sock_addr(addr)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+
+    if family == socket.AF_UNIX:
+        # left behind by a replica that has not exited cleanly
+        if os.path.exists(sock_addr):
+            os.unlink(sock_addr)
+    else:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    sock.bind(sock_addr)
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def close_listen(sock: socket.socket):
+    path = sock.getsockname() if sock.family == socket.AF_UNIX else None
+    sock.close()
+
+    if path:
+        os.unlink(path)
+
+
+def create_connect(addr: str, timeout: float = 0.1) -> socket.socket:
+    family, sock_addr = _sock_addr(addr)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+
+    try:
+        sock.connect(sock_addr)
+    except OSError:
+        sock.close()
+        raise
+
+    if family == socket.AF_INET:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    return sock
+
+
+class Connection:
+    """
+    A stream of packets on the wire (`udp.util.serialize`), which starts with the ID of the peer that opened it,
+    see `hello` and `greet`.
+
+    The packets to send are queued by `push` and written by `flush` with a single `sendmsg` of all of them, as far as
+    the socket takes them. The bytes received are read into a buffer that is kept for the life of the connection,
+    and `frames` returns every complete packet in it as a view of the buffer, valid until the next `fill`.
+    """
+
+    def __init__(self, sock: socket.socket, peer: Optional[int] = None, size: int = 1 << 16, max_out: int = 1 << 24):
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.peer = peer
+
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0
+        self.end = 0
+
+        self.out = []  # type: List[bytes]
+        self.out_size = 0
+        self.max_out = max_out
+        self.dropped = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def hello(self, peer_id: int):
+        self.push(_HELLO.pack(peer_id))
+
+    def push(self, body: bytes):
+        if self.out_size + len(body) > self.max_out:
+            # the peer does not read, so the packet would be late anyway
+            self.dropped += 1
+            return
+
+        self.out.append(body)
+        self.out_size += len(body)
+
+    def flush(self):
+        """
+        :raises OSError: if the connection is broken
+        """
+        out = self.out
+
+        while len(out):
+            try:
+                n = self.sock.sendmsg(out[:_IOV_MAX])
+            except BlockingIOError:
+                return
+
+            self.out_size -= n
+            i = 0
+
+            while i < len(out) and n >= len(out[i]):
+                n -= len(out[i])
+                i += 1
+
+            del out[:i]
+
+            if n:
+                # the socket is full
+                out[0] = memoryview(out[0])[n:]
+                return
+
+    def fill(self) -> bool:
+        """
+        Read what the socket has.
+
+        :return: `False` if the connection has been closed
+        :raises OSError: if the connection is broken
+        """
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == len(self.buf):
+            n = self.end - self.start
+
+            if self.start > 0:
+                self.buf[:n] = self.view[self.start:self.end]
+            else:
+                # a packet larger than the buffer
+                self.view.release()
+                self.buf = self.buf + bytearray(len(self.buf))
+                self.view = memoryview(self.buf)
+
+            self.start, self.end = 0, n
+
+        try:
+            n = self.sock.recv_into(self.view[self.end:])
+        except BlockingIOError:
+            return True
+
+        self.end += n
+        return n > 0
+
+    def greet(self) -> bool:
+        """
+        :return: if the ID of the peer is known, reading it from the buffer if it is not
+        """
+        if self.peer is None and self.end - self.start >= _HELLO.size:
+            self.peer, = _HELLO.unpack_from(self.buf, self.start)
+            self.start += _HELLO.size
+
+        return self.peer is not None
+
+    def frames(self) -> Iterator[memoryview]:
+        while self.greet():
+            avail = self.end - self.start
+
+            if avail < _LEN.size:
+                return
+
+            size, = _LEN.unpack_from(self.buf, self.start)
+
+            if avail < _LEN.size + size:
+                return
+
+            start = self.start + _LEN.size
+            self.start = start + size
+
+            yield self.view[start:self.start]
+
+    def ready(self) -> bool:
+        """
+        :return: if there is a complete packet in the buffer
+        """
+        avail = self.end - self.start
+
+        if avail < _LEN.size or self.peer is None:
+            return False
+
+        size, = _LEN.unpack_from(self.buf, self.start)
+        return avail >= _LEN.size + size
+
+    def close(self):
+        self.sock.close()
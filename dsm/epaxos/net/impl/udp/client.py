@@ -3,13 +3,12 @@ import socket
 
 import select
 
-from dsm.epaxos.cmd.state import Command
 from dsm.epaxos.net.impl.generic.client import ReplicaClient
 # from dsm.epaxos.net.impl.udp.mapper import UDPClientSendChannel, deserialize
 from dsm.epaxos.net.impl.udp.util import _addr_conv, _recv_parse_buffer, create_socket, serialize, deserialize
 
 # from dsm.epaxos.net.peer import Channel
-from dsm.epaxos.net.packet import Packet, ClientRequest
+from dsm.epaxos.net.packet import Packet, Payload
 from dsm.serializer import deserialize_json
 
 
@@ -20,27 +19,27 @@ class UDPReplicaClient(ReplicaClient):
     ):
         super().__init__(*args)
         self.socket = create_socket()
-        self.replica_addrs = {k: _addr_conv(self.peer_addr[k].replica_addr) for k in self.peer_addr.keys()}
+        self.replica_addrs = {
+            g: {k: _addr_conv(x.replica_addr) for k, x in self.shards.addresses(self.peer_addr, g).items()}
+            for g in range(self.shards.groups)
+        }
 
     def poll(self, max_wait) -> bool:
         r, _, _ = select.select([self.socket], [], [], max_wait)
         return len(r) > 0
 
-    def send(self, command: Command):
-        payload = ClientRequest(
-            command
-        )
-
+    def send_packet(self, replica_id: int, payload: Payload, group: int = 0):
         packet = Packet(
             self.peer_id,
-            self.leader_id,
+            replica_id,
             payload.__class__.__name__,
-            payload
+            payload,
+            group
         )
 
         body = serialize(packet)
 
-        self.socket.sendto(body, self.replica_addrs[packet.destination])
+        self.socket.sendto(body, self.replica_addrs[group][packet.destination])
 
     def recv(self):
         addr, body = next(_recv_parse_buffer(self.socket))
@@ -1,7 +1,7 @@
 import logging
 import random
 import select
-from collections import defaultdict
+from typing import Optional, Dict, Any
 
 from dsm.epaxos.net.impl.generic.server import ReplicaServer
 from dsm.epaxos.net.impl.udp.util import _recv_parse_buffer, create_bind, create_socket, deserialize, serialize, \
@@ -16,21 +16,13 @@ logger = logging.getLogger(__name__)
 DROP_RATE = 0.01
 
 
-class NetStats:
-    def __init__(self):
-        self.send = defaultdict(int)
-        self.recv = defaultdict(int)
-        self.traffic_send = 0
-        self.traffic_recv = 0
-
-
 class UDPNetActor(NetActor):
-    def __init__(self, quorum: Quorum):
-        super().__init__()
-        self.net_stats: NetStats
+    def __init__(self, quorum: Quorum, group: int = 0, clients: Optional[Dict[int, Any]] = None):
+        super().__init__(group)
         self.quorum = quorum
         self.socket = create_socket()
-        self.clients = {}
+        # the groups of a process reply to the clients they have in common
+        self.clients = clients if clients is not None else {}
         self.peers = {k: _addr_conv(x.replica_addr) for k, x in self.quorum.peer_addrs.items()}
 
     def send(self, s: Send):
@@ -38,7 +30,8 @@ class UDPNetActor(NetActor):
             self.quorum.replica_id,
             s.dest,
             s.payload.__class__.__name__,
-            s.payload
+            s.payload,
+            self.group
         )
 
         if packet.destination in self.peers:
@@ -54,8 +47,7 @@ class UDPNetActor(NetActor):
 
         body = serialize(packet)
 
-        self.net_stats.send[packet.type] += 1
-        self.net_stats.traffic_send += len(body)
+        self.m_bytes_sent.inc(len(body))
 
 
         if random.random() < DROP_RATE:
@@ -73,15 +65,13 @@ class UDPNetActor(NetActor):
 
 class UDPReplicaServer(ReplicaServer):
     def __init__(self, *args, **kwargs):
-        self.net_stats = NetStats()
+        self.clients = {}
         super().__init__(*args, **kwargs)
 
-        self.socket_server = create_bind(self.peer_addr[self.quorum.replica_id].replica_addr)
+        self.socket_server = create_bind(self.quorum.peer_addrs[self.quorum.replica_id].replica_addr)
 
-    def build_net_actor(self) -> NetActor:
-        r = UDPNetActor(self.quorum)
-        r.net_stats = self.net_stats
-        return r
+    def build_net_actor(self, group: int) -> NetActor:
+        return UDPNetActor(self.quorums[group], group, self.clients)
 
     def poll(self, min_wait):
         r, _, _ = select.select([self.socket_server], [], [], min_wait)
@@ -94,21 +84,23 @@ class UDPReplicaServer(ReplicaServer):
         for i, (addr, body) in enumerate(_recv_parse_buffer(self.socket_server)):
             # todo: save addr -> body mapping in here.
 
+            t = self.net_actor.spans.start()
             x = deserialize(body)
+            self.net_actor.spans.stop('decode', t)
 
             if random.random() < DROP_RATE:
                 continue
 
-            self.net_stats.recv[x.type] += 1
-            self.net_stats.traffic_recv += len(body)
+            self.net_actor.m_bytes_recv.inc(len(body))
 
             # print('<<<<<<<<', self.quorum.replica_id, x)
 
-            if x.origin not in self.net_actor.clients:
-                self.net_actor.clients[x.origin] = addr
+            # a client may come back from another address under the same id
+            self.clients[x.origin] = addr
 
             yield x
 
     def close(self):
         self.socket_server.close()
-        self.net_actor.close()
+        for x in self.net_actors.values():
+            x.close()
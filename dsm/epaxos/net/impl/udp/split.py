@@ -0,0 +1,190 @@
+import logging
+import os
+import pickle
+import random
+import select
+import signal
+import struct
+from itertools import islice
+from multiprocessing import Process
+from typing import Dict
+
+from setproctitle import setproctitle
+
+from dsm.epaxos.net.impl.generic.ring import Ring
+from dsm.epaxos.net.impl.generic.server import ReplicaServer
+from dsm.epaxos.net.impl.udp.server import DROP_RATE
+from dsm.epaxos.net.impl.udp.util import _addr_conv, _recv_parse_buffer, create_bind, deserialize, serialize
+from dsm.epaxos.net.packet import Packet
+from dsm.epaxos.replica.net.ev import Send
+from dsm.epaxos.replica.net.main import NetActor
+from dsm.epaxos.replica.quorum.ev import Quorum, ReplicaAddress
+
+logger = logging.getLogger(__name__)
+
+# length on the wire, followed by the pickled packet
+_IN = struct.Struct('I')
+# destination and group, followed by the packet on the wire
+_OUT = struct.Struct('iI')
+
+# datagrams received before the I/O process looks at the packets to send
+RECV_BATCH = 256
+
+
+class RingNetActor(NetActor):
+    def __init__(self, quorum: Quorum, group: int, ring: Ring):
+        super().__init__(group)
+        self.quorum = quorum
+        self.ring = ring
+        self.pushed = 0
+
+    def send(self, s: Send):
+        packet = Packet(
+            self.quorum.replica_id,
+            s.dest,
+            s.payload.__class__.__name__,
+            s.payload,
+            self.group
+        )
+
+        body = serialize(packet)
+
+        self.m_bytes_sent.inc(len(body))
+
+        if self.ring.push(_OUT.pack(s.dest, self.group) + body):
+            self.pushed += 1
+
+
+class UDPSplitReplicaServer(ReplicaServer):
+    """
+    A `UDPReplicaServer` whose socket I/O runs in a process of its own (`udp_io`), so that the protocol does not share
+    the GIL with it. The packets received are decoded there and passed on pickled, which is about half the cost of
+    decoding them; the packets sent are serialized by the protocol, since pickling them would cost more than that.
+    """
+
+    def __init__(self, *args, ring_size: int = 1 << 22, **kwargs):
+        self.ring_in = Ring(ring_size)
+        self.ring_out = Ring(ring_size)
+
+        super().__init__(*args, **kwargs)
+
+        self.m_dropped = self.replica.metrics.gauge('ring_dropped', 'Packets dropped by a full ring', ('ring',))
+
+        self.io = Process(
+            target=udp_io,
+            args=(
+                self.quorum.replica_id,
+                self.quorum.peer_addrs[self.quorum.replica_id].replica_addr,
+                {g: x.peer_addrs for g, x in self.quorums.items()},
+                self.ring_in,
+                self.ring_out,
+            ),
+            name=f'dsm-replica-{self.quorum.replica_id}-io',
+            daemon=True,
+        )
+        self.io.start()
+
+    def build_net_actor(self, group: int) -> NetActor:
+        return RingNetActor(self.quorums[group], group, self.ring_out)
+
+    def poll(self, min_wait):
+        return self.ring_in.wait(min_wait)
+
+    def send(self):
+        pushed = 0
+
+        for x in self.net_actors.values():
+            pushed += x.pushed
+            x.pushed = 0
+
+        if pushed:
+            self.ring_out.notify()
+
+        self.m_dropped.labels('in').set(self.ring_in.dropped)
+        self.m_dropped.labels('out').set(self.ring_out.dropped)
+
+        return pushed
+
+    def recv(self):
+        while True:
+            data = self.ring_in.pop()
+
+            if data is None:
+                return
+
+            t = self.net_actor.spans.start()
+            size, = _IN.unpack_from(data)
+            x = pickle.loads(memoryview(data)[_IN.size:])
+            self.net_actor.spans.stop('decode', t)
+
+            self.net_actor.m_bytes_recv.inc(size)
+
+            yield x
+
+    def close(self):
+        if self.io.is_alive():
+            self.io.terminate()
+        self.io.join()
+        self.ring_in.close()
+        self.ring_out.close()
+
+
+def udp_io(replica_id: int, addr: str, peer_addrs: Dict[int, Dict[int, ReplicaAddress]], ring_in: Ring,
+           ring_out: Ring):
+    """
+    Receive and decode the packets of a replica into `ring_in`, and send the ones of `ring_out`, until the replica
+    is gone.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    setproctitle(f'replica-{replica_id}-io')
+
+    parent = os.getppid()
+    socket = create_bind(addr)
+
+    peers = {g: {k: _addr_conv(x.replica_addr) for k, x in addrs.items()} for g, addrs in peer_addrs.items()}
+    clients = {}
+
+    while os.getppid() == parent:
+        select.select([socket, ring_out.rfd], [], [], 1.)
+
+        received = 0
+
+        for addr, body in islice(_recv_parse_buffer(socket), RECV_BATCH):
+            x = deserialize(body)
+
+            if random.random() < DROP_RATE:
+                continue
+
+            # a client may come back from another address under the same id
+            clients[x.origin] = addr
+
+            ring_in.push(_IN.pack(len(body)) + pickle.dumps(x, pickle.HIGHEST_PROTOCOL))
+            received += 1
+
+        if received:
+            ring_in.notify()
+
+        ring_out.drain()
+
+        while True:
+            data = ring_out.pop()
+
+            if data is None:
+                break
+
+            dest, group = _OUT.unpack_from(data)
+            dst = peers[group].get(dest) or clients.get(dest)
+
+            if dst is None:
+                logger.error(f'Dropping packet to {dest} due to unknown destination')
+                continue
+
+            if random.random() < DROP_RATE:
+                continue
+
+            try:
+                socket.sendto(memoryview(data)[_OUT.size:], dst)
+            except OSError:
+                logger.exception('')
+
+    socket.close()
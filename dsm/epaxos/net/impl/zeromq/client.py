@@ -1,74 +1,74 @@
-import random
+from collections import deque
+from typing import Dict, Deque
 
 import zmq
 
-from dsm.epaxos.cmd.state import Command
 from dsm.epaxos.net.impl.generic.client import ReplicaClient
-from dsm.epaxos.net.impl.zeromq.mapper import ZMQClientSendChannel, deserialize
-from dsm.epaxos.net.peer import Channel
+from dsm.epaxos.net.impl.zeromq.server import create_socket, client_identity
+from dsm.epaxos.net.packet import Packet, Payload
+from dsm.serializer import serialize_json, deserialize_json
 
 
 class ZMQReplicaClient(ReplicaClient):
+    """
+    Talks to every replica address on a `DEALER` of its own, under the identity of the client, which the replica
+    answers through its `ROUTER`. A reply may carry several packets, which are returned one by one.
+    """
+
     def __init__(
         self,
         *args
     ):
         super().__init__(*args)
-
-    def init(self, peer_id: int) -> Channel:
-        self.poller = zmq.Poller()
-
         self.context = zmq.Context()
+        self.poller = zmq.Poller()
+        self.sockets = {}  # type: Dict[str, zmq.Socket]
+        self.frames = deque()  # type: Deque[zmq.Frame]
 
-        socket = self.context.socket(zmq.DEALER)
-        socket.setsockopt(zmq.IDENTITY, str(peer_id).encode())
-        socket.linger = 0
-
-        self.socket = socket
-        self.poller.register(self.socket, zmq.POLLIN)
-
-        self._replica_id = None
-
-        return ZMQClientSendChannel(self)
-
-    @property
-    def leader_id(self):
-        return self._replica_id
-
-    def connect(self, replica_id=None):
-        if self.leader_id is None:
-            pass
-        else:
-            self.socket.disconnect(self.peer_addr[self.leader_id].replica_addr)
-
-        if len(self.blacklisted) == len(list(self.peer_addr.keys())):
-            self.blacklisted = []
+        self.replica_addrs = {
+            g: {k: x.replica_addr for k, x in self.shards.addresses(self.peer_addr, g).items()}
+            for g in range(self.shards.groups)
+        }
 
-        while replica_id is None or replica_id in self.blacklisted:
-            replica_id = random.choice(list(self.peer_addr.keys()))
+    def _socket(self, addr: str) -> zmq.Socket:
+        socket = self.sockets.get(addr)
 
-        self._replica_id = replica_id
+        if socket is None:
+            socket = self.sockets[addr] = create_socket(self.context, zmq.DEALER, client_identity(self.peer_id))
+            socket.connect(addr)
+            self.poller.register(socket, zmq.POLLIN)
 
-        self.socket.connect(self.peer_addr[replica_id].replica_addr)
+        return socket
 
     def poll(self, max_wait) -> bool:
-        poll_result = dict(self.poller.poll(max_wait * 1000.))
-        return self.socket in poll_result
-
-    def send(self, command: Command):
-        self.channel.client_request(self.leader_id, command)
+        if len(self.frames):
+            return True
+
+        return len(self.poller.poll(max_wait * 1000.)) > 0
+
+    def send_packet(self, replica_id: int, payload: Payload, group: int = 0):
+        packet = Packet(
+            self.peer_id,
+            replica_id,
+            payload.__class__.__name__,
+            payload,
+            group
+        )
+
+        try:
+            self._socket(self.replica_addrs[group][replica_id]).send(serialize_json(packet), zmq.NOBLOCK, copy=False)
+        except zmq.Again:
+            # a replica that is gone, the request times out
+            pass
 
     def recv(self):
-        payload, = self.socket.recv_multipart()
+        while not len(self.frames):
+            for socket, _ in self.poller.poll():
+                self.frames.extend(socket.recv_multipart(copy=False))
 
-        return deserialize(payload)
+        return deserialize_json(Packet, self.frames.popleft().buffer)
 
     def close(self):
-        self.socket.disconnect(self.peer_addr[self._replica_id].replica_addr)
-
-    def __enter__(self):
-        self.connect()
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.close()
\ No newline at end of file
+        for x in self.sockets.values():
+            x.close()
+        self.context.term()
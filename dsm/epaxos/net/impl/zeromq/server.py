@@ -1,61 +1,174 @@
-from typing import Tuple
+import logging
+from collections import deque
+from typing import Dict, List, Deque, Tuple
 
 import zmq
 
 from dsm.epaxos.net.impl.generic.server import ReplicaServer
-from dsm.epaxos.net.impl.zeromq.mapper import ZMQReplicaSendChannel, ZMQReplicaReceiveChannel
-from dsm.epaxos.net.peer import Channel
+from dsm.epaxos.net.packet import Packet
+from dsm.epaxos.replica.net.ev import Send
+from dsm.epaxos.replica.net.main import NetActor
+from dsm.epaxos.replica.quorum.ev import Quorum
+from dsm.serializer import serialize_json, deserialize_json
+
+logger = logging.getLogger(__name__)
+
+
+def create_socket(context: zmq.Context, kind: int, identity: bytes, hwm: int = 100000) -> zmq.Socket:
+    socket = context.socket(kind)
+    socket.setsockopt(zmq.IDENTITY, identity)
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.sndhwm = hwm
+    socket.rcvhwm = hwm
+    return socket
+
+
+def replica_identity(replica_id: int) -> bytes:
+    return f'replica-{replica_id}'.encode()
+
+
+def client_identity(peer_id: int) -> bytes:
+    return str(peer_id).encode()
+
+
+class ZMQNetActor(NetActor):
+    """
+    Queues the packets of a group by destination, for `ZMQReplicaServer.send` to send every queue as a single
+    multipart message.
+    """
+
+    def __init__(self, quorum: Quorum, group: int, peer_batches: Dict[str, List[bytes]],
+                 client_batches: Dict[bytes, List[bytes]], clients: Dict[int, bytes]):
+        super().__init__(group)
+        self.quorum = quorum
+        self.peer_batches = peer_batches
+        self.client_batches = client_batches
+        self.clients = clients
+        self.peers = {k: x.replica_addr for k, x in quorum.peer_addrs.items()}
+
+    def send(self, s: Send):
+        packet = Packet(
+            self.quorum.replica_id,
+            s.dest,
+            s.payload.__class__.__name__,
+            s.payload,
+            self.group
+        )
+
+        if packet.destination in self.peers:
+            batch = self.peer_batches.setdefault(self.peers[packet.destination], [])
+        elif packet.destination in self.clients:
+            batch = self.client_batches.setdefault(self.clients[packet.destination], [])
+        else:
+            logger.error(f'Dropping packet {packet} due to unknown destination')
+            return
+
+        body = serialize_json(packet)
+        self.m_bytes_sent.inc(len(body))
+        batch.append(body)
 
 
 class ZMQReplicaServer(ReplicaServer):
-    def init(self, replica_id: int) -> Tuple[Channel, Channel]:
-        self.context = zmq.Context(len(self.peer_addr) - 1, shadow=False)
-
-        socket = self.context.socket(zmq.ROUTER)
-        socket.bind(self.peer_addr[replica_id].replica_addr)
-        socket.setsockopt(zmq.IDENTITY, str(replica_id).encode())
-        socket.setsockopt(zmq.ROUTER_HANDOVER, 1)
-        socket.setsockopt(zmq.RCVBUF, 2 ** 20)
-        socket.setsockopt(zmq.SNDBUF, 2 ** 20)
-        socket.sndhwm = 1000000
-        socket.rcvhwm = 1000000
-        socket.setsockopt(zmq.LINGER, 0)
-        socket.hwm = 50
-        # socket.setsockopt(zmq.HWM, 20)
+    """
+    Receives from the peers and the clients on a `ROUTER` socket bound to the replica address, and sends to every
+    peer address on a `DEALER` connected to it. A client is answered through the `ROUTER`, by the identity its
+    requests came from.
 
-        self.poller = zmq.Poller()
-        self.poller.register(socket, zmq.POLLIN)
-        self.socket = socket
+    The packets to a destination are batched until `send`, which sends them as the frames of one message. A message
+    the peer has no room for is dropped, as a datagram would be. The frames received are decoded straight from
+    the buffers of the messages.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.peer_batches = {}  # type: Dict[str, List[bytes]]
+        self.client_batches = {}  # type: Dict[bytes, List[bytes]]
+        self.clients = {}  # type: Dict[int, bytes]
+        self.received = deque()  # type: Deque[Tuple[zmq.Frame, zmq.Frame]]
+
+        super().__init__(*args, **kwargs)
 
-        # logger.info(f'Replica `{replica_id}` connecting.')
-        for peer_id, addr in self.peer_addr.items():
-            if peer_id == replica_id:
-                continue
+        self.context = zmq.Context()
+        identity = replica_identity(self.quorum.replica_id)
 
-            self.socket.connect(addr.replica_addr)
+        self.socket = create_socket(self.context, zmq.ROUTER, identity)
+        self.socket.setsockopt(zmq.ROUTER_HANDOVER, 1)
+        self.socket.bind(self.quorum.peer_addrs[self.quorum.replica_id].replica_addr)
 
-        return ZMQReplicaSendChannel(self), ZMQReplicaReceiveChannel(self)
+        self.dealers = {}  # type: Dict[str, zmq.Socket]
+
+        for quorum in self.quorums.values():
+            for peer, addr in quorum.peer_addrs.items():
+                if peer == self.quorum.replica_id or addr.replica_addr in self.dealers:
+                    continue
+
+                dealer = create_socket(self.context, zmq.DEALER, identity)
+                dealer.connect(addr.replica_addr)
+                self.dealers[addr.replica_addr] = dealer
+
+        self.poller = zmq.Poller()
+        self.poller.register(self.socket, zmq.POLLIN)
+
+        self.m_dropped = self.replica.metrics.counter('zmq_dropped', 'Packets dropped by a full socket')
+
+    def build_net_actor(self, group: int) -> NetActor:
+        return ZMQNetActor(self.quorums[group], group, self.peer_batches, self.client_batches, self.clients)
 
     def poll(self, min_wait):
-        poll_result = self.poller.poll(min_wait * 1000.)
+        if len(self.received):
+            return True
 
-        return self.socket in dict(poll_result)
+        return len(self.poller.poll(min_wait * 1000.)) > 0
+
+    def _send(self, socket: zmq.Socket, frames: List[bytes], n: int) -> int:
+        try:
+            socket.send_multipart(frames, zmq.NOBLOCK, copy=False)
+            return n
+        except zmq.Again:
+            self.m_dropped.inc(n)
+            return 0
 
     def send(self):
-        return self.channel_send.send_packets()
+        sent = 0
+
+        if len(self.peer_batches):
+            for addr, bodies in self.peer_batches.items():
+                sent += self._send(self.dealers[addr], bodies, len(bodies))
+            self.peer_batches.clear()
+
+        if len(self.client_batches):
+            for identity, bodies in self.client_batches.items():
+                sent += self._send(self.socket, [identity] + bodies, len(bodies))
+            self.client_batches.clear()
+
+        return sent
 
     def recv(self):
-        rcvd = 0
         while True:
-            try:
-                replica_request = self.socket.recv_multipart(flags=zmq.NOBLOCK)[-1]
+            if not len(self.received):
+                try:
+                    identity, *frames = self.socket.recv_multipart(zmq.NOBLOCK, copy=False)
+                except zmq.Again:
+                    return
+
+                for frame in frames:
+                    self.received.append((identity, frame))
+
+            identity, frame = self.received.popleft()
+
+            t = self.net_actor.spans.start()
+            x = deserialize_json(Packet, frame.buffer)
+            self.net_actor.spans.stop('decode', t)
+
+            self.net_actor.m_bytes_recv.inc(len(frame))
+
+            if x.origin not in self.quorum.peer_addrs:
+                # a client may come back on another connection under the same identity
+                self.clients[x.origin] = identity.bytes
 
-                self.channel_receive.receive_packet(replica_request)
-                rcvd += 1
-            except zmq.ZMQError:
-                break
-        return rcvd
+            yield x
 
     def close(self):
         self.socket.close()
+        for x in self.dealers.values():
+            x.close()
         self.context.term()
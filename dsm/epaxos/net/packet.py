@@ -19,24 +19,32 @@ class Packet(NamedTuple):
     destination: PeerID
     type: str
     payload: Payload
+    # the EPaxos group of the payload when the keys are sharded (see `ShardMap`)
+    group: int = 0
 
     @classmethod
     def serializer(cls, sub_ser: T_ser):
         def ser(obj: 'Packet'):
-            return [
+            r = [
                 obj.origin,
                 obj.destination,
                 obj.type,
                 sub_ser(obj.payload.__class__)(obj.payload)
             ]
 
+            # the default group is left out, so that unsharded packets stay as they were
+            if obj.group:
+                r.append(obj.group)
+
+            return r
+
         return ser
 
     @classmethod
     def deserializer(cls, sub_deser: T_des):
         def deser(json):
-            o, d, t, p = json
-            return cls(o, d, t, sub_deser(TYPE_TO_PACKET[t])(p))
+            o, d, t, p, *g = json
+            return cls(o, d, t, sub_deser(TYPE_TO_PACKET[t])(p), g[0] if len(g) else 0)
 
         return deser
 
@@ -61,12 +69,34 @@ class ClientResponse(NamedTuple, Payload):
     command: Optional[Command]
 
 
+class ClientRejected(NamedTuple, Payload):
+    """
+    The replica will not start the command: its state is undetermined, e.g. it is too old to know if it was executed.
+    """
+    command: Command
+    reason: str
+
+
+class ClientStarted(NamedTuple, Payload):
+    """
+    The command has been started in the slot its ID is bound to. The client resends it with this ID, so that any
+    replica finds the slot from the ID instead of starting the command again.
+    """
+    command: Command
+
+
+class CommitBatchRequest(NamedTuple, Payload):
+    slots: List[Slot]
+    ballots: List[Ballot]
+
+
 class PreAcceptRequest(NamedTuple, Payload):
     slot: Slot
     ballot: Ballot
     command: Optional[Command]
     seq: int
     deps: List[Slot]
+    commits: Optional[CommitBatchRequest] = None
 
 
 class PreAcceptResponseAck(NamedTuple, Payload):
@@ -154,10 +184,30 @@ class PrepareResponseNack(NamedTuple, Payload):
     ballot: Ballot
 
 
+class PrepareBatchRequest(NamedTuple, Payload):
+    id: int
+    slots: List[Slot]
+    ballots: List[Ballot]
+
+
+class PrepareBatchResponse(NamedTuple, Payload):
+    id: int
+    acks: List[PrepareResponseAck]
+    nacks: List[PrepareResponseNack]
+    diverged: List[Slot]
+
+
 class DivergedResponse(NamedTuple, Payload, ):
     slot: Slot
 
 
+class ExecutedFrontier(NamedTuple, Payload):
+    """
+    The last slot of every origin replica up to which the sender has executed all of the slots.
+    """
+    cut: List[Slot]
+
+
 class QuorumMembership(NamedTuple):
     peers: Dict[int, ReplicaAddress]
 
@@ -165,6 +215,8 @@ class QuorumMembership(NamedTuple):
 PACKET_CLIENT = (
     ClientRequest,
     ClientResponse,
+    ClientRejected,
+    ClientStarted,
     ClientIdent,
 )
 
@@ -179,8 +231,10 @@ PACKET_ACCEPTOR = (
     AcceptRequest,
 
     CommitRequest,
+    CommitBatchRequest,
 
     PrepareRequest,
+    PrepareBatchRequest,
 
     DivergedResponse,
 
@@ -195,6 +249,11 @@ PACKET_LEADER = (
 
     PrepareResponseAck,
     PrepareResponseNack,
+    PrepareBatchResponse,
+)
+
+PACKET_EXECUTOR = (
+    ExecutedFrontier,
 )
 
 PACKET_ALL = (
@@ -204,6 +263,8 @@ PACKET_ALL = (
 PACKETS = [
     ClientRequest,
     ClientResponse,
+    ClientRejected,
+    ClientStarted,
 
     PreAcceptRequest,
     PreAcceptResponseAck,
@@ -214,15 +275,21 @@ PACKETS = [
     AcceptResponseNack,
 
     CommitRequest,
+    CommitBatchRequest,
 
     PrepareRequest,
     PrepareResponseAck,
     PrepareResponseNack,
 
+    PrepareBatchRequest,
+    PrepareBatchResponse,
+
     DivergedResponse,
 
     PingRequest,
-    PongResponse
+    PongResponse,
+
+    ExecutedFrontier,
 ]
 
 TYPE_TO_PACKET = {v.__name__: v for v in PACKETS}
@@ -0,0 +1,62 @@
+from typing import NamedTuple, Optional, Dict
+from urllib.parse import urlparse, urlunparse
+
+from dsm.epaxos.cmd.state import Command, Mutator, RangeMutator
+from dsm.epaxos.replica.quorum.ev import ReplicaAddress
+
+
+def _shift_port(addr: str, by: int) -> str:
+    if by == 0:
+        return addr
+
+    x = urlparse(addr)
+
+    if x.scheme == 'unix':
+        return urlunparse(x._replace(path=f'{x.path}.{by}'))
+
+    return urlunparse(x._replace(netloc=f'{x.hostname}:{x.port + by}'))
+
+
+class ShardMap(NamedTuple):
+    """
+    Partitions the keys between `groups` independent EPaxos groups. Every group has its own instance store, slot space
+    and leaders, so that the groups never wait for each other; the `group` of a packet tells which one it belongs to.
+
+    With `port_stride == 0` all the groups of a replica share its addresses and run in one process. Otherwise every
+    group runs in a process of its own, and group `g` of a replica listens on its ports shifted by `g * port_stride`.
+    """
+
+    groups: int = 1
+    port_stride: int = 0
+
+    def group(self, key: int) -> int:
+        return hash(key) % self.groups
+
+    def route(self, command: Command) -> Optional[int]:
+        """
+        :return: the group owning every key of the command, `None` if they are owned by several groups
+        """
+        if self.groups == 1:
+            return 0
+
+        if isinstance(command.payload, RangeMutator) and len(command.payload.ranges):
+            # the keys are hashed to the groups, so a range may be owned by any of them
+            return None
+
+        if not isinstance(command.payload, (Mutator, RangeMutator)) or not len(command.payload.keys):
+            return 0
+
+        r = {self.group(x) for x in command.payload.keys}
+
+        if len(r) > 1:
+            return None
+
+        return r.pop()
+
+    def addresses(self, peer_addr: Dict[int, ReplicaAddress], group: int) -> Dict[int, ReplicaAddress]:
+        by = group * self.port_stride
+
+        return {
+            k: ReplicaAddress(_shift_port(x.replica_addr, by), _shift_port(x.client_addr, by))
+            for k, x in peer_addr.items()
+        }
@@ -1,78 +1,82 @@
 import logging
-import random
+from datetime import datetime
 from itertools import groupby
 from typing import NamedTuple, Dict, Any, List
 
 from dsm.epaxos.cmd.state import Command, CommandID, Checkpoint
 from dsm.epaxos.inst.state import Slot, Stage
-from dsm.epaxos.inst.store import between_checkpoints, CheckpointCycle
+from dsm.epaxos.inst.store import CheckpointCycle, SlotTooOld, SlotWindow
 from dsm.epaxos.net import packet
 from dsm.epaxos.net.packet import PACKET_ACCEPTOR
 from dsm.epaxos.replica.acceptor.getsizeof import getsize
-from dsm.epaxos.replica.acceptor.sub import acceptor_single_ep
-from dsm.epaxos.replica.corout import coroutiner, CoExit
-from dsm.epaxos.replica.leader.ev import LeaderStart, LeaderExplicitPrepare
+from dsm.epaxos.replica.acceptor.sub import acceptor_prepare_batch, acceptor_commit_batch, acceptor_prepare, \
+    ACCEPTOR_HANDLERS
+from dsm.epaxos.replica.acceptor.timeout import TimeoutEstimator
+from dsm.epaxos.replica.leader.ev import LeaderStart, LeaderExplicitPrepareBatch
 from dsm.epaxos.replica.main.ev import Wait, Tick, Reply
-from dsm.epaxos.replica.net.ev import Receive
+from dsm.epaxos.replica.pingpong.ev import PeerRTT
 from dsm.epaxos.replica.quorum.ev import Quorum, Configuration
 from dsm.epaxos.replica.state.ev import InstanceState, CheckpointEvent
+from dsm.epaxos.stats.metrics import Registry
 
 logger = logging.getLogger('acceptor')
 
 
 class AcceptorCoroutine:
+    """
+    Acceptor requests are answered by the stateless handlers in `acceptor.sub` - everything we know about a slot
+    is kept in the `InstanceStore`. The only per-slot state kept here is the explicit prepare timeouts.
+    """
+
     def __init__(
         self,
         quorum: Quorum,
         config: Configuration,
-        subs: Dict[Slot, Any] = dict(),
-        waiting_for={},
-        timeouts_slots: Dict[int, Dict[Slot, bool]] = {},
-        slots_timeouts: Dict[Slot, int] = {}
+        clock=datetime.now,
+        metrics: Registry = None,
     ):
         self.quorum = quorum
         self.config = config
-        self.subs = subs
-        self.waiting_for = waiting_for
-        self.timeouts_slots = timeouts_slots
-        self.slots_timeouts = slots_timeouts
+        self.clock = clock
+        self.timeouts_slots = {}  # type: Dict[int, Dict[Slot, bool]]
+        self.slots_timeouts = {}  # type: Dict[Slot, int]
         self.last_cp = None
         self.cp = CheckpointCycle()
 
+        self.timeout = TimeoutEstimator(quorum, config)
+        self.slots_attempts = SlotWindow()  # type: SlotWindow
+        self.slots_started = SlotWindow()  # type: SlotWindow
+
         self.tick = 0
 
-    def run_sub(self, slot: Slot, payload=None):
-        corout = self.subs[slot]
-        try:
-            req = coroutiner(corout, payload)
-            while not isinstance(req, Receive):
-                try:
-                    rep = yield req
-                except BaseException as e:
-                    req = corout.throw(e)
-                else:
-                    req = coroutiner(corout, rep)
-            req: Receive
-            self.waiting_for[slot] = req.type
-        except CoExit:
-            if slot in self.waiting_for:
-                del self.waiting_for[slot]
-            if slot in self.subs:
-                del self.subs[slot]
-        # except BaseException as e:
-        #     corout.throw(e)
+        metrics = metrics if metrics is not None else Registry()
+        self.m_prepares = metrics.counter('prepares', 'Explicit prepares started after a timeout')
+        self.m_prepares_spurious = metrics.counter(
+            'prepares_spurious', 'Explicit prepares received for slots we have already committed')
+        self.m_timeouts = metrics.gauge('timeouts_pending', 'Slots with a running prepare timeout')
+        self.m_timeout = metrics.gauge('timeout_seconds', 'Current explicit prepare timeout')
 
     def event(self, x):
-        if isinstance(x, packet.Packet) and isinstance(x.payload, PACKET_ACCEPTOR):
+        if isinstance(x, packet.Packet) and isinstance(x.payload, packet.PrepareBatchRequest):
+            rep = yield from acceptor_prepare_batch(self.quorum, x.origin, x.payload)
+
+            self.m_prepares_spurious.inc(sum(1 for ack in rep.acks if ack.state >= Stage.Committed))
+        elif isinstance(x, packet.Packet) and isinstance(x.payload, packet.CommitBatchRequest):
+            yield from acceptor_commit_batch(self.quorum, x.origin, x.payload)
+        elif isinstance(x, packet.Packet) and isinstance(x.payload, PACKET_ACCEPTOR):
             slot = x.payload.slot
 
-            if slot not in self.subs:
-                self.subs[slot] = acceptor_single_ep(self.quorum, slot)
-                yield from self.run_sub(slot)
+            if isinstance(x.payload, packet.PreAcceptRequest) and x.payload.commits:
+                yield from acceptor_commit_batch(self.quorum, x.origin, x.payload.commits)
+
+            if isinstance(x.payload, packet.PrepareRequest):
+                inst = yield from acceptor_prepare(self.quorum, slot, x.origin, x.payload)
 
-            if slot in self.waiting_for:
-                rcv = Receive.from_waiting(self.waiting_for.pop(slot), x.payload)
-                yield from self.run_sub(slot, (x.origin, rcv))
+                # a prepare for an instance we have already committed means the timeout of the sender was too low
+                if inst and inst.state.stage >= Stage.Committed:
+                    self.m_prepares_spurious.inc()
+            elif x.payload.__class__ in ACCEPTOR_HANDLERS:
+                yield from ACCEPTOR_HANDLERS[x.payload.__class__](self.quorum, slot, x.origin, x.payload)
         elif isinstance(x, InstanceState):
             if x.slot in self.slots_timeouts:
                 slot_tick = self.slots_timeouts[x.slot]
@@ -83,7 +87,10 @@ class AcceptorCoroutine:
                     del self.slots_timeouts[x.slot]
 
             if x.inst.state.stage < Stage.Committed:
-                tick = self.tick + self.config.timeout + random.randint(0, self.config.timeout_range)
+                if x.slot not in self.slots_started:
+                    self.slots_started[x.slot] = self.tick
+
+                tick = self.tick + self.timeout.ticks(self.slots_attempts.get(x.slot, 0))
                 # print(self.quorum.replica_id, 'SET TIMEOUT ', self.tick, tick)
 
                 self.slots_timeouts[x.slot] = tick
@@ -93,10 +100,13 @@ class AcceptorCoroutine:
                 self.timeouts_slots[tick][x.slot] = True
 
             if x.inst.state.stage >= Stage.Committed:
-                if x.slot in self.waiting_for:
-                    del self.waiting_for[x.slot]
-                if x.slot in self.subs:
-                    del self.subs[x.slot]
+                started = self.slots_started.pop(x.slot, None)
+
+                if started is not None and x.slot not in self.slots_attempts:
+                    self.timeout.commit_latency((self.tick - started) * self.config.seconds_per_tick)
+
+                if x.slot in self.slots_attempts:
+                    del self.slots_attempts[x.slot]
 
         elif isinstance(x, Tick):
             self.tick = x.id
@@ -107,15 +117,24 @@ class AcceptorCoroutine:
                 for slot, truth in self.timeouts_slots[x.id].items():
                     to_start.append(slot)
                     del self.slots_timeouts[slot]
+                    self.slots_attempts[slot] = self.slots_attempts.get(slot, 0) + 1
                 del self.timeouts_slots[x.id]
 
-                for slot in to_start:
-                    yield LeaderExplicitPrepare(
-                        slot,
+                self.m_prepares.inc(len(to_start))
+
+                # slots of the same (probably failed) leader are prepared together
+                for _, slots in groupby(sorted(to_start, key=Slot.pack), key=lambda x: x.replica_id):
+                    yield LeaderExplicitPrepareBatch(
+                        list(slots),
                         'TIMEOUT'
                     )
 
-            if x.id % self.config.checkpoint_each == 0:
+            self.m_timeouts.set(len(self.slots_timeouts))
+
+            if x.id % self.config.jiffies == 0:
+                self.m_timeout.set(self.timeout.seconds())
+
+            if x.id % self.config.checkpoint_each == 0 and not self.config.checkpoint_window:
                 checkpoint_id = x.id // self.config.checkpoint_each
                 r_idx = sorted(self.quorum.peers + [self.quorum.replica_id]).index(self.quorum.replica_id)
 
@@ -124,7 +143,7 @@ class AcceptorCoroutine:
                 if checkpoint_id % q_length == r_idx:
                     import sys
                     cp_cmd = Command(
-                        CommandID.create(),
+                        CommandID.create(self.quorum.replica_id, self.clock()),
                         Checkpoint(
                             checkpoint_id * q_length + r_idx
                         )
@@ -149,18 +168,15 @@ class AcceptorCoroutine:
                 # logger.debug(
                 #     f'\n{self.quorum.replica_id}\t{x.id}\n\tInstances:\n{fmtd}\n\tPackets:\n{fmtd3}')
         elif isinstance(x, CheckpointEvent):
-            ctr = 0
-            for slot in between_checkpoints(*self.cp.cycle(x.at)):
+            self.cp.cycle(x.at)
 
-                if slot in self.subs:
-                    ctr += 1
-                    del self.subs[slot]
-                if slot in self.waiting_for:
-                    ctr += 1
-                    del self.waiting_for[slot]
+            ctr = 0
+            for window in (self.slots_attempts, self.slots_started):
+                ctr += sum(len(v) for v in window.purge(self.cp.cp_old).values())
 
             logger.error(f'{self.quorum.replica_id} cleaned old things between {ctr}: {self.cp}')
-
+        elif isinstance(x, PeerRTT):
+            self.timeout.peer_rtt(x.peer, x.rtt)
         else:
             assert False, x
 
@@ -2,37 +2,11 @@ from dsm.epaxos.inst.state import Slot, State, Stage
 from dsm.epaxos.inst.store import InstanceStoreState, IncorrectStage, IncorrectBallot, SlotTooOld
 from dsm.epaxos.net import packet
 from dsm.epaxos.replica.leader.ev import LeaderStop
-from dsm.epaxos.replica.net.ev import Send, Receive
+from dsm.epaxos.replica.net.ev import Send
 from dsm.epaxos.replica.quorum.ev import Quorum
 from dsm.epaxos.replica.state.ev import Load, Store
 
 
-def acceptor_single_ep(q: Quorum, slot: Slot):
-    while True:
-
-        peer, (pre_accept, accept, commit, prepare) = yield Receive.any(
-            packet.PreAcceptRequest,
-            packet.AcceptRequest,
-            packet.CommitRequest,
-            packet.PrepareRequest,
-            # Timeout
-        )
-
-        if pre_accept:
-            yield from acceptor_pre_accept(q, slot, peer, pre_accept)
-
-        if accept:
-            yield from acceptor_accept(q, slot, peer, accept)
-
-        if commit:
-            yield from acceptor_commit(q, slot, peer, commit)
-
-        if prepare:
-            yield from acceptor_prepare(q, slot, peer, prepare)
-
-        # if timeout:
-
-
 def acceptor_pre_accept(q: Quorum, slot: Slot, peer: int, pre_accept: packet.PreAcceptRequest):
     try:
         inst = yield Store(
@@ -140,6 +114,74 @@ def acceptor_commit(q: Quorum, slot: Slot, peer: int, commit: packet.CommitReque
         yield Send(peer, packet.DivergedResponse(slot))
 
 
+def acceptor_commit_batch(q: Quorum, peer: int, commit: packet.CommitBatchRequest):
+    # the leader only sends (slot, ballot) pairs to peers that hold the committed attributes at that exact ballot
+    for slot, ballot in zip(commit.slots, commit.ballots):
+        try:
+            inst = yield Load(slot)  # type: InstanceStoreState
+        except SlotTooOld:
+            continue
+
+        if inst.ballot != ballot or not (Stage.PreAccepted <= inst.state.stage < Stage.Committed):
+            continue
+
+        try:
+            yield Store(
+                slot,
+                InstanceStoreState(
+                    ballot,
+                    State(
+                        Stage.Committed,
+                        inst.state.command,
+                        inst.state.seq,
+                        inst.state.deps
+                    )
+                )
+            )
+        except (IncorrectBallot, IncorrectStage):
+            continue
+
+        yield LeaderStop(slot, 'acceptor')
+
+
+def acceptor_prepare_batch(q: Quorum, peer: int, prepare: packet.PrepareBatchRequest):
+    acks = []
+    nacks = []
+    diverged = []
+
+    for slot, ballot in zip(prepare.slots, prepare.ballots):
+        try:
+            inst = yield Load(slot)  # type: InstanceStoreState
+        except SlotTooOld:
+            diverged.append(slot)
+            continue
+
+        if ballot < inst.ballot:
+            nacks.append(
+                packet.PrepareResponseNack(
+                    slot,
+                    inst.ballot
+                )
+            )
+        else:
+            acks.append(
+                packet.PrepareResponseAck(
+                    slot,
+                    ballot,
+                    inst.state.command,
+                    inst.state.seq,
+                    inst.state.deps,
+                    inst.state.stage
+                )
+            )
+
+    rep = packet.PrepareBatchResponse(prepare.id, acks, nacks, diverged)
+
+    yield Send(peer, rep)
+
+    return rep
+
+
 def acceptor_prepare(q: Quorum, slot: Slot, peer: int, prepare: packet.PrepareRequest):
     try:
         inst = yield Load(slot)  # type: InstanceStoreState
@@ -154,7 +196,7 @@ def acceptor_prepare(q: Quorum, slot: Slot, peer: int, prepare: packet.PrepareRe
                     inst.ballot
                 )
             )
-            return
+            return inst
 
         yield Send(
             peer,
@@ -167,3 +209,13 @@ def acceptor_prepare(q: Quorum, slot: Slot, peer: int, prepare: packet.PrepareRe
                 inst.state.stage
             )
         )
+
+        return inst
+
+
+ACCEPTOR_HANDLERS = {
+    packet.PreAcceptRequest: acceptor_pre_accept,
+    packet.AcceptRequest: acceptor_accept,
+    packet.CommitRequest: acceptor_commit,
+    packet.PrepareRequest: acceptor_prepare,
+}
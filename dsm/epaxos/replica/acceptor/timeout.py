@@ -0,0 +1,70 @@
+import math
+import random
+from typing import Dict, List
+
+from dsm.epaxos.replica.quorum.ev import Quorum, Configuration
+
+
+class TimeoutEstimator:
+    """
+    Derive the explicit prepare timeout from what we know about the network and the load of the quorum.
+
+     - peer RTTs as collected by the `PingPongActor`: we can't hear back from a majority earlier than the RTT of the
+       slowest peer within the fastest `slow_size - 1` peers.
+     - commit latencies observed by the acceptor: a smoothed mean and deviation (as in TCP RTO), which grows when the
+       replicas are busy and therefore stops timeouts from firing on instances that are simply slow.
+
+    Every failed prepare of a slot doubles its timeout, up to `Configuration.timeout_max`.
+    """
+
+    def __init__(self, quorum: Quorum, config: Configuration, keep_times=10):
+        self.quorum = quorum
+        self.config = config
+        self.keep_times = keep_times
+
+        self.rtts = {}  # type: Dict[int, List[float]]
+
+        self.commit_avg = None  # type: float
+        self.commit_dev = 0.
+
+    def peer_rtt(self, peer: int, rtt: float):
+        self.rtts[peer] = (self.rtts.get(peer, []) + [rtt])[-self.keep_times:]
+
+    def commit_latency(self, latency: float):
+        if self.commit_avg is None:
+            self.commit_avg = latency
+            self.commit_dev = latency / 2
+        else:
+            self.commit_dev = 0.75 * self.commit_dev + 0.25 * abs(self.commit_avg - latency)
+            self.commit_avg = 0.875 * self.commit_avg + 0.125 * latency
+
+    def quorum_rtt(self):
+        peer_rtts = sorted(max(v) for v in self.rtts.values() if len(v))
+
+        if len(peer_rtts) < self.quorum.slow_size - 1:
+            return None
+
+        return peer_rtts[self.quorum.slow_size - 2]
+
+    def seconds(self):
+        rtt = self.quorum_rtt()
+        r = self.config.timeout * self.config.seconds_per_tick
+
+        if rtt is not None:
+            r = max(r, rtt * self.config.timeout_rtt_mult)
+
+        if self.commit_avg is not None:
+            r = max(r, self.commit_avg + 4 * self.commit_dev)
+
+        return r
+
+    def ticks(self, attempt=0):
+        ticks = math.ceil(self.seconds() / self.config.seconds_per_tick)
+        ticks = min(ticks * 2 ** min(attempt, 16), self.config.timeout_max)
+        return ticks + random.randint(0, self.config.timeout_range)
+
+    def __repr__(self):
+        rtt = self.quorum_rtt()
+        rtt = f'{rtt * 1000:0.2f}ms' if rtt is not None else None
+        commit = f'{self.commit_avg * 1000:0.2f}ms' if self.commit_avg is not None else None
+        return f'TimeoutEstimator({rtt},{commit},{self.seconds() * 1000:0.2f}ms)'
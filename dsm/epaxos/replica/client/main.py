@@ -1,70 +1,145 @@
 import logging
-from typing import Optional
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict, List
+
+from dsm.epaxos.cmd.state import CommandID
 
 from dsm.epaxos.inst.state import Stage, Slot
-from dsm.epaxos.inst.store import InstanceStoreState
+from dsm.epaxos.inst.store import InstanceStoreState, SlotTooOld
 from dsm.epaxos.net import packet
 from dsm.epaxos.net.packet import Packet
 from dsm.epaxos.replica.leader.ev import LeaderStart
 from dsm.epaxos.replica.main.ev import Wait, Reply, Tick
 from dsm.epaxos.replica.net.ev import Send
 from dsm.epaxos.replica.quorum.ev import Quorum
-from dsm.epaxos.replica.state.ev import LoadCommandSlot, InstanceState
+from dsm.epaxos.replica.state.ev import LoadCommandSlot, InstanceState, CheckpointEvent, Load
+from dsm.epaxos.stats.metrics import Registry
 
 logger = logging.getLogger('clients')
 
 
 class ClientsActor:
-    def __init__(self, quorum: Quorum):
+    def __init__(self, quorum: Quorum, clock=datetime.now, metrics: Registry = None):
         self.quorum = quorum
+        self.clock = clock
         self.peers = {}  # type: Dict[int, List[Slot]]
         self.clients = {}
 
-        self.st_starts = 0
-        self.st_restarts = 0
-
-    def event(self, x):
-        if isinstance(x, Packet):
-            assert isinstance(x.payload, packet.ClientRequest)
-
-            # we may use the clientrequest as a way of keeping the knowledge of whom to reply.
-            # client dests are then
+        # the slots of the requests we have started, by `CommandID.request`. Kept until the request is older than the
+        # checkpoint before the last one: a request older than that is rejected, since it may have been purged.
+        self.requests = {}  # type: Dict[CommandID, Slot]
+        self.cp_ts = deque([0, 0], maxlen=2)
+        self.too_old = 0
+
+        metrics = metrics if metrics is not None else Registry()
+        self.m_requests = metrics.counter('client_requests', 'Client requests by whether we knew the command', ('kind',))
+        self.m_starts = self.m_requests.labels('start')
+        self.m_restarts = self.m_requests.labels('restart')
+        self.m_rejects = self.m_requests.labels('rejected')
+        self.m_waiting = metrics.gauge('clients_waiting', 'Client requests waiting for a commit')
+
+    def validate(self, id: CommandID) -> Optional[str]:
+        if id.leader != 0 and id.leader != self.quorum.replica_id and id.leader not in self.quorum.peers:
+            return 'LEADER'
+        elif id.timestamp < self.too_old and id.request not in self.requests:
+            return 'TOO_OLD'
+        else:
+            return None
+
+    def request(self, x: Packet):
+        """
+        A request the client has been told the slot of (`ClientStarted`) comes with its ID bound to it, and is found
+        in the slot by any replica that has seen the PreAccept of it. Otherwise the request is started in a slot of
+        our own. If the client resends it before the PreAccept has reached us, the request ends up in two slots, and
+        the executor only executes the first of them (see `ExecutorActor.requests`).
+        """
+        command = x.payload.command
+        reason = self.validate(command.id)
+
+        loaded = None
+
+        if reason is None:
+            # bound by the client, or started by us
+            slot = command.id.slot or self.requests.get(command.id.request)
+            id = command.id.bind(*slot) if slot is not None else command.id
+
+            try:
+                loaded = yield LoadCommandSlot(id)
+            except SlotTooOld:
+                reason = 'TOO_OLD'
+
+        if reason is not None:
+            self.m_rejects.inc()
+            yield Send(
+                x.origin,
+                packet.ClientRejected(
+                    command,
+                    reason
+                )
+            )
+            return
+
+        if loaded is None:
+            # a new request, or its slot was taken over by an empty command, or we have not seen its PreAccept yet
+            self.m_starts.inc()
+            slot = yield LeaderStart(command)
+            self.requests[command.id.request] = slot
+        else:
+            self.m_restarts.inc()
+            slot, inst = loaded
+            self.requests[command.id.request] = slot
 
-            loaded = yield LoadCommandSlot(x.payload.command.id)
+            inst: Optional[InstanceStoreState]
 
+            # logger.error(f'{self.quorum.replica_id} Learned about a new client {x.origin} of slot {slot} {inst.state.command}')
 
-            # todo: this. here we assume that slots are not correlated with commands.
+            if inst.state.stage >= Stage.Committed:
+                yield Send(
+                    x.origin,
+                    packet.ClientResponse(
+                        inst.state.command
+                    )
+                )
 
-            if loaded is None:
-                self.st_starts += 1
-                slot = yield LeaderStart(x.payload.command)
-            else:
-                self.st_restarts += 1
-                slot, inst = loaded
+        slot: Slot
 
-                inst: Optional[InstanceStoreState]
+        if command.id.slot != slot and (loaded is None or inst.state.stage < Stage.Committed):
+            yield Send(
+                x.origin,
+                packet.ClientStarted(
+                    command._replace(id=command.id.bind(*slot))
+                )
+            )
 
-                # logger.error(f'{self.quorum.replica_id} Learned about a new client {x.origin} of slot {slot} {inst.state.command}')
+        if slot not in self.clients:
+            self.m_waiting.inc()
+        self.clients[slot] = x.origin
 
-                if inst.state.stage >= Stage.Committed:
-                    yield Send(
-                        x.origin,
-                        packet.ClientResponse(
-                            inst.state.command
-                        )
-                    )
+        if x.origin not in self.peers:
+            self.peers[x.origin] = []
 
-            slot: Slot
+        self.peers[x.origin].append(slot)
 
-            self.clients[slot] = x.origin
+    def event(self, x):
+        if isinstance(x, Packet):
+            assert isinstance(x.payload, packet.ClientRequest)
+            yield from self.request(x)
+        elif isinstance(x, Tick):
+            pass
+        elif isinstance(x, CheckpointEvent):
+            if x.slot is not None:
+                inst = yield Load(x.slot)  # type: InstanceStoreState
+                ts = inst.state.command.id.timestamp if inst.state.command is not None else None
+            else:
+                ts = int(self.clock().timestamp() * 1000)
 
-            if x.origin not in self.peers:
-                self.peers[x.origin] = []
+            if ts is not None:
+                self.too_old = self.cp_ts[0]
+                self.cp_ts.append(ts)
 
-            self.peers[x.origin].append(slot)
-        elif isinstance(x, Tick):
-            if x.id % 330 == 0:
-                logger.error(f'{self.quorum.replica_id} St={self.st_starts}/{self.st_restarts}')
+                for k in [k for k in self.requests.keys() if k.timestamp < self.too_old]:
+                    del self.requests[k]
         elif isinstance(x, InstanceState):
             if x.slot in self.clients and x.inst.state.stage == Stage.Committed:
                 # print('REPLY')
@@ -80,6 +155,7 @@ class ClientsActor:
                 peer.remove(x.slot)
 
                 del self.clients[x.slot]
+                self.m_waiting.dec()
         else:
             assert False, x
         yield Reply()
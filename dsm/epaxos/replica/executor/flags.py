@@ -0,0 +1,76 @@
+from typing import Dict
+
+from dsm.epaxos.inst.state import Slot
+
+COMMITTED = 1
+EXECUTED = 2
+
+_DONE = COMMITTED | EXECUTED
+
+
+class SlotFlags:
+    """
+    The commits and executions seen by the executor, as a window of flags per origin replica that starts at the first
+    slot not executed yet: every slot below it has been.
+
+    A slot is only executed once it has been committed, so the executed prefix of a window is a run of `_DONE` bytes,
+    and its end is found by `bytearray.find` instead of checking the slots one by one.
+    """
+
+    def __init__(self):
+        self.bases = {}  # type: Dict[int, int]
+        self.flags = {}  # type: Dict[int, bytearray]
+
+    def get(self, slot: Slot) -> int:
+        origin, instance_id = slot
+        i = instance_id - self.bases.get(origin, 0)
+
+        if i < 0:
+            return _DONE
+
+        flags = self.flags.get(origin)
+
+        if flags is None or i >= len(flags):
+            return 0
+
+        return flags[i]
+
+    def set(self, slot: Slot, flag: int) -> bool:
+        """
+        :return: if the executed cut of the origin of `slot` has moved
+        """
+        origin, instance_id = slot
+        base = self.bases.get(origin, 0)
+        i = instance_id - base
+
+        if i < 0:
+            return False
+
+        flags = self.flags.get(origin)
+
+        if flags is None:
+            flags = self.flags[origin] = bytearray()
+            self.bases[origin] = base
+
+        if i >= len(flags):
+            flags.extend(bytes(i - len(flags) + 1))
+
+        flags[i] |= flag
+
+        if i > 0 or flags[0] != _DONE:
+            return False
+
+        n = min((x for x in (flags.find(0), flags.find(COMMITTED)) if x >= 0), default=len(flags))
+
+        del flags[:n]
+        self.bases[origin] = base + n
+        return True
+
+    def cut(self, origin: int) -> Slot:
+        """
+        :return: the last slot executed of `origin`
+        """
+        return Slot(origin, self.bases.get(origin, 0) - 1)
+
+    def __repr__(self):
+        return f'SlotFlags({self.bases},{ {k: len(v) for k, v in self.flags.items()} })'
@@ -0,0 +1,62 @@
+from typing import Dict, Optional, Set
+
+from dsm.epaxos.inst.state import Slot
+from dsm.epaxos.replica.quorum.ev import Quorum
+
+CUT_T = Dict[int, Slot]
+
+
+class LowWaterMark:
+    """
+    The slots every live replica has executed, from the executed cuts the replicas send each other
+    (`ExecutedFrontier`). Nobody needs the instances below it any more, so they are purged without agreeing on
+    a `Checkpoint` command first, which every later command would have to wait for.
+
+    Only a replica the failure detector takes for dead (`PeerAlive`) is left out, so that it does not stop the purges;
+    it will find the slots it missed have diverged once it is back. A replica that is alive but slow holds the mark
+    at its last cut, and there is no mark until every live peer has sent one, and a slow quorum of cuts (ours
+    included) is there.
+    """
+
+    def __init__(self, quorum: Quorum):
+        self.quorum = quorum
+
+        self.cuts = {}  # type: Dict[int, CUT_T]
+        self.dead = set()  # type: Set[int]
+        self.last = {}  # type: CUT_T
+
+    def update(self, peer: int, cut: CUT_T):
+        self.cuts[peer] = cut
+
+    def alive(self, peer: int, alive: bool):
+        if alive:
+            self.dead.discard(peer)
+        else:
+            self.dead.add(peer)
+
+    def mark(self, cut: CUT_T) -> Optional[CUT_T]:
+        """
+        :param cut: the executed cut of this replica
+        :return: the first slot of every origin that not every live replica has executed
+        """
+        live = [x for x in self.quorum.peers if x not in self.dead]
+
+        if any(x not in self.cuts for x in live):
+            return None
+
+        cuts = [cut] + [self.cuts[x] for x in live]
+
+        if len(cuts) < self.quorum.slow_size:
+            return None
+
+        for origin in cut.keys():
+            low = min(x.get(origin, Slot(origin, -1)) for x in cuts).next()
+
+            # a replica that is back after having been left out must not move the mark back
+            if low > self.last.get(origin, Slot(origin, 0)):
+                self.last[origin] = low
+
+        return dict(self.last) if len(self.last) else None
+
+    def __repr__(self):
+        return f'LowWaterMark({sorted(self.last.items())},{sorted(self.cuts.keys())},{sorted(self.dead)})'
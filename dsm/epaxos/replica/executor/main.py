@@ -1,16 +1,25 @@
 import logging
 from collections import deque
+from datetime import datetime
 from pprint import pprint
 from typing import NamedTuple, Dict, Deque, List, Optional, Tuple, Set
 
 from tarjan import tarjan
 
-from dsm.epaxos.cmd.state import Command, Checkpoint
+from dsm.epaxos.cmd.state import Command, Checkpoint, CommandID
 from dsm.epaxos.inst.state import Slot, Stage
 from dsm.epaxos.inst.store import InstanceStore, InstanceStoreState
+from dsm.epaxos.net import packet
+from dsm.epaxos.replica.executor.flags import SlotFlags, COMMITTED, EXECUTED
+from dsm.epaxos.replica.executor.frontier import LowWaterMark
 from dsm.epaxos.replica.main.ev import Reply, Tick
-from dsm.epaxos.replica.quorum.ev import Quorum
+from dsm.epaxos.replica.net.ev import Send
+from dsm.epaxos.replica.pingpong.ev import PeerAlive
+from dsm.epaxos.replica.quorum.ev import Quorum, Configuration
 from dsm.epaxos.replica.state.ev import InstanceState, CheckpointEvent
+from dsm.epaxos.stats.histogram import Histogram
+from dsm.epaxos.stats.metrics import Registry
+from dsm.epaxos.stats.trace import Tracer, EXECUTE, READY
 
 logger = logging.getLogger('executor')
 
@@ -119,6 +128,8 @@ class DepthFirstHelper:
     def __init__(self):
         self.ccs = {}  # type: Dict[int, CC]
         self.next_idx = 0
+        # sum of `CC.depth` over `ccs`
+        self.depth = 0
 
     def ready(self, slot: Slot, deps: List[Slot]):
         new_cc = CC.from_item(
@@ -134,12 +145,14 @@ class DepthFirstHelper:
 
         for overlap in overlaps:
             new_cc.merge(self.ccs[overlap])
+            self.depth -= self.ccs[overlap].depth()
             del self.ccs[overlap]
 
         if new_cc.done():
             return list(new_cc.items | new_cc.outs)
         else:
             self.ccs[self.next_idx] = new_cc
+            self.depth += new_cc.depth()
             # print(self.ccs[self.next_idx])
 
             self.next_idx += 1
@@ -147,56 +160,68 @@ class DepthFirstHelper:
 
 
 class ExecutorActor:
-    def __init__(self, quorum: Quorum, store: InstanceStore):
+    def __init__(self, quorum: Quorum, store: InstanceStore, config: Configuration, clock=datetime.now,
+                 metrics: Registry = None, tracer: Tracer = None):
         self.quorum = quorum
         self.store = store
+        self.config = config
+        self.clock = clock
 
+        # the last slot executed of every origin, below which every slot has been
         self.executed_cut = {}  # type: Dict[int, Slot]
-        self.executed = {}  # type: Dict[Slot, bool]
-        self.executing = {}  # type: Dict[Slot, bool]
+        # the slots committed and executed above the cut
+        self.flags = SlotFlags()
 
-        self._log = open(f'executor-{self.quorum.replica_id}.log', 'w+')
+        self.trace = tracer if tracer is not None else Tracer()
 
         self.dph = DepthFirstHelper()
         self.ctr = 0
 
-        self.st_exec = 0
-        self.st_max_depth = 0
+        self.tick = 0
+        self.marks = LowWaterMark(quorum)
 
-        # self.commit_expected = defaultdict(set)  # type: Dict[Slot, Set[Slot]]
+        # the requests executed, by `CommandID.request`: one resent to a replica that had not seen it yet is started in
+        # a second slot, which is not executed again. The copies interfere, so every replica executes the same one
+        # first. Kept for as long as `ClientsActor` takes the request, until the checkpoint before the last one.
+        self.requests = set()  # type: Set[CommandID]
+        self.cp_ts = deque([0, 0], maxlen=2)
 
-    def log(self, fn: lambda: None):
-        self._log.write(fn())
-        self._log.flush()
+        # Commit -> Execute
+        self.committed_at = {}  # type: Dict[Slot, datetime]
+        self.lat_execute = Histogram()
 
-    def is_cut(self, slot: Slot):
-        return self.executed_cut.get(slot.replica_id, Slot(slot.replica_id, -1)) >= slot
+        metrics = metrics if metrics is not None else Registry()
+        self.m_exec = metrics.counter('executed', 'Instances executed')
+        self.m_ccs = metrics.gauge('executor_pending', 'Strongly connected components waiting for their dependencies')
+        self.m_depth = metrics.gauge('executor_depth', 'Total depth of the pending components')
+        self.m_marks = metrics.counter('low_water_marks', 'Checkpoints at the slots executed by every live replica')
+        self.m_duplicates = metrics.counter('executed_duplicates', 'Commands not executed, as their request had been')
+        metrics.summary('execute_latency_seconds', 'Commit -> Execute', hist=self.lat_execute)
+        self.spans = metrics.spans()
 
-    def set_executed(self, slot: Slot):
-        assert self.is_committed(slot), (slot, self.store.load(slot))
-        assert not self.is_executed(slot), (slot, self.store.load(slot))
-        self.executed[slot] = True
-        self.st_exec += 1
+        # self.commit_expected = defaultdict(set)  # type: Dict[Slot, Set[Slot]]
 
-        slot = slot
+    def set_executed(self, slot: Slot):
+        assert self.is_committed(slot), (slot, self.flags)
+        assert not self.is_executed(slot), (slot, self.flags)
 
-        while self.is_executed(self.executed_cut.get(slot.replica_id, Slot(slot.replica_id, -1)).next()):
-            self.executed_cut[slot.replica_id] = slot
-            del self.executed[slot]
+        if self.flags.set(slot, EXECUTED):
+            self.executed_cut[slot.replica_id] = self.flags.cut(slot.replica_id)
 
-            slot = slot.next()
+        self.m_exec.inc()
 
-    def is_executing(self, slot):
-        return self.is_cut(slot) or self.executing.get(slot, False)
+        if slot in self.committed_at:
+            self.lat_execute.record((self.clock() - self.committed_at.pop(slot)).total_seconds())
 
     def is_executed(self, slot: Slot):
-        return self.is_cut(slot) or self.executed.get(slot, False)
+        return self.flags.get(slot) & EXECUTED
 
     def is_committed(self, slot: Slot):
-        return self.is_cut(slot) or self.store.load(slot).inst.state.stage >= Stage.Committed
+        return self.flags.get(slot) & COMMITTED
 
     def execute_command(self, slot: Slot, cmd: Command):
-        self.log(lambda: f'{self.quorum.replica_id}\tCOMM\t{slot}\t{cmd}\t{self.executed_cut}\t{self.ctr}\n')
+        if self.trace.info:
+            self.trace(EXECUTE, slot.replica_id, slot.instance_id, isinstance(cmd and cmd.payload, Checkpoint), self.ctr)
 
         if cmd:
             if cmd.payload:
@@ -212,42 +237,90 @@ class ExecutorActor:
         cps = []
         for x in cc:
             self.set_executed(x)
-            x = self.execute_command(x, insts[x].state.command)
+            cmd = insts[x].state.command
+
+            if cmd is not None and not isinstance(cmd.payload, Checkpoint):
+                if cmd.id.request in self.requests:
+                    self.m_duplicates.inc()
+                    continue
+
+                self.requests.add(cmd.id.request)
+
+            x = self.execute_command(x, cmd)
             if x:
                 cps.append(x)
 
         return cps
 
+    def expire_requests(self, ts: int):
+        """
+        :param ts: the timestamp of a checkpoint, see `ClientsActor`
+        """
+        too_old = self.cp_ts[0]
+        self.cp_ts.append(ts)
+
+        for k in [k for k in self.requests if k.timestamp < too_old]:
+            self.requests.remove(k)
+
+    def checkpoint_window(self, tick: int):
+        if tick % self.config.frontier_each == 0:
+            cut = sorted(self.executed_cut.values())
+
+            for peer in self.quorum.peers:
+                yield Send(peer, packet.ExecutedFrontier(cut))
+
+        if tick % self.config.checkpoint_each == 0:
+            mark = self.marks.mark(self.executed_cut)
+
+            if mark is not None:
+                self.m_marks.inc()
+                self.expire_requests(int(self.clock().timestamp() * 1000))
+                yield CheckpointEvent(None, mark)
+
     def event(self, x):
         if isinstance(x, InstanceState):
 
             if x.inst.state.stage >= Stage.Committed:
-                # self.log(lambda: f'{self.quorum.replica_id}\tSTAT\t{x.slot}\t{x.inst}\n')
-                if not self.is_executed(x.slot) and not self.is_executing(x.slot):
-                    self.executing[x.slot] = True
+                if not self.is_committed(x.slot):
+                    self.flags.set(x.slot, COMMITTED)
+                    self.committed_at[x.slot] = self.clock()
                     self.ctr += 1
-                    self.log(lambda: f'{self.quorum.replica_id}\tDPH0\t{self.dph.ccs}\n')
 
-                    unlocked_list = self.dph.ready(x.slot, [x for x in x.inst.state.deps if not self.is_executed(x)])
-                    self.log(lambda: f'{self.quorum.replica_id}\tDPH1\t{self.dph.ccs}\n')
-                    self.log(lambda: f'{self.quorum.replica_id}\tDPH2\t{unlocked_list}\n')
+                    t = self.spans.start()
+                    waiting = [x for x in x.inst.state.deps if not self.is_executed(x)]
+                    unlocked_list = self.dph.ready(x.slot, waiting)
 
-                    # if self.ctr % 100:
-                    #     self.log(lambda: f'{self.quorum.replica_id}\tDPHX\t{self.dph.ccs}\n')
+                    if self.trace.debug:
+                        self.trace(
+                            READY, x.slot.replica_id, x.slot.instance_id, len(waiting), len(unlocked_list),
+                            len(self.dph.ccs), self.dph.depth
+                        )
 
                     try:
-                        for checkpoint in self.build_execute_pending(unlocked_list):
+                        checkpoints = self.build_execute_pending(unlocked_list)
+                        self.spans.stop('execute', t)
+
+                        for checkpoint in checkpoints:
                             xx = self.store.load(checkpoint).inst
+                            self.expire_requests(xx.state.command.id.timestamp)
                             yield CheckpointEvent(checkpoint, {x.replica_id: x for x in xx.state.deps})
                     except:
-                        self.log(lambda: f'{self.quorum.replica_id}\tDPHz\t{self.dph.ccs}\n')
+                        logger.error(f'{self.quorum.replica_id} {unlocked_list} {self.dph.ccs}')
                         raise
+        elif isinstance(x, packet.Packet) and isinstance(x.payload, packet.ExecutedFrontier):
+            self.marks.update(x.origin, {s.replica_id: s for s in x.payload.cut})
+        elif isinstance(x, PeerAlive):
+            self.marks.alive(x.peer, x.alive)
         elif isinstance(x, Tick):
+            self.tick = x.id
+            self.m_ccs.set(len(self.dph.ccs))
+            self.m_depth.set(self.dph.depth)
+
+            if self.config.checkpoint_window:
+                yield from self.checkpoint_window(x.id)
+
             if x.id % 330 == 0:
-                totd = sum(x.depth() for _, x in self.dph.ccs.items())
-                logger.error(
-                    f'{self.quorum.replica_id} Exec={self.st_exec} Deps={len(self.dph.ccs)} Depth={totd}')
-                if totd > 10:
+                if self.dph.depth > 10:
                     for cc in self.dph.ccs.values():
                         logger.error(
                             f'{self.quorum.replica_id} {cc}')
@@ -1,3 +1,6 @@
+from datetime import datetime
+from typing import Optional
+
 from dsm.epaxos.inst.store import InstanceStore
 from dsm.epaxos.net.packet import Packet
 from dsm.epaxos.replica.acceptor.main import AcceptorCoroutine
@@ -11,20 +14,33 @@ from dsm.epaxos.replica.net.main import NetActor
 from dsm.epaxos.replica.pingpong.main import PingPongActor
 from dsm.epaxos.replica.quorum.ev import Configuration, Quorum
 from dsm.epaxos.replica.state.main import StateActor
+from dsm.epaxos.stats.metrics import Registry
+from dsm.epaxos.stats.trace import Tracer, Level
 
 
 class Replica:
-    def __init__(self, quorum: Quorum, config: Configuration, net_actor: NetActor):
+    def __init__(self, quorum: Quorum, config: Configuration, net_actor: NetActor, clock=datetime.now,
+                 log_dir: Optional[str] = '.', trace_level: Level = Level.INFO):
+        """
+        :param log_dir: where the trace of the replica goes, `None` for none at all
+        """
         self.quorum = quorum
         self.store = InstanceStore()
+        self.group = net_actor.group
+        self.metrics = Registry(labels={'replica': str(quorum.replica_id), 'group': str(self.group)})
+
+        self.m_recv = self.metrics.counter('packets_received', 'Packets received', ('type',))
+        self.spans = self.metrics.spans()
+        self.trace = Tracer.open(log_dir, f'replica-g{self.group}', quorum.replica_id, trace_level)
 
-        state = StateActor(self.quorum, self.store)
-        clients = ClientsActor(self.quorum)
-        leader = LeaderCoroutine(quorum, )
-        acceptor = AcceptorCoroutine(quorum, config)
+        state = StateActor(self.quorum, self.store, self.metrics, self.trace)
+        clients = ClientsActor(self.quorum, clock, self.metrics)
+        leader = LeaderCoroutine(quorum, config, clock, self.metrics)
+        acceptor = AcceptorCoroutine(quorum, config, clock, self.metrics)
         net = net_actor
-        executor = ExecutorActor(self.quorum, self.store)
-        pingpong = PingPongActor(self.quorum)
+        net.register(self.metrics)
+        executor = ExecutorActor(self.quorum, self.store, config, clock, self.metrics, self.trace)
+        pingpong = PingPongActor(self.quorum, clock, self.metrics)
 
         self.main = MainCoroutine(
             state,
@@ -38,7 +54,12 @@ class Replica:
         )
 
     def packet(self, p: Packet):
+        self.m_recv.labels(p.type).inc()
+        t = self.spans.start()
         self.main.event(p)
+        self.spans.stop('route', t)
 
     def tick(self, idx):
+        t = self.spans.start()
         self.main.event(Tick(idx))
+        self.spans.stop('route', t)
@@ -0,0 +1,71 @@
+from typing import Dict, List, Set
+
+from dsm.epaxos.inst.state import Slot, Ballot
+from dsm.epaxos.inst.store import InstanceStoreState
+from dsm.epaxos.net import packet
+from dsm.epaxos.replica.leader.sub import RecoveryReply
+
+
+class PrepareBatch:
+    """
+    Explicit prepare of many slots (usually of the same failed leader) with a single request and a single reply
+    per peer. Once a slow quorum of peers have replied, every slot that was not NACKed is recovered on its own.
+    """
+
+    def __init__(self, id: int):
+        self.id = id
+        self.ballots = {}  # type: Dict[Slot, Ballot]
+        self.replies = {}  # type: Dict[Slot, List[RecoveryReply]]
+        self.peers = set()  # type: Set[int]
+
+    def add(self, replica_id: int, slot: Slot, inst: InstanceStoreState):
+        self.ballots[slot] = inst.ballot
+        self.replies[slot] = [
+            RecoveryReply(
+                replica_id,
+                packet.PrepareResponseAck(
+                    slot,
+                    inst.ballot,
+                    inst.state.command,
+                    inst.state.seq,
+                    inst.state.deps,
+                    inst.state.stage
+                )
+            )
+        ]
+
+    def drop(self, slot: Slot):
+        if slot in self.ballots:
+            del self.ballots[slot]
+            del self.replies[slot]
+
+    def request(self):
+        slots = sorted(self.ballots.keys(), key=Slot.pack)
+        return packet.PrepareBatchRequest(self.id, slots, [self.ballots[x] for x in slots])
+
+    def reply(self, peer: int, rep: packet.PrepareBatchResponse) -> List[Slot]:
+        """
+        :return: slots dropped from the batch
+        """
+        if peer in self.peers:
+            return []
+
+        self.peers.add(peer)
+
+        for ack in rep.acks:
+            if self.ballots.get(ack.slot) == ack.ballot:
+                self.replies[ack.slot].append(RecoveryReply(peer, ack))
+
+        dropped = [x.slot for x in rep.nacks] + rep.diverged
+        dropped = [x for x in dropped if x in self.ballots]
+
+        for slot in dropped:
+            self.drop(slot)
+
+        return dropped
+
+    def __len__(self):
+        return len(self.ballots)
+
+    def __repr__(self):
+        return f'PrepareBatch({self.id},{len(self)},{sorted(self.peers)})'
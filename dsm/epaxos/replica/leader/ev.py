@@ -1,4 +1,4 @@
-from typing import NamedTuple
+from typing import NamedTuple, List
 
 from dsm.epaxos.cmd.state import Command
 from dsm.epaxos.inst.state import Slot
@@ -15,4 +15,9 @@ class LeaderStop(NamedTuple):
 
 class LeaderExplicitPrepare(NamedTuple):
     slot: Slot
-    reason: str
\ No newline at end of file
+    reason: str
+
+
+class LeaderExplicitPrepareBatch(NamedTuple):
+    slots: List[Slot]
+    reason: str
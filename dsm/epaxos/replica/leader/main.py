@@ -1,29 +1,58 @@
 import logging
+from datetime import datetime
+from typing import Dict
 
 from dsm.epaxos.inst.state import Slot, Stage
-from dsm.epaxos.inst.store import between_checkpoints, CheckpointCycle
+from dsm.epaxos.inst.store import CheckpointCycle, InstanceStoreState, IncorrectBallot, IncorrectStage, SlotTooOld, \
+    SlotWindow
 from dsm.epaxos.net import packet
 from dsm.epaxos.net.packet import PACKET_LEADER
-from dsm.epaxos.replica.leader.ev import LeaderStart, LeaderExplicitPrepare, LeaderStop
+from dsm.epaxos.replica.leader.batch import PrepareBatch
+from dsm.epaxos.replica.leader.ev import LeaderStart, LeaderExplicitPrepare, LeaderStop, LeaderExplicitPrepareBatch
 from dsm.epaxos.replica.corout import coroutiner, CoExit
-from dsm.epaxos.replica.leader.sub import leader_client_request, leader_explicit_prepare
-from dsm.epaxos.replica.main.ev import Wait, Reply
-from dsm.epaxos.replica.net.ev import Receive
-from dsm.epaxos.replica.quorum.ev import Quorum
-from dsm.epaxos.replica.state.ev import InstanceState, CheckpointEvent
+from dsm.epaxos.replica.leader.sub import leader_client_request, leader_explicit_prepare, leader_recover
+from dsm.epaxos.replica.main.ev import Wait, Reply, Tick
+from dsm.epaxos.replica.net.ev import Receive, Send
+from dsm.epaxos.replica.quorum.ev import Quorum, Configuration
+from dsm.epaxos.replica.state.ev import InstanceState, CheckpointEvent, Load, Store
+from dsm.epaxos.stats.histogram import Histogram
+from dsm.epaxos.stats.metrics import Registry
 
 logger = logging.getLogger('leader')
 
 
 class LeaderCoroutine:
-    def __init__(self, quorum: Quorum):
+    def __init__(self, quorum: Quorum, config: Configuration, clock=datetime.now, metrics: Registry = None):
         self.quorum = quorum
-        self.subs = {}  # type: GEN_T
-        self.waiting_for = {}  # type: Dict[Slot, T_sub_payload]
+        self.config = config
+        self.clock = clock
+        self.subs = SlotWindow()  # type: GEN_T
+        self.waiting_for = SlotWindow()  # type: Dict[Slot, T_sub_payload]
         self.next_instance_id = 0
 
+        self.batches = {}  # type: Dict[int, PrepareBatch]
+        self.batch_of = {}  # type: Dict[Slot, int]
+        self.next_batch_id = 0
+
         self.cp = CheckpointCycle()
 
+        # PreAccept -> Commit of the slots we lead, split by whether they had to go through the Accept phase
+        self.started = SlotWindow()  # type: Dict[Slot, datetime]
+        self.slow = SlotWindow()  # type: Dict[Slot, bool]
+        self.lat_fast = Histogram()
+        self.lat_slow = Histogram()
+
+        metrics = metrics if metrics is not None else Registry()
+        self.m_commits = metrics.counter('leader_commits', 'Commits of the slots we lead', ('path',))
+        self.m_fast = self.m_commits.labels('fast')
+        self.m_slow = self.m_commits.labels('slow')
+        self.m_recovered = metrics.counter('recovered', 'Slots recovered after an explicit prepare')
+        self.m_batches = metrics.counter('prepare_batches', 'Explicit prepare batches sent')
+        self.m_in_flight = metrics.gauge('prepare_in_flight', 'Slots waiting for replies to an explicit prepare')
+        self.m_subs = metrics.gauge('leader_pending', 'Slots with a running leader')
+        metrics.summary('commit_latency_fast_seconds', 'PreAccept -> Commit on the fast path', hist=self.lat_fast)
+        metrics.summary('commit_latency_slow_seconds', 'PreAccept -> Commit on the slow path', hist=self.lat_slow)
+
     def begin_explicit_prepare(self, slot, to_exec=True, reason=None):
         self.store.file_log.write(
             f'3\t{slot}\t{reason}\n')
@@ -50,52 +79,160 @@ class LeaderCoroutine:
         # except BaseException as e:
         #     corout.throw(e)
 
+    def stop(self, slot: Slot):
+        if slot in self.waiting_for:
+            del self.waiting_for[slot]
+        if slot in self.subs:
+            del self.subs[slot]
+        if slot in self.batch_of:
+            batch = self.batches.get(self.batch_of.pop(slot))
+
+            if batch:
+                batch.drop(slot)
+
+                if len(batch) == 0:
+                    del self.batches[batch.id]
+
+    def prepare_batch(self, slots, reason=None):
+        batch = PrepareBatch(self.next_batch_id)
+        self.next_batch_id += 1
+
+        for slot in slots:
+            self.stop(slot)
+
+            try:
+                inst = yield Load(slot)  # type: InstanceStoreState
+
+                if inst.state.stage >= Stage.Committed:
+                    continue
+
+                inst = yield Store(
+                    slot,
+                    InstanceStoreState(
+                        inst.ballot.next(self.quorum.replica_id),
+                        inst.state
+                    )
+                )  # type: InstanceStoreState
+            except (IncorrectBallot, IncorrectStage, SlotTooOld):
+                continue
+
+            batch.add(self.quorum.replica_id, slot, inst)
+
+        if len(batch) == 0:
+            return
+
+        self.m_batches.inc()
+        self.batches[batch.id] = batch
+
+        for slot in batch.ballots.keys():
+            self.batch_of[slot] = batch.id
+
+        req = batch.request()
+
+        for peer in self.quorum.peers:
+            yield Send(peer, req)
+
+    def prepare_batch_reply(self, peer: int, rep: packet.PrepareBatchResponse):
+        batch = self.batches.get(rep.id)
+
+        if batch is None:
+            return
+
+        for slot in batch.reply(peer, rep):
+            del self.batch_of[slot]
+
+        if len(batch) == 0:
+            del self.batches[batch.id]
+            return
+
+        if len(batch.peers) + 1 < self.quorum.slow_size:
+            return
+
+        del self.batches[batch.id]
+
+        for slot, ballot in sorted(batch.ballots.items()):
+            if self.batch_of.get(slot) != batch.id:
+                # committed while recovering the previous slots of the batch
+                continue
+
+            del self.batch_of[slot]
+
+            self.m_recovered.inc()
+            self.subs[slot] = leader_recover(self.quorum, slot, ballot, batch.replies[slot])
+
+            yield from self.run_sub(slot)
+
     def event(self, x):
-        if isinstance(x, packet.Packet) and isinstance(x.payload, PACKET_LEADER):
+        if isinstance(x, packet.Packet) and isinstance(x.payload, packet.PrepareBatchResponse):
+            yield from self.prepare_batch_reply(x.origin, x.payload)
+            yield Reply()
+        elif isinstance(x, packet.Packet) and isinstance(x.payload, PACKET_LEADER):
             slot = x.payload.slot  # type: Slot
 
-            if slot in self.waiting_for:
+            if slot in self.waiting_for and slot in self.subs:
                 yield from self.run_sub(slot, (x.origin, Receive.from_waiting(self.waiting_for.pop(slot), x.payload)))
 
             yield Reply()
         elif isinstance(x, InstanceState):
             if x.inst.state.stage >= Stage.Committed:
-                if x.slot in self.waiting_for:
-                    del self.waiting_for[x.slot]
-                if x.slot in self.subs:
-                    del self.subs[x.slot]
+                self.stop(x.slot)
+
+                if x.slot in self.started:
+                    lat = (self.clock() - self.started.pop(x.slot)).total_seconds()
+
+                    if x.slot in self.slow:
+                        del self.slow[x.slot]
+                        self.lat_slow.record(lat)
+                        self.m_slow.inc()
+                    else:
+                        self.lat_fast.record(lat)
+                        self.m_fast.inc()
+            elif x.inst.state.stage == Stage.Accepted and x.slot in self.started:
+                self.slow[x.slot] = True
             yield Reply()
         elif isinstance(x, LeaderStart):
             slot = Slot(self.quorum.replica_id, self.next_instance_id)
             self.next_instance_id += 1
 
-            self.subs[slot] = leader_client_request(self.quorum, slot, x.command)
+            # the slot of the command is then known from its ID
+            command = x.command._replace(id=x.command.id.bind(*slot))
+
+            self.started[slot] = self.clock()
+            self.subs[slot] = leader_client_request(self.quorum, slot, command)
 
             yield from self.run_sub(slot)
             yield Reply(slot)
         elif isinstance(x, LeaderStop):
-            if x.slot in self.waiting_for:
-                del self.waiting_for[x.slot]
-            if x.slot in self.subs:
-                del self.subs[x.slot]
+            self.stop(x.slot)
             yield Reply()
         elif isinstance(x, LeaderExplicitPrepare):
             prev = self.subs.get(x.slot) is not None
 
+            self.stop(x.slot)
             self.subs[x.slot] = leader_explicit_prepare(self.quorum, x.slot, x.reason)
 
             yield from self.run_sub(x.slot)
             yield Reply(prev)
+        elif isinstance(x, LeaderExplicitPrepareBatch):
+            yield from self.prepare_batch(x.slots, x.reason)
+            yield Reply()
+        elif isinstance(x, Tick):
+            self.m_in_flight.set(len(self.batch_of))
+            self.m_subs.set(len(self.subs))
+            yield Reply()
         elif isinstance(x, CheckpointEvent):
+            self.cp.cycle(x.at)
+
             ctr = 0
+            for window in (self.subs, self.waiting_for):
+                ctr += sum(len(v) for v in window.purge(self.cp.cp_old).values())
+
+            self.started.purge(self.cp.cp_old)
+            self.slow.purge(self.cp.cp_old)
 
-            for slot in between_checkpoints(*self.cp.cycle(x.at)):
-                if slot in self.subs:
-                    ctr += 1
-                    del self.subs[slot]
-                if slot in self.waiting_for:
-                    ctr += 1
-                    del self.waiting_for[slot]
+            # only the batches in flight, rather than the recycled range
+            for slot in [s for s in self.batch_of if self.cp.earlier(s)]:
+                self.stop(slot)
 
             logger.error(f'{self.quorum.replica_id} cleaned old things between {ctr}: {self.cp}')
 
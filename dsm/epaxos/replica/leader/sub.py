@@ -2,7 +2,7 @@ from collections import defaultdict
 from typing import NamedTuple, Optional, List
 
 from dsm.epaxos.cmd.state import Command
-from dsm.epaxos.inst.state import Slot, State, Stage
+from dsm.epaxos.inst.state import Slot, State, Stage, Ballot
 from dsm.epaxos.inst.store import InstanceStoreState, IncorrectBallot, IncorrectStage
 from dsm.epaxos.net import packet
 from dsm.epaxos.replica.net.ev import Send, Receive
@@ -140,6 +140,14 @@ def leader_explicit_prepare(q: Quorum, slot: Slot, reason=None):
         if diverged:
             raise Exception("I have diverged")
 
+    yield from leader_recover(q, slot, ballot, replies)
+
+
+def leader_recover(q: Quorum, slot: Slot, ballot: Ballot, replies: List[RecoveryReply]):
+    """
+    Given the prepare replies of at least a slow quorum for `ballot`, decide on the state of the instance and
+    continue with the respective phase.
+    """
     len_rep = len(replies)
 
     max_ballot = max(x.r.ballot for x in replies)
@@ -263,9 +271,10 @@ def leader_pre_accept(q: Quorum, slot: Slot, inst: InstanceStoreState, allow_fas
 
     replies = []
     replies: List[packet.PreAcceptResponseAck]
+    peers = []
 
     while len(replies) + 1 < q.fast_size:
-        _, (ack, nack) = yield Receive.any(
+        peer, (ack, nack) = yield Receive.any(
             packet.PreAcceptResponseAck,
             packet.PreAcceptResponseNack,
         )
@@ -280,6 +289,7 @@ def leader_pre_accept(q: Quorum, slot: Slot, inst: InstanceStoreState, allow_fas
                 pass
             else:
                 replies.append(ack)
+                peers.append(peer)
         if nack:
             # logger.debug(f'{q.replica_id} pre_accept Raising do to nack {ack} {nack} {ack} {inst}')
             pass
@@ -301,7 +311,7 @@ def leader_pre_accept(q: Quorum, slot: Slot, inst: InstanceStoreState, allow_fas
                 )
             )
         )
-        yield from leader_commit(q, slot, inst)
+        yield from leader_commit(q, slot, inst, peers)
     else:
         seq = max(inst.state.seq, max(x.seq for x in replies))
 
@@ -311,6 +321,9 @@ def leader_pre_accept(q: Quorum, slot: Slot, inst: InstanceStoreState, allow_fas
 
         deps = sorted(set(deps))
 
+        # peers that have pre-accepted exactly the final attributes need not be sent the full commit
+        synced = [peer for peer, rep in zip(peers, replies) if rep.seq == seq and rep.deps == deps]
+
         inst = yield Store(
             slot,
             InstanceStoreState(
@@ -324,17 +337,18 @@ def leader_pre_accept(q: Quorum, slot: Slot, inst: InstanceStoreState, allow_fas
             )
         )
 
-        yield from leader_accept(q, slot, inst)
+        yield from leader_accept(q, slot, inst, synced)
 
 
-def leader_accept(q: Quorum, slot: Slot, inst: InstanceStoreState):
+def leader_accept(q: Quorum, slot: Slot, inst: InstanceStoreState, synced: List[int] = ()):
     for peer in q.peers:
         yield Send(peer, packet.AcceptRequest(slot, inst.ballot, inst.state.command, inst.state.seq, inst.state.deps))
 
     replies = []
+    peers = list(synced)
 
     while len(replies) + 1 < q.slow_size:
-        _, (ack, nack) = yield Receive.any(
+        peer, (ack, nack) = yield Receive.any(
             packet.AcceptResponseAck,
             packet.AcceptResponseNack,
         )
@@ -350,6 +364,9 @@ def leader_accept(q: Quorum, slot: Slot, inst: InstanceStoreState):
             else:
                 replies.append(ack)
 
+                if peer not in peers:
+                    peers.append(peer)
+
         if nack:
             # logger.debug(f'{q.replica_id} accept Raising do to nack {ack} {nack} {ack} {inst}')
             pass
@@ -368,9 +385,16 @@ def leader_accept(q: Quorum, slot: Slot, inst: InstanceStoreState):
         )
     )
 
-    yield from leader_commit(q, slot, inst)
+    yield from leader_commit(q, slot, inst, peers)
 
 
-def leader_commit(q: Quorum, slot: Slot, inst: InstanceStoreState):
+def leader_commit(q: Quorum, slot: Slot, inst: InstanceStoreState, synced: List[int] = ()):
+    """
+    :param synced: peers known to hold the instance with exactly the committed attributes at `inst.ballot`; these
+    only need to learn the (slot, ballot) pair, which the `NetActor` coalesces per peer.
+    """
     for peer in q.peers:
-        yield Send(peer, packet.CommitRequest(slot, inst.ballot, inst.state.command, inst.state.seq, inst.state.deps))
+        if peer in synced:
+            yield Send(peer, packet.CommitBatchRequest([slot], [inst.ballot]))
+        else:
+            yield Send(peer, packet.CommitRequest(slot, inst.ballot, inst.state.command, inst.state.seq, inst.state.deps))
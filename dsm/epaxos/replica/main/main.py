@@ -6,15 +6,17 @@ from dsm.epaxos.cmd.state import Command, Checkpoint
 from dsm.epaxos.inst.state import Slot, Ballot, State, Stage
 from dsm.epaxos.inst.store import InstanceStoreState
 
-from dsm.epaxos.net.packet import Packet, PACKET_CLIENT, PACKET_LEADER, PACKET_ACCEPTOR, ClientRequest, PACKET_PINGPONG
+from dsm.epaxos.net.packet import Packet, PACKET_CLIENT, PACKET_LEADER, PACKET_ACCEPTOR, ClientRequest, PACKET_PINGPONG, \
+    PACKET_EXECUTOR
 from dsm.epaxos.replica.acceptor.main import AcceptorCoroutine
 from dsm.epaxos.replica.client.main import ClientsActor
 from dsm.epaxos.replica.corout import coroutiner, CoExit
-from dsm.epaxos.replica.leader.ev import LeaderStart, LeaderExplicitPrepare, LeaderStop
+from dsm.epaxos.replica.leader.ev import LeaderStart, LeaderExplicitPrepare, LeaderStop, LeaderExplicitPrepareBatch
 from dsm.epaxos.replica.leader.main import LeaderCoroutine
 from dsm.epaxos.replica.main.ev import Reply, Wait, Tick
 from dsm.epaxos.replica.net.ev import Send
 from dsm.epaxos.replica.net.main import NetActor
+from dsm.epaxos.replica.pingpong.ev import PeerRTT, PeerAlive
 from dsm.epaxos.replica.config import ReplicaState
 from dsm.epaxos.replica.quorum.ev import Quorum, Configuration
 from dsm.epaxos.replica.state.ev import LoadCommandSlot, Load, Store, InstanceState, CheckpointEvent
@@ -25,8 +27,10 @@ logger = logging.getLogger(__name__)
 STATE_MSGS = (LoadCommandSlot, Load, Store)
 STATE_EVENTS = (InstanceState,)
 CHECKPOINT_EVENTS = (CheckpointEvent,)
-LEADER_MSGS = (LeaderStart, LeaderStop, LeaderExplicitPrepare)
+LEADER_MSGS = (LeaderStart, LeaderStop, LeaderExplicitPrepare, LeaderExplicitPrepareBatch)
 NET_MSGS = (Send,)
+PINGPONG_EVENTS = (PeerRTT,)
+PEER_EVENTS = (PeerAlive,)
 
 
 class Unroutable(Exception):
@@ -64,9 +68,16 @@ class MainCoroutine(NamedTuple):
             self.run_sub(self.executor, req, d)
             return Reply(None)
         elif isinstance(req, CHECKPOINT_EVENTS):
+            self.run_sub(self.clients, req, d)
             self.run_sub(self.acceptor, req, d)
             self.run_sub(self.state, req, d)
             self.run_sub(self.leader, req, d)
+        elif isinstance(req, PINGPONG_EVENTS):
+            self.run_sub(self.acceptor, req, d)
+            return Reply(None)
+        elif isinstance(req, PEER_EVENTS):
+            self.run_sub(self.executor, req, d)
+            return Reply(None)
         elif isinstance(req, Reply):
             return req
         else:
@@ -106,6 +117,7 @@ class MainCoroutine(NamedTuple):
     def event(self, ev):
         if isinstance(ev, Tick):
             self.run_sub(self.acceptor, ev, 0, False)
+            self.run_sub(self.leader, ev, 0, False)
             self.run_sub(self.state, ev, 0, False)
             self.run_sub(self.net, ev, 0, False)
             self.run_sub(self.pingpong, ev, 0, False)
@@ -120,6 +132,8 @@ class MainCoroutine(NamedTuple):
                 self.run_sub(self.acceptor, ev)
             elif isinstance(ev.payload, PACKET_PINGPONG):
                 self.run_sub(self.pingpong, ev)
+            elif isinstance(ev.payload, PACKET_EXECUTOR):
+                self.run_sub(self.executor, ev)
             else:
                 assert False, ev
         elif isinstance(ev, STATE_EVENTS):
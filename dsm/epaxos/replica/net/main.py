@@ -1,28 +1,72 @@
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Tuple, List
 
+from dsm.epaxos.inst.state import Slot, Ballot
+from dsm.epaxos.net import packet
 from dsm.epaxos.replica.main.ev import Wait, Reply, Tick
 from dsm.epaxos.replica.net.ev import Send
+from dsm.epaxos.stats.metrics import Registry
 
 logger = logging.getLogger('net')
 
 
 class NetActor:
-    def __init__(self):
+    def __init__(self, group: int = 0):
+        self.group = group
         self.peers = {}  # type: Dict[int, Any]
+        self.commits = {}  # type: Dict[int, Tuple[List[Slot], List[Ballot]]]
+        self.register(Registry())
+
+    def register(self, metrics: Registry):
+        self.m_sent = metrics.counter('packets_sent', 'Packets sent', ('type',))
+        self.m_bytes_sent = metrics.counter('bytes_sent', 'Bytes sent by the transport')
+        self.m_bytes_recv = metrics.counter('bytes_received', 'Bytes received by the transport')
+        self.m_commits_queued = metrics.gauge('commits_queued', 'Compact commits waiting for a PreAccept or a flush')
+        self.m_commits_piggybacked = metrics.counter('commits_piggybacked', 'Compact commits sent along with a PreAccept')
+        self.spans = metrics.spans()
 
     def send(self, payload: Send):
         raise NotImplementedError('')
 
+    def send_counted(self, s: Send):
+        self.m_sent.labels(s.payload.__class__.__name__).inc()
+        t = self.spans.start()
+        self.send(s)
+        self.spans.stop('send', t)
+
+    def commit(self, x: Send):
+        # commits are queued per peer until either a PreAccept to the same peer picks them up, or until `flush`
+        if x.dest not in self.commits:
+            self.commits[x.dest] = ([], [])
+
+        slots, ballots = self.commits[x.dest]
+        slots.extend(x.payload.slots)
+        ballots.extend(x.payload.ballots)
+        self.m_commits_queued.inc(len(x.payload.slots))
+
+    def flush(self):
+        commits = self.commits
+        self.commits = {}
+        self.m_commits_queued.set(0)
+
+        for dest, (slots, ballots) in commits.items():
+            self.send_counted(Send(dest, packet.CommitBatchRequest(slots, ballots)))
+
     def event(self, x):
         if isinstance(x, Send):
-            self.send(x)
+            if isinstance(x.payload, packet.CommitBatchRequest):
+                self.commit(x)
+            elif isinstance(x.payload, packet.PreAcceptRequest) and x.dest in self.commits:
+                slots, ballots = self.commits.pop(x.dest)
+                self.m_commits_queued.dec(len(slots))
+                self.m_commits_piggybacked.inc(len(slots))
+                self.send_counted(Send(x.dest, x.payload._replace(commits=packet.CommitBatchRequest(slots, ballots))))
+            else:
+                self.send_counted(x)
             yield Reply()
         elif isinstance(x, Tick):
-            if x.id % 330 == 0 and hasattr(self, 'net_stats'):
-                rcv = sorted([(k, v) for k, v in self.net_stats.recv.items()])
-                snd = sorted([(k, v) for k, v in self.net_stats.send.items()])
-                logger.error(f'{self.quorum.replica_id} {self.net_stats.traffic_recv} {self.net_stats.traffic_send} {rcv} {snd}')
+            self.flush()
+
             yield Reply()
         else:
             assert False, x
@@ -0,0 +1,14 @@
+from typing import NamedTuple
+
+
+class PeerRTT(NamedTuple):
+    peer: int
+    rtt: float
+
+
+class PeerAlive(NamedTuple):
+    """
+    The peer has started or stopped answering our pings, see `PingPongActor`.
+    """
+    peer: int
+    alive: bool
@@ -1,54 +1,81 @@
 import logging
 from datetime import datetime
-from typing import Dict, NamedTuple, List
+from typing import Dict, NamedTuple, List, Set
 
 from dsm.epaxos.net import packet
 from dsm.epaxos.net.packet import Packet
 from dsm.epaxos.replica.main.ev import Tick, Reply
 from dsm.epaxos.replica.net.ev import Send
+from dsm.epaxos.replica.pingpong.ev import PeerRTT, PeerAlive
 from dsm.epaxos.replica.quorum.ev import Quorum
+from dsm.epaxos.stats.metrics import Registry
 
 logger = logging.getLogger('pingpong')
 
 
 class PingPongActor:
-    def __init__(self, quorum: Quorum):
+    """
+    Pings the peers every `ping_every_tick` ticks. A peer that has not answered a ping for `dead_after` ticks is taken
+    for dead until it answers one again, and both are told by `PeerAlive`.
+    """
+
+    def __init__(self, quorum: Quorum, clock=datetime.now, metrics: Registry = None):
         self.quorum = quorum
+        self.clock = clock
         self.ping_every_tick = 10
+        self.dead_after = 5 * self.ping_every_tick
         self.keep_times = 10
         self.last_ping = {}  # type: Dict[int, datetime]
         self.last_ping_id = {}  # type: Dict[int, int]
-        self.pings_sent = {}  # type: Dict[int, int]
-        self.pings_rcvd = {}  # type: Dict[int, int]
         self.pings_times = {}  # type: Dict[int, List[float]]
 
+        self.tick = 0
+        # the tick of the last pong of every peer, or of the first ping
+        self.heard = {}  # type: Dict[int, int]
+        self.dead = set()  # type: Set[int]
+
+        metrics = metrics if metrics is not None else Registry()
+        self.m_sent = metrics.counter('pings_sent', 'Pings sent', ('peer',))
+        self.m_rcvd = metrics.counter('pings_received', 'Pongs received in time', ('peer',))
+        self.m_rtt = metrics.gauge('peer_rtt_seconds', 'Average RTT of the last pings', ('peer',))
+
     def event(self, x):
         if isinstance(x, Packet):
             if isinstance(x.payload, packet.PingRequest):
                 yield Send(x.origin, packet.PongResponse(x.payload.id))
             elif isinstance(x.payload, packet.PongResponse):
                 if x.payload.id == self.last_ping_id.get(x.origin, -1):
-                    time = datetime.now() - self.last_ping[x.origin]
-                    self.pings_rcvd[x.origin] = self.pings_rcvd.get(x.origin, 0) + 1
-                    self.pings_times[x.origin] = (self.pings_times.get(x.origin, []) + [time.total_seconds()])[:self.keep_times]
+                    time = self.clock() - self.last_ping[x.origin]
+                    self.m_rcvd.labels(x.origin).inc()
+                    self.pings_times[x.origin] = (self.pings_times.get(x.origin, []) + [time.total_seconds()])[-self.keep_times:]
+                    self.m_rtt.labels(x.origin).set(sum(self.pings_times[x.origin]) / len(self.pings_times[x.origin]))
+                    yield PeerRTT(x.origin, time.total_seconds())
+
+                self.heard[x.origin] = self.tick
+
+                if x.origin in self.dead:
+                    self.dead.remove(x.origin)
+                    yield PeerAlive(x.origin, True)
                 else:
                     # todo: reordered pings
                     pass
             else:
                 assert False, ''
         elif isinstance(x, Tick):
+            self.tick = x.id
+
+            for peer in self.quorum.peers:
+                if peer not in self.dead and x.id - self.heard.setdefault(peer, x.id) > self.dead_after:
+                    self.dead.add(peer)
+                    yield PeerAlive(peer, False)
+
             if x.id % self.ping_every_tick == 0:
-                now = datetime.now()
+                now = self.clock()
                 for peer in self.quorum.peers:
                     self.last_ping[peer] = now
-                    self.last_ping_id[peer] = self.last_ping_id.get(peer, 0)
-                    self.pings_sent[peer] = self.pings_sent.get(peer, 0) + 1
+                    self.last_ping_id[peer] = self.last_ping_id.get(peer, -1) + 1
+                    self.m_sent.labels(peer).inc()
                     yield Send(peer, packet.PingRequest(self.last_ping_id[peer]))
-
-            if x.id % 300 == 0:
-                pings_repl = sorted((k, f'{sum(v)/len(v)*1000:0.2f}ms') for k, v in self.pings_times.items())
-                pings_recv = sorted((k, f'{v}/{self.pings_sent[k]}') for k, v in self.pings_rcvd.items())
-                logger.error(f'{self.quorum.replica_id} {pings_repl} {pings_recv}')
         else:
             assert False, ''
         yield Reply()
@@ -45,6 +45,12 @@ class Configuration(NamedTuple):
     timeout_range: int = 3
     jiffies: int = 33
     checkpoint_each: int = 10 * 33
+    timeout_max: int = 5 * 33
+    timeout_rtt_mult: float = 4.
+    # purge below the slots executed by every live replica instead of agreeing on `Checkpoint` commands
+    checkpoint_window: bool = True
+    # ticks between the executed frontiers a replica sends to its peers
+    frontier_each: int = 33
 
     @property
     def seconds_per_tick(self):
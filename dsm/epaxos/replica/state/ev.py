@@ -1,4 +1,4 @@
-from typing import NamedTuple, Dict
+from typing import NamedTuple, Dict, Optional
 
 from dsm.epaxos.cmd.state import CommandID
 from dsm.epaxos.inst.state import Slot
@@ -30,5 +30,6 @@ class InstanceState(NamedTuple):
 
 
 class CheckpointEvent(NamedTuple):
-    slot: Slot
+    # the `Checkpoint` command, `None` for a low-water mark (see `LowWaterMark`)
+    slot: Optional[Slot]
     at: Dict[int, Slot]
@@ -1,43 +1,37 @@
 import logging
-from itertools import groupby
 
 from dsm.epaxos.inst.state import Stage
 from dsm.epaxos.inst.store import InstanceStore
 from dsm.epaxos.replica.main.ev import Wait, Reply, Tick
 from dsm.epaxos.replica.quorum.ev import Quorum
 from dsm.epaxos.replica.state.ev import LoadCommandSlot, Load, Store, InstanceState, CheckpointEvent
+from dsm.epaxos.stats.metrics import Registry
+from dsm.epaxos.stats.trace import Tracer, STORE
 
 logger = logging.getLogger('state')
 
 
-class Log:
-    def __init__(self, filename):
-        self._log = open(filename, 'w+')
-
-    def __call__(self, fn=lambda: ''):
-        self._log.write(fn())
-        self._log.flush()
-
-
 class StateActor:
-    def __init__(self, quorum: Quorum, store: InstanceStore):
+    def __init__(self, quorum: Quorum, store: InstanceStore, metrics: Registry = None, tracer: Tracer = None):
         self.quorum = quorum
         self.store = store
         self.prev_cp = None
 
-        self.log = Log(f'state-{self.quorum.replica_id}.log')
+        metrics = metrics if metrics is not None else Registry()
+        self.m_instances = metrics.gauge('instances', 'Instances in the store', ('stage',))
+        self.m_instances_origin = metrics.gauge('instances_origin', 'Instances in the store', ('origin',))
+        self.m_ballots_high = metrics.counter('ballots_high', 'Stores of instances with a ballot above 10')
+        self.spans = metrics.spans()
+
+        self.trace = tracer if tracer is not None else Tracer()
 
     def event(self, x):
         if isinstance(x, Tick):
-            def lenx(iter_obj):
-                i = 0
-                for x in iter_obj:
-                    i += 1
-                return i
+            for stage, count in self.store.count_stages.items():
+                self.m_instances.labels(stage.name).set(count)
 
-            if x.id % 330 == 0:
-                instc = sorted((x.name, lenx(y)) for x, y in groupby(sorted(x.state.stage for x in self.store.inst.values())))
-                logger.error(f'{self.quorum.replica_id} {instc}')
+            for origin, count in self.store.count_origins.items():
+                self.m_instances_origin.labels(origin).set(count)
 
             yield Reply()
         elif isinstance(x, LoadCommandSlot):
@@ -46,12 +40,25 @@ class StateActor:
             yield Reply(self.store.load(x.slot).inst)
         elif isinstance(x, Store):
             # todo: all stores modify timeouts
-            old, new = self.store.update(x.slot, x.inst)
-
-            self.log(lambda: f'{self.quorum.replica_id}\t{x.slot}\t{new}\n')
+            t = self.spans.start()
+            try:
+                old, new = self.store.update(x.slot, x.inst)
+            finally:
+                self.spans.stop('store', t)
+
+            if self.trace.debug:
+                self.trace(
+                    STORE, x.slot.replica_id, x.slot.instance_id, new.ballot.epoch, new.ballot.b,
+                    new.ballot.replica_id, new.state.stage, new.state.seq, len(new.state.deps)
+                )
 
             deps_comm = []
             for d in new.state.deps:
+                if self.store.cp.earlier(d):
+                    # below a low-water mark, so executed by every live replica
+                    deps_comm.append(True)
+                    continue
+
                 r = self.store.load(d)
 
                 if not r.exists:
@@ -61,6 +68,7 @@ class StateActor:
                 deps_comm.append(r.inst.state.stage == Stage.Committed)
 
             if new.ballot.b > 10:
+                self.m_ballots_high.inc()
                 logger.error(f'{self.quorum.replica_id} {x.slot} {new} HW')
 
             yield InstanceState(x.slot, new)
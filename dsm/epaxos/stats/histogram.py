@@ -0,0 +1,115 @@
+from typing import Dict, Iterable, List, Tuple
+
+
+class Histogram:
+    """
+    A log-linear histogram (as in HdrHistogram) of non-negative values, usually latencies in seconds.
+
+    Values are counted in integer units of `resolution`. Values below `2 ** bits` units have a bucket each, above
+    that every power of two is split into `2 ** (bits - 1)` buckets, so the relative error of any reported value
+    is below `2 ** (1 - bits)`. The number of buckets only depends on the range of the values, and two
+    histograms with the same `resolution` and `bits` merge by adding their counts.
+    """
+
+    def __init__(self, resolution: float = 1e-6, bits: int = 7):
+        self.resolution = resolution
+        self.bits = bits
+        self.counts = {}  # type: Dict[int, int]
+
+        self.count = 0
+        self.total = 0.
+        self.min = None  # type: float
+        self.max = None  # type: float
+
+    def index(self, units: int) -> int:
+        sub = 1 << self.bits
+
+        if units < sub:
+            return units
+
+        half = sub >> 1
+        e = units.bit_length() - self.bits
+        return sub + (e - 1) * half + ((units >> e) - half)
+
+    def lower(self, idx: int) -> int:
+        sub = 1 << self.bits
+
+        if idx < sub:
+            return idx
+
+        half = sub >> 1
+        e = (idx - sub) // half + 1
+        return ((idx - sub) % half + half) << e
+
+    def upper(self, idx: int) -> int:
+        return self.lower(idx + 1) - 1
+
+    def record(self, value: float, count: int = 1):
+        idx = self.index(max(int(value / self.resolution), 0))
+        self.counts[idx] = self.counts.get(idx, 0) + count
+
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: 'Histogram') -> 'Histogram':
+        assert (self.resolution, self.bits) == (other.resolution, other.bits), (self, other)
+
+        for idx, count in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + count
+
+        self.count += other.count
+        self.total += other.total
+
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+        return self
+
+    @classmethod
+    def merged(cls, hists: Iterable['Histogram']) -> 'Histogram':
+        r = None
+        for x in hists:
+            if r is None:
+                r = cls(x.resolution, x.bits)
+            r.merge(x)
+        return r if r is not None else cls()
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.
+
+    def percentile(self, p: float) -> float:
+        """
+        :param p: between 0 and 1
+        :return: the highest value equivalent to the value at the percentile `p`
+        """
+        if self.count == 0:
+            return 0.
+
+        rank = max(1, int(round(p * self.count)))
+        seen = 0
+
+        for idx in sorted(self.counts.keys()):
+            seen += self.counts[idx]
+
+            if seen >= rank:
+                return min(self.upper(idx) * self.resolution, self.max)
+
+        return self.max
+
+    def percentiles(self, ps: Iterable[float] = (0.5, 0.99, 0.999)) -> List[Tuple[float, float]]:
+        return [(p, self.percentile(p)) for p in ps]
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        if self.count == 0:
+            return 'Histogram(N=0)'
+
+        pcts = ' '.join(f'P{str(p * 100).rstrip("0").rstrip(".").replace(".", "")}={v * 1000:0.2f}ms'
+                        for p, v in self.percentiles())
+        return f'Histogram(N={self.count} AVG={self.mean * 1000:0.2f}ms {pcts} MAX={self.max * 1000:0.2f}ms)'
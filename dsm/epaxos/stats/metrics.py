@@ -0,0 +1,180 @@
+from typing import Dict, Tuple, List, Iterable, Optional
+
+from dsm.epaxos.stats.histogram import Histogram
+
+
+class Metric:
+    """
+    A metric with optional labels. Updating one is a single attribute update, so the actors may do it on every event;
+    everything else happens when the `Registry` is exposed.
+    """
+
+    type = None  # type: str
+
+    def __init__(self, name: str, help: str = '', labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.children = {}  # type: Dict[Tuple[str, ...], Metric]
+
+    def labels(self, *values) -> 'Metric':
+        assert len(values) == len(self.label_names), (self.name, values)
+
+        r = self.children.get(values)
+
+        if r is None:
+            r = self.__class__(self.name, self.help)
+            self.children[values] = r
+
+        return r
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError()
+
+    def all_samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        if len(self.label_names):
+            for values, child in sorted(list(self.children.items()), key=lambda x: x[0]):
+                labels = dict(zip(self.label_names, (str(x) for x in values)))
+
+                for suffix, extra, value in child.samples():
+                    yield suffix, {**labels, **extra}, value
+        else:
+            yield from self.samples()
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0
+
+    def inc(self, x=1):
+        self.value += x
+
+    def samples(self):
+        yield '', {}, self.value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0
+
+    def set(self, x):
+        self.value = x
+
+    def inc(self, x=1):
+        self.value += x
+
+    def dec(self, x=1):
+        self.value -= x
+
+    def samples(self):
+        yield '', {}, self.value
+
+
+class Summary(Metric):
+    """
+    Exposes a `Histogram` as quantiles together with its count and sum.
+    """
+    type = 'summary'
+
+    QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+    def __init__(self, *args, hist: Optional[Histogram] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hist = hist if hist is not None else Histogram()
+
+    def record(self, x):
+        self.hist.record(x)
+
+    def samples(self):
+        for q in self.QUANTILES:
+            yield '', {'quantile': str(q)}, self.hist.percentile(q)
+        yield '_sum', {}, self.hist.total
+        yield '_count', {}, self.hist.count
+
+
+def _escape(x: str):
+    return x.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Registry:
+    """
+    Metrics of a single replica, in the text exposition format of Prometheus.
+    """
+
+    def __init__(self, prefix: str = 'epaxos', labels: Optional[Dict[str, str]] = None):
+        self.prefix = prefix
+        self.const_labels = labels or {}
+        self.metrics = {}  # type: Dict[str, Metric]
+
+    def register(self, metric: Metric) -> Metric:
+        name = f'{self.prefix}_{metric.name}' if self.prefix else metric.name
+
+        if name in self.metrics:
+            assert self.metrics[name].__class__ == metric.__class__, (name, metric)
+            return self.metrics[name]
+
+        self.metrics[name] = metric
+        return metric
+
+    def counter(self, name: str, help: str = '', labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str = '', labels: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def summary(self, name: str, help: str = '', labels: Tuple[str, ...] = (), hist: Histogram = None) -> Summary:
+        return self.register(Summary(name, help, labels, hist=hist))
+
+    def spans(self) -> 'Spans':
+        from dsm.epaxos.stats.profile import Spans
+        return self.register(Spans())
+
+    def expose(self) -> str:
+        return expose([self])
+
+
+class Registries:
+    """
+    Registries of several replicas served together, e.g. of the groups run by one process.
+    """
+
+    def __init__(self, registries: List[Registry]):
+        self.registries = registries
+
+    def expose(self) -> str:
+        return expose(self.registries)
+
+
+def expose(registries: List[Registry]) -> str:
+    """
+    Metrics of the same name are listed once, with the samples of every registry that has them.
+    """
+    r = []  # type: List[str]
+
+    names = sorted(set(name for x in registries for name in x.metrics.keys()))
+
+    for name in names:
+        metrics = [(x.const_labels, x.metrics[name]) for x in registries if name in x.metrics]
+        _, metric = metrics[0]
+
+        if metric.help:
+            r.append(f'# HELP {name} {_escape(metric.help)}')
+        r.append(f'# TYPE {name} {metric.type}')
+
+        for const_labels, metric in metrics:
+            for suffix, labels, value in metric.all_samples():
+                labels = {**const_labels, **labels}
+
+                if len(labels):
+                    fmtd = ','.join(f'{k}="{_escape(str(v))}"' for k, v in sorted(labels.items()))
+                    r.append(f'{name}{suffix}{{{fmtd}}} {value}')
+                else:
+                    r.append(f'{name}{suffix} {value}')
+
+    return '\n'.join(r) + '\n'
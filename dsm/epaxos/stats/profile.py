@@ -0,0 +1,137 @@
+import logging
+import signal
+import time
+from collections import Counter as Counts
+from typing import Optional, Tuple, List
+
+from dsm.epaxos.stats.metrics import Counter
+
+logger = logging.getLogger('profile')
+
+
+class Spans(Counter):
+    """
+    CPU time spent in the phases of the replica (decode, route, store, execute, send), measured only while `enabled`.
+
+    The phases nest: `route` is the whole of the protocol handling and includes `store`, `execute` and `send`.
+
+        t = spans.start()
+        ...
+        spans.stop('store', t)
+    """
+
+    def __init__(self, name='cpu_seconds', help='CPU time per phase while span timing is enabled', labels=('phase',)):
+        super().__init__(name, help, labels)
+        self.enabled = False
+
+    def start(self) -> Optional[float]:
+        return time.process_time() if self.enabled else None
+
+    def stop(self, phase: str, t: Optional[float]):
+        if t is not None:
+            self.labels(phase).inc(time.process_time() - t)
+
+    def __repr__(self):
+        phases = ' '.join(f'{k[0]}={v.value:0.3f}s' for k, v in sorted(self.children.items()))
+        return f'Spans({phases})'
+
+
+class SamplingProfiler:
+    """
+    A statistical profiler of the main thread: every `interval` seconds of CPU time `SIGPROF` interrupts the
+    process, and the handler counts the stack it has interrupted. The overhead only depends on the interval.
+
+    Stacks are dumped in the collapsed format of `flamegraph.pl`.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counts()  # type: Counts
+        self.samples = 0
+        self.running = False
+
+    def _sample(self, signum, frame):
+        stack = []  # type: List[str]
+
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+            frame = frame.f_back
+
+        self.stacks[tuple(reversed(stack))] += 1
+        self.samples += 1
+
+    def start(self):
+        if self.running:
+            return
+
+        self.running = True
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        if not self.running:
+            return
+
+        self.running = False
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_IGN)
+
+    def top(self, n=20) -> List[Tuple[str, int]]:
+        """
+        :return: functions most often found at the top of the stack
+        """
+        leaves = Counts()
+        for stack, count in self.stacks.items():
+            leaves[stack[-1]] += count
+        return leaves.most_common(n)
+
+    def dump(self, filename: str):
+        with open(filename, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(';'.join(stack) + f' {count}\n')
+
+    def reset(self):
+        self.stacks = Counts()
+        self.samples = 0
+
+
+class ProfileSwitch:
+    """
+    Switches profiling of a running replica with signals:
+
+     - `SIGUSR1` toggles the span timings in `Spans`.
+     - `SIGUSR2` toggles the sampling profiler. When it stops, the stacks are written to `<prefix>-<n>.folded`.
+    """
+
+    def __init__(self, spans: Spans, sampler: SamplingProfiler, prefix: str):
+        self.spans = spans
+        self.sampler = sampler
+        self.prefix = prefix
+        self.dumps = 0
+
+    def install(self):
+        signal.signal(signal.SIGUSR1, lambda *args: self.toggle_spans())
+        signal.signal(signal.SIGUSR2, lambda *args: self.toggle_sampler())
+        return self
+
+    def toggle_spans(self):
+        self.spans.enabled = not self.spans.enabled
+        logger.info(f'{self.prefix} spans={self.spans.enabled} {self.spans}')
+
+    def toggle_sampler(self):
+        if self.sampler.running:
+            self.sampler.stop()
+
+            filename = f'{self.prefix}-{self.dumps}.folded'
+            self.sampler.dump(filename)
+            self.dumps += 1
+
+            top = '\n'.join(f'\t{count}\t{name}' for name, count in self.sampler.top())
+            logger.info(f'{self.prefix} sampled {self.sampler.samples} stacks into {filename}\n{top}')
+
+            self.sampler.reset()
+        else:
+            self.sampler.start()
+            logger.info(f'{self.prefix} sampling every {self.sampler.interval * 1000:0.1f}ms of CPU')
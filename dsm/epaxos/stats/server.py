@@ -0,0 +1,75 @@
+import logging
+import os
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Union
+from urllib.parse import urlparse
+
+from dsm.epaxos.stats.metrics import Registry, Registries
+
+logger = logging.getLogger('metrics')
+
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+    pass
+
+
+class MetricsServer:
+    """
+    Serves `GET /metrics` of a registry from a daemon thread, either on `http://host:port` or on `unix:///path`.
+
+    The thread only reads the metrics, which the replica keeps updating from its own loop.
+    """
+
+    def __init__(self, registry: Union[Registry, Registries], addr: str):
+        self.registry = registry
+        self.addr = urlparse(addr)
+
+        registry_ = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+
+                body = registry_.expose().encode()
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def address_string(self):
+                return str(self.client_address)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        if self.addr.scheme == 'unix':
+            if os.path.exists(self.addr.path):
+                os.unlink(self.addr.path)
+            self.server = UnixHTTPServer(self.addr.path, Handler)
+        else:
+            self.server = HTTPServer((self.addr.hostname, self.addr.port), Handler)
+
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+        if self.addr.scheme == 'unix' and os.path.exists(self.addr.path):
+            os.unlink(self.addr.path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,192 @@
+import argparse
+import atexit
+import json
+import os
+import struct
+import threading
+import time
+from collections import deque
+from enum import IntEnum
+from typing import NamedTuple, Optional, Tuple, Dict, Deque, Iterator, BinaryIO
+
+MAGIC = b'DSMT\x01'
+
+_LEN = struct.Struct('<I')
+_HEAD = '<Bd'
+
+
+class Level(IntEnum):
+    OFF = 0
+    INFO = 1
+    DEBUG = 2
+
+
+class TraceEvent(NamedTuple):
+    code: int
+    name: str
+    level: Level
+    fields: Tuple[str, ...]
+
+
+EVENTS = {}  # type: Dict[int, TraceEvent]
+_STRUCTS = {}  # type: Dict[int, struct.Struct]
+
+
+def trace_event(code: int, name: str, level: Level, *fields: str) -> TraceEvent:
+    assert code not in EVENTS, (code, EVENTS[code])
+
+    r = EVENTS[code] = TraceEvent(code, name, level, fields)
+    _STRUCTS[code] = struct.Struct(_HEAD + 'q' * len(fields))
+    return r
+
+
+DROPPED = trace_event(0, 'DROPPED', Level.OFF, 'count')
+STORE = trace_event(1, 'STORE', Level.DEBUG, 'origin', 'instance', 'epoch', 'b', 'leader', 'stage', 'seq', 'deps')
+EXECUTE = trace_event(2, 'EXECUTE', Level.INFO, 'origin', 'instance', 'checkpoint', 'commits')
+READY = trace_event(3, 'READY', Level.DEBUG, 'origin', 'instance', 'waiting', 'unlocked', 'pending', 'depth')
+
+
+class Tracer:
+    """
+    A trace of a replica in `path`: every record is a fixed-size struct of an event code, a timestamp and the integer
+    fields of the event, so that recording one only appends a tuple to a queue. A writer thread packs the queue and
+    writes it out every `interval` seconds; decode it with `python -m dsm.epaxos.stats.trace`.
+
+    Records above `level` are not kept, and with `path=None` none are. A record pushed to a full queue is dropped and
+    counted instead, and the count is written as a `DROPPED` record.
+
+    The arguments of a record are worked out even if it is not kept, so hot paths check `info` or `debug` first:
+
+        if tracer.debug:
+            tracer(READY, ...)
+    """
+
+    def __init__(self, path: Optional[str] = None, level: Level = Level.INFO, capacity: int = 1 << 16,
+                 interval: float = 0.1):
+        self.level = level if path is not None else Level.OFF
+        self.info = self.enabled(Level.INFO)
+        self.debug = self.enabled(Level.DEBUG)
+        self.capacity = capacity
+        self.interval = interval
+
+        self.records = deque()  # type: Deque[Tuple[int, float, Tuple[int, ...]]]
+        self.dropped = 0
+        self.dropped_written = 0
+
+        self.file = None  # type: Optional[BinaryIO]
+        self.closed = threading.Event()
+        self.writer = None  # type: Optional[threading.Thread]
+
+        if self.level > Level.OFF:
+            self.file = open(path, 'wb')
+            self._header()
+
+            self.writer = threading.Thread(target=self._run, name='trace', daemon=True)
+            self.writer.start()
+            atexit.register(self.close)
+
+    @classmethod
+    def open(cls, log_dir: Optional[str], name: str, replica_id: int, level: Level = Level.INFO, **kwargs):
+        path = os.path.join(log_dir, f'{name}-{replica_id}.trace') if log_dir is not None else None
+        return cls(path, level, **kwargs)
+
+    def enabled(self, level: Level) -> bool:
+        return level <= self.level
+
+    def __call__(self, event: TraceEvent, *args: int):
+        if event.level > self.level:
+            return
+
+        if len(self.records) >= self.capacity:
+            self.dropped += 1
+            return
+
+        self.records.append((event.code, time.time(), args))
+
+    def _header(self):
+        events = {x.code: [x.name, list(x.fields)] for x in EVENTS.values()}
+        body = json.dumps(events).encode()
+
+        self.file.write(MAGIC + _LEN.pack(len(body)) + body)
+
+    def flush(self):
+        records = self.records
+        chunk = []
+
+        # `popleft` is safe against the appends of the replica thread, a copy of the deque would not be
+        for _ in range(len(records)):
+            code, t, args = records.popleft()
+            chunk.append(_STRUCTS[code].pack(code, t, *args))
+
+        dropped = self.dropped
+
+        if dropped != self.dropped_written:
+            chunk.append(_STRUCTS[DROPPED.code].pack(DROPPED.code, time.time(), dropped - self.dropped_written))
+            self.dropped_written = dropped
+
+        if len(chunk):
+            self.file.write(b''.join(chunk))
+            self.file.flush()
+
+    def _run(self):
+        while not self.closed.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        if self.file is None or self.closed.is_set():
+            return
+
+        self.closed.set()
+        self.writer.join()
+        self.flush()
+        self.file.close()
+
+
+def decode(f: BinaryIO) -> Iterator[Tuple[float, str, Dict[str, int]]]:
+    """
+    :return: the records of a trace, as (timestamp, event name, fields)
+    """
+    magic = f.read(len(MAGIC))
+    assert magic == MAGIC, magic
+
+    size, = _LEN.unpack(f.read(_LEN.size))
+    events = {int(k): v for k, v in json.loads(f.read(size).decode()).items()}
+    structs = {k: struct.Struct(_HEAD + 'q' * len(fields)) for k, (_, fields) in events.items()}
+
+    while True:
+        code = f.read(1)
+
+        if not len(code):
+            return
+
+        s = structs[code[0]]
+        body = code + f.read(s.size - 1)
+
+        if len(body) < s.size:
+            # cut off by a crash
+            return
+
+        _, t, *args = s.unpack(body)
+        name, fields = events[code[0]]
+
+        yield t, name, dict(zip(fields, args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the records of replica traces')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--event', action='append', help='only print these events')
+    args = parser.parse_args()
+
+    for path in args.paths:
+        with open(path, 'rb') as f:
+            for t, name, fields in decode(f):
+                if args.event and name not in args.event:
+                    continue
+
+                values = ' '.join(f'{k}={v}' for k, v in fields.items())
+                print(f'{path}\t{t:0.6f}\t{name}\t{values}')
+
+
+if __name__ == '__main__':
+    main()
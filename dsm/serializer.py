@@ -89,7 +89,7 @@ def _generate_type_deserializer(t):
     elif issubclass(t, type(None)):
         return lambda _: None
     elif issubclass(t, uuid.UUID):
-        return lambda val: uuid.UUID(hex=val)
+        return lambda val: t(hex=val)
 
     elif issubclass(t, typing.List):
         assert hasattr(t, '__args__')
@@ -126,7 +126,8 @@ def serialize_json(val):
 
 
 def deserialize_json(t, body):
-    return _deserialize(t, json.loads(body.decode()))
+    # `body` may be any buffer, e.g. a `memoryview` of a message received without a copy
+    return _deserialize(t, json.loads(str(body, 'utf-8')))
 
 
 def serialize_bson(val):
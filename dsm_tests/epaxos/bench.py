@@ -0,0 +1,488 @@
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+from typing import NamedTuple, Callable, Tuple, Dict, List, Any, Optional
+
+from dsm.epaxos.cmd.state import Command, Mutator, Checkpoint, CommandID, RangeMutator, KeyRange
+from dsm.epaxos.inst.deps.cache import KeyedDepsCache
+from dsm.epaxos.inst.state import Slot, Ballot, Stage, State
+from dsm.epaxos.inst.store import InstanceStore, InstanceStoreState
+from dsm.epaxos.net.impl.udp.util import serialize, deserialize
+from dsm.epaxos.net.packet import Packet, PACKETS, ClientRequest, ClientResponse, ClientRejected, PreAcceptRequest, \
+    PreAcceptResponseAck, PreAcceptResponseNack, AcceptRequest, AcceptResponseAck, AcceptResponseNack, CommitRequest, \
+    CommitBatchRequest, PrepareRequest, PrepareResponseAck, PrepareResponseNack, PrepareBatchRequest, \
+    PrepareBatchResponse, DivergedResponse, PingRequest, PongResponse, ExecutedFrontier
+from dsm.epaxos.replica.executor.main import DepthFirstHelper, ExecutorActor
+from dsm.epaxos.replica.leader.main import LeaderCoroutine
+from dsm.epaxos.replica.main.ev import Reply
+from dsm.epaxos.replica.main.main import MainCoroutine
+from dsm.epaxos.replica.quorum.ev import Quorum, Configuration
+from dsm.epaxos.replica.state.ev import Load, CheckpointEvent, InstanceState
+from dsm.epaxos.stats.trace import Tracer, Level, READY, EXECUTE
+
+REPLICAS = 5
+
+# a benchmark is built from (random, param) and returns a function doing `ops` operations.
+# Building it is not timed, so every run starts from the same state.
+T_bench = Callable[[random.Random, Any], Tuple[Callable[[], Any], int]]
+
+
+class Bench(NamedTuple):
+    name: str
+    params: List[Any]
+    fn: T_bench
+
+
+class Result(NamedTuple):
+    name: str
+    param: str
+    ops: int
+    best: float
+    median: float
+
+    @property
+    def ns_per_op(self):
+        return self.best / self.ops * 1e9
+
+    def __str__(self):
+        return f'{self.name:<16} {self.param:<30} {self.ops:>7} ops {self.ns_per_op:>12.0f} ns/op ' \
+               f'(median {self.median / self.ops * 1e9:0.0f})'
+
+
+BENCHES = []  # type: List[Bench]
+
+
+def bench(name, params):
+    def wrapper(fn: T_bench):
+        BENCHES.append(Bench(name, params, fn))
+        return fn
+
+    return wrapper
+
+
+def _command_id(rnd: random.Random):
+    return CommandID.from_parts(rnd.getrandbits(48), rnd.randint(1, REPLICAS), rnd.getrandbits(32), rnd.getrandbits(32))
+
+
+def _slot(rnd: random.Random):
+    return Slot(rnd.randint(1, REPLICAS), rnd.randint(0, 100000))
+
+
+def _ballot(rnd: random.Random):
+    return Ballot(0, rnd.randint(0, 10), rnd.randint(1, REPLICAS))
+
+
+def _command(rnd: random.Random, keys=2):
+    return Command(_command_id(rnd), Mutator('SET', [rnd.randint(0, 1000) for _ in range(keys)]))
+
+
+def _deps(rnd: random.Random, n=REPLICAS):
+    return sorted(_slot(rnd) for _ in range(n))
+
+
+def _packet(rnd: random.Random, t):
+    s, b, c, d = _slot(rnd), _ballot(rnd), _command(rnd), _deps(rnd)
+    seq = rnd.randint(0, 100000)
+
+    payloads = {
+        ClientRequest: lambda: ClientRequest(c),
+        ClientResponse: lambda: ClientResponse(c),
+        ClientRejected: lambda: ClientRejected(c, 'TOO_OLD'),
+        PreAcceptRequest: lambda: PreAcceptRequest(s, b, c, seq, d),
+        PreAcceptResponseAck: lambda: PreAcceptResponseAck(s, b, seq, d, [rnd.random() < 0.5 for _ in d]),
+        PreAcceptResponseNack: lambda: PreAcceptResponseNack(s, b, 'reason'),
+        AcceptRequest: lambda: AcceptRequest(s, b, c, seq, d),
+        AcceptResponseAck: lambda: AcceptResponseAck(s, b),
+        AcceptResponseNack: lambda: AcceptResponseNack(s, b),
+        CommitRequest: lambda: CommitRequest(s, b, c, seq, d),
+        CommitBatchRequest: lambda: CommitBatchRequest(_deps(rnd, 10), [_ballot(rnd) for _ in range(10)]),
+        PrepareRequest: lambda: PrepareRequest(s, b),
+        PrepareResponseAck: lambda: PrepareResponseAck(s, b, c, seq, d, Stage.Accepted),
+        PrepareResponseNack: lambda: PrepareResponseNack(s, b),
+        PrepareBatchRequest: lambda: PrepareBatchRequest(seq, _deps(rnd, 10), [_ballot(rnd) for _ in range(10)]),
+        PrepareBatchResponse: lambda: PrepareBatchResponse(
+            seq,
+            [PrepareResponseAck(_slot(rnd), b, _command(rnd), seq, _deps(rnd), Stage.Committed) for _ in range(5)],
+            [PrepareResponseNack(_slot(rnd), b) for _ in range(5)],
+            []
+        ),
+        DivergedResponse: lambda: DivergedResponse(s),
+        PingRequest: lambda: PingRequest(seq),
+        PongResponse: lambda: PongResponse(seq),
+        ExecutedFrontier: lambda: ExecutedFrontier(sorted(Slot(i, seq) for i in range(1, REPLICAS + 1))),
+    }
+
+    return Packet(s.replica_id, rnd.randint(1, REPLICAS), t.__name__, payloads[t]())
+
+
+@bench('encode', [x.__name__ for x in PACKETS])
+def bench_encode(rnd, param, n=200):
+    t = {x.__name__: x for x in PACKETS}[param]
+    packets = [_packet(rnd, t) for _ in range(n)]
+
+    def run():
+        for p in packets:
+            serialize(p)
+
+    return run, n
+
+
+@bench('decode', [x.__name__ for x in PACKETS])
+def bench_decode(rnd, param, n=200):
+    t = {x.__name__: x for x in PACKETS}[param]
+    bodies = [serialize(_packet(rnd, t))[4:] for _ in range(n)]
+
+    def run():
+        for b in bodies:
+            deserialize(b)
+
+    return run, n
+
+
+@bench('slot.keys', ['set-Slot', 'set-pack', 'dict-Slot', 'dict-pack', 'sort-Slot', 'sort-pack', 'sort-key'])
+def bench_slot_keys(rnd, param, n=5000):
+    # `Slot` tuples against the same slots packed into ints, as set and dict keys and sorted
+    op, how = param.split('-')
+    slots = [Slot(i % REPLICAS + 1, i // REPLICAS) for i in range(n)]
+    rnd.shuffle(slots)
+
+    keys = [x.pack() for x in slots] if how == 'pack' else slots
+    half = set(keys[::2])
+
+    if op == 'set':
+        def run():
+            x = set(keys)
+            x & half, x - half, [y in half for y in keys]
+    elif op == 'dict':
+        def run():
+            x = {y: True for y in keys}
+            [x[y] for y in keys]
+    elif how == 'key':
+        def run():
+            sorted(keys, key=Slot.pack)
+    else:
+        def run():
+            sorted(keys)
+
+    return run, n
+
+
+@bench('deps.xchange', [1, 4, 16, 64])
+def bench_xchange(rnd, keys, n=2000, keyspace=1000):
+    # commands of `keys` random keys each, proposed by the replicas in turn
+    cmds = [
+        (Slot(i % REPLICAS + 1, i // REPLICAS), Command(_command_id(rnd), Mutator('SET', rnd.sample(range(keyspace), keys))))
+        for i in range(n)
+    ]
+    cache = KeyedDepsCache()
+
+    def run():
+        for slot, cmd in cmds:
+            cache.xchange(slot, cmd)
+
+    return run, n
+
+
+@bench('deps.checkpoint', [100, 1000, 10000])
+def bench_xchange_cp(rnd, keyspace, n=100):
+    # a checkpoint depends on everything in the cache, after `keyspace` keys have been seen since the last one
+    cache = KeyedDepsCache()
+    for i, key in enumerate(range(keyspace)):
+        cache.xchange(Slot(i % REPLICAS + 1, i // REPLICAS), Command(_command_id(rnd), Mutator('SET', [key])))
+    store, max_slots, max_seq = dict(cache.store), dict(cache.max_slots), cache.max_seq
+
+    cps = [(Slot(1, keyspace + i), Command(_command_id(rnd), Checkpoint(i))) for i in range(n)]
+
+    def run():
+        for slot, cmd in cps:
+            cache.store, cache.max_slots, cache.max_seq = store, max_slots, max_seq
+            cache.xchange(slot, cmd)
+
+    return run, n
+
+
+@bench('deps.range', ['keys-10', 'ranges-10', 'keys-100', 'ranges-100', 'keys-1000', 'ranges-1000'])
+def bench_xchange_range(rnd, param, n=500, keyspace=10000):
+    # every tenth command writes `width` keys from a random one on, either as a range or listing the keys
+    how, width = param.split('-')
+    width = int(width)
+
+    def cmd(i):
+        if i % 10:
+            return Mutator('SET', [rnd.randrange(keyspace)])
+
+        lo = rnd.randrange(keyspace - width)
+
+        if how == 'keys':
+            return Mutator('DEL', list(range(lo, lo + width)))
+        else:
+            return RangeMutator('DEL', [], [KeyRange(lo, lo + width)])
+
+    cmds = [(Slot(i % REPLICAS + 1, i // REPLICAS), Command(_command_id(rnd), cmd(i))) for i in range(n)]
+    cache = KeyedDepsCache()
+
+    def run():
+        for slot, cmd in cmds:
+            cache.xchange(slot, cmd)
+
+    return run, n
+
+
+def _committed(rnd: random.Random, slot: Slot, stage: Stage):
+    return InstanceStoreState(slot.ballot_initial(), State(stage, _command(rnd), 0, _deps(rnd)))
+
+
+@bench('store.update', ['PreAccepted', 'Committed', 'PreAccepted-Accepted-Committed'])
+def bench_store_update(rnd, stages, n=1000):
+    stages = [Stage[x] for x in stages.split('-')]
+    slots = [Slot(i % REPLICAS + 1, i // REPLICAS) for i in range(n)]
+    insts = [[_committed(rnd, slot, stage) for stage in stages] for slot in slots]
+
+    for x in insts:
+        for i in range(1, len(x)):
+            x[i] = InstanceStoreState(x[i].ballot, x[i].state._replace(command=x[0].state.command))
+
+    store = InstanceStore()
+
+    def run():
+        for slot, xs in zip(slots, insts):
+            for x in xs:
+                store.update(slot, x)
+
+    return run, n * len(stages)
+
+
+@bench('store.set_cp', [1000, 10000])
+def bench_store_set_cp(rnd, n):
+    # purges `n` committed instances: the first checkpoint only starts the cycle
+    store = InstanceStore()
+
+    for i in range(n):
+        slot = Slot(i % REPLICAS + 1, i // REPLICAS)
+        store.update(slot, _committed(rnd, slot, Stage.Committed))
+
+    store.set_cp({i: Slot(i, n // REPLICAS + 1) for i in range(1, REPLICAS + 1)})
+
+    def run():
+        store.set_cp({i: Slot(i, n // REPLICAS + 2) for i in range(1, REPLICAS + 1)})
+        assert len(store.inst) == 0, len(store.inst)
+
+    return run, n
+
+
+@bench('leader.checkpoint', [1000, 10000])
+def bench_leader_cp(rnd, n, pending=10):
+    # a checkpoint recycles `n` slots, of which only the `pending` last ones still have a sub
+    leader = LeaderCoroutine(Quorum([2, 3, 4, 5], 1, 0, {}), Configuration())
+
+    for i in range(n - pending, n):
+        leader.subs[Slot(i % REPLICAS + 1, i // REPLICAS)] = None
+
+    cps = [{i: Slot(i, x * (n // REPLICAS)) for i in range(1, REPLICAS + 1)} for x in range(1, 4)]
+
+    def run():
+        for cp in cps:
+            for _ in leader.event(CheckpointEvent(Slot(1, 0), cp)):
+                pass
+
+        assert len(leader.subs) == 0, len(leader.subs)
+
+    return run, n
+
+
+@bench('executor.ready', [1, 16, 256])
+def bench_ready(rnd, window, n=2000, conflicts=2):
+    """
+    Every instance depends on the previous instance of its replica and on `conflicts` random instances close to it,
+    which may come later and so form cycles. The commits arrive shuffled within `window`.
+    """
+    slots = [Slot(i % REPLICAS + 1, i // REPLICAS) for i in range(n)]
+    deps = {}
+
+    for i, slot in enumerate(slots):
+        xs = set() if slot.instance_id == 0 else {Slot(slot.replica_id, slot.instance_id - 1)}
+        xs |= {slots[j] for j in (rnd.randint(max(0, i - 20), min(n - 1, i + 5)) for _ in range(conflicts)) if j != i}
+        deps[slot] = sorted(xs)
+
+    order = []
+    for i in range(0, n, window):
+        chunk = slots[i:i + window]
+        rnd.shuffle(chunk)
+        order.extend(chunk)
+
+    def run():
+        dph = DepthFirstHelper()
+        executed = set()
+
+        for slot in order:
+            executed.update(dph.ready(slot, [x for x in deps[slot] if x not in executed]))
+
+        assert len(executed) == n, (len(executed), n)
+
+    return run, n
+
+
+@bench('executor.commit', [1, 16, 256])
+def bench_commit(rnd, window, n=2000):
+    """
+    Committed instances handed to the executor, shuffled within `window`, each depending on the previous instance of
+    its replica and the ones just before it.
+    """
+    slots = [Slot(i % REPLICAS + 1, i // REPLICAS) for i in range(n)]
+    events = []
+
+    for i, slot in enumerate(slots):
+        deps = sorted(slots[max(0, i - REPLICAS):i])
+        events.append(InstanceState(slot, InstanceStoreState(slot.ballot_initial(), State(Stage.Committed, None, i, deps))))
+
+    order = []
+    for i in range(0, n, window):
+        chunk = events[i:i + window]
+        rnd.shuffle(chunk)
+        order.extend(chunk)
+
+    store = InstanceStore()
+    for x in events:
+        store.update(x.slot, x.inst)
+
+    def run():
+        executor = ExecutorActor(Quorum(list(range(2, REPLICAS + 1)), 1, 0, {}), store, Configuration())
+
+        for x in order:
+            for _ in executor.event(x):
+                pass
+
+    return run, n
+
+
+@bench('trace', ['OFF', 'INFO', 'DEBUG'])
+def bench_trace(rnd, level, n=10000):
+    # the executor records of a commit, at `level`; the records are written out by the writer thread meanwhile
+    tracer = Tracer(None if level == 'OFF' else os.devnull, Level[level], capacity=n)
+
+    def run():
+        for i in range(n):
+            if tracer.debug:
+                tracer(READY, 1, i, 2, 1, 0, 0)
+            if tracer.info:
+                tracer(EXECUTE, 1, i, 0, i)
+
+    return run, n
+
+
+class _Sub:
+    def __init__(self, nested):
+        self.nested = nested
+
+    def event(self, x):
+        for i in range(self.nested):
+            yield Load(Slot(1, i))
+        yield Reply(x)
+
+
+class _State:
+    def event(self, x):
+        yield Reply(x)
+
+
+@bench('route', [0, 1, 4])
+def bench_route(rnd, nested, n=2000):
+    # every packet is handled by an actor which loads `nested` slots from the state actor
+    sub = _Sub(nested)
+    main = MainCoroutine(_State(), sub, sub, sub, sub, sub, sub)
+    packets = [_packet(rnd, rnd.choice([PreAcceptRequest, PreAcceptResponseAck, ClientRequest])) for _ in range(n)]
+
+    def run():
+        for p in packets:
+            main.event(p)
+
+    return run, n
+
+
+def measure(b: Bench, param, seed: int, repeat: int) -> Result:
+    times = []
+    ops = 0
+
+    for _ in range(repeat):
+        run, ops = b.fn(random.Random(f'{seed}-{b.name}-{param}'), param)
+
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            t = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - t)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    times = sorted(times)
+
+    return Result(b.name, str(param), ops, times[0], times[len(times) // 2])
+
+
+def run_all(seed=0, repeat=5, only: Optional[List[str]] = None):
+    for b in BENCHES:
+        if only and not any(b.name.startswith(x) for x in only):
+            continue
+
+        for param in b.params:
+            yield measure(b, param, seed, repeat)
+
+
+def compare(results: List[Result], baseline: Dict[Tuple[str, str], Result], threshold: float):
+    """
+    :return: results slower than their baseline by more than `threshold`
+    """
+    r = []
+
+    for x in results:
+        y = baseline.get((x.name, x.param))
+
+        if y is not None and x.ns_per_op > y.ns_per_op * (1. + threshold):
+            r.append((x, y))
+
+    return r
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks of the protocol hot paths')
+    parser.add_argument('only', nargs='*', help='run the benchmarks with these prefixes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help='report the best of these many runs')
+    parser.add_argument('--json', help='write the results to this file, a JSON object per line')
+    parser.add_argument('--compare', help='compare against the results in this file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='report results slower by this much')
+    args = parser.parse_args()
+
+    results = []
+
+    for x in run_all(args.seed, args.repeat, args.only):
+        print(x)
+        results.append(x)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            for x in results:
+                f.write(json.dumps({**x._asdict(), 'ns_per_op': x.ns_per_op}) + '\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = [json.loads(x) for x in f if x.strip()]
+            baseline = {(x['name'], x['param']): Result(*(x[k] for k in Result._fields)) for x in baseline}
+
+        slower = compare(results, baseline, args.threshold)
+
+        for x, y in slower:
+            print(f'SLOWER {x.name} {x.param}: {y.ns_per_op:0.0f} -> {x.ns_per_op:0.0f} ns/op')
+
+        if len(slower):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,50 +1,43 @@
-import numpy as np
+import pickle
+
 import matplotlib.pyplot as plt
-import seaborn
 
+from dsm.epaxos.stats.histogram import Histogram
 from dsm_tests.epaxos.zeromq import clients
 
-def myplot(x, y, nb=32, xsize=500, ysize=500):
-    xmin = np.min(x)
-    xmax = np.max(x)
-    ymin = np.min(y)
-    ymax = np.max(y)
-
-    x0 = (xmin+xmax)/2.
-    y0 = (ymin+ymax)/2.
-
-    pos = np.zeros([3, len(x)])
-    pos[0,:] = x
-    pos[1,:] = y
-    w = np.ones(len(x))
-
-    P = sph.Particles(pos, w, nb=nb)
-    S = sph.Scene(P)
-    S.update_camera(r='infinity', x=x0, y=y0, z=0,
-                    xsize=xsize, ysize=ysize)
-    R = sph.Render(S)
-    R.set_logscale()
-    img = R.get_image()
-    extent = R.get_extent()
-    for i, j in zip(xrange(4), [x0,x0,y0,y0]):
-        extent[i] += j
-    # print extent
-    return img, extent
+PERCENTILES = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999, 0.9999]
+
+
+def load(peer_id) -> Histogram:
+    with open(f'latencies-{peer_id}.hist', 'rb') as f:
+        return pickle.load(f)
+
 
 def main():
-    arrays = [np.load(f'latencies-{peer_id}.npy') for peer_id in clients]
+    hists = {peer_id: load(peer_id) for peer_id in clients}
+    total = Histogram.merged(hists.values())
+
+    for peer_id, hist in hists.items():
+        print(peer_id, hist)
+    print('ALL', total)
+
+    fig = plt.figure(1, figsize=(10, 6))
+    ax1 = fig.add_subplot(1, 1, 1)
 
-    fig = plt.figure(1, figsize=(10,10))
+    # the percentile spectrum: 1 / (1 - p) on a log scale, as HdrHistogram plots it
+    xs = [1. / (1. - p) for p in PERCENTILES]
 
-    for idx, arr in enumerate(arrays):
-        ax1 = fig.add_subplot(3, 4, idx + 1)
-        xs = np.arange(len(arr))
-        arr[arr > 0.02] = 0.02
+    for peer_id, hist in hists.items():
+        ax1.plot(xs, [hist.percentile(p) * 1000 for p in PERCENTILES], 'k-', alpha=0.2)
+    ax1.plot(xs, [total.percentile(p) * 1000 for p in PERCENTILES], 'r-')
 
-        ax1.plot(xs,arr,'k.', markersize=1)
+    ax1.set_xscale('log')
+    ax1.set_xticks(xs)
+    ax1.set_xticklabels([f'{p * 100:g}%' for p in PERCENTILES])
+    ax1.set_ylabel('latency, ms')
     fig.tight_layout()
     plt.show()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
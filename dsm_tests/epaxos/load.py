@@ -0,0 +1,147 @@
+import argparse
+import logging
+import os
+import signal
+import tempfile
+import time
+from multiprocessing import Process, Queue
+from typing import List
+
+from dsm.epaxos.net.impl.generic.cli import replica_server, replica_load
+from dsm.epaxos.net.impl.generic.load import Workload, LoadGenerator, LoadPoint, ARRIVALS, DISTRIBUTIONS
+from dsm.epaxos.net.impl.sim.cluster import SimCluster
+from dsm.epaxos.net.impl.tcp.client import TCPReplicaClient
+from dsm.epaxos.net.impl.tcp.server import TCPReplicaServer
+from dsm.epaxos.net.impl.udp.client import UDPReplicaClient
+from dsm.epaxos.net.impl.udp.server import UDPReplicaServer
+from dsm.epaxos.net.impl.udp.split import UDPSplitReplicaServer
+from dsm.epaxos.net.impl.zeromq.client import ZMQReplicaClient
+from dsm.epaxos.net.impl.zeromq.server import ZMQReplicaServer
+from dsm.epaxos.net.shard import ShardMap
+from dsm.epaxos.replica.quorum.ev import ReplicaAddress
+
+replicas = {
+    i: ReplicaAddress(f'tcp://127.0.0.1:{60000 + i}', f'tcp://127.0.0.1:{61000+i}') for i in range(1, 6)
+}
+
+
+def unix_replicas(path: str):
+    return {
+        i: ReplicaAddress(f'unix://{path}/replica-{i}', f'unix://{path}/client-{i}') for i in replicas.keys()
+    }
+
+
+def workload(args, rate) -> Workload:
+    return Workload(
+        rate,
+        args.arrival,
+        args.keys,
+        args.keyspace,
+        args.keys_per_command,
+        args.conflict,
+        args.zipf_s,
+        args.hot_keys,
+        args.hot_share,
+    )
+
+
+def sweep_sim(args) -> List[LoadPoint]:
+    logging.basicConfig(level=logging.CRITICAL)
+
+    cluster = SimCluster(len(replicas), args.seed)
+
+    r = []
+    for i, rate in enumerate(args.rates):
+        point = cluster.load(LoadGenerator(workload(args, rate), args.seed + i, cluster.clock), args.duration)
+        print(point)
+        r.append(point)
+    return r
+
+
+def sweep_net(args) -> List[LoadPoint]:
+    shards = ShardMap(args.groups, 100 if args.workers else 0)
+
+    # either a process per group of a replica, or one running all of its groups
+    processes = [[g] for g in range(args.groups)] if args.workers else [None]
+
+    if args.transport == 'zmq':
+        server_cls, client_cls = ZMQReplicaServer, ZMQReplicaClient
+    elif args.transport in ('tcp', 'unix'):
+        server_cls, client_cls = TCPReplicaServer, TCPReplicaClient
+    else:
+        server_cls, client_cls = UDPSplitReplicaServer if args.split else UDPReplicaServer, UDPReplicaClient
+
+    addrs = unix_replicas(tempfile.mkdtemp(prefix='dsm-')) if args.transport == 'unix' else replicas
+
+    servers = []  # type: List[Process]
+    for replica_id in addrs.keys():
+        for groups in processes:
+            p = Process(target=replica_server, args=(server_cls, 0, replica_id, addrs),
+                        kwargs=dict(shards=shards, groups=groups), name=f'dsm-replica-{replica_id}')
+            servers.append(p)
+            p.start()
+
+    time.sleep(1.)
+
+    r = []
+    try:
+        for i, rate in enumerate(args.rates):
+            results = Queue()
+            clients = []  # type: List[Process]
+            for client_id in range(100, 100 + args.clients):
+                p = Process(
+                    target=replica_load,
+                    args=(client_cls, client_id, addrs, workload(args, rate / args.clients), args.duration,
+                          args.seed + i * args.clients + client_id, results, shards),
+                    name=f'dsm-load-{client_id}'
+                )
+                clients.append(p)
+                p.start()
+
+            points = [results.get() for _ in clients]
+
+            for p in clients:
+                p.join()
+
+            point = LoadPoint.merge([x for x in points if x is not None])
+            print(point)
+            r.append(point)
+    finally:
+        for p in servers:
+            os.kill(p.pid, signal.SIGTERM)
+        for p in servers:
+            p.join()
+    return r
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Open-loop throughput vs. latency sweep')
+    parser.add_argument('rates', type=float, nargs='+', help='total commands per second, one run per rate')
+    parser.add_argument('--sim', action='store_true', help='run on the in-process simulator')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--groups', type=int, default=1, help='independent EPaxos groups the keys are sharded over')
+    parser.add_argument('--workers', action='store_true', help='run every group of a replica in a process of its own')
+    parser.add_argument('--split', action='store_true', help='do the socket I/O of a replica in a process of its own')
+    parser.add_argument('--transport', choices=['udp', 'zmq', 'tcp', 'unix'], default='udp')
+    parser.add_argument('--duration', type=float, default=10.)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--arrival', choices=ARRIVALS, default='poisson')
+    parser.add_argument('--keys', choices=DISTRIBUTIONS, default='uniform')
+    parser.add_argument('--keyspace', type=int, default=1000)
+    parser.add_argument('--keys-per-command', type=int, default=1)
+    parser.add_argument('--conflict', type=float, default=1.)
+    parser.add_argument('--zipf-s', type=float, default=0.99)
+    parser.add_argument('--hot-keys', type=float, default=0.01)
+    parser.add_argument('--hot-share', type=float, default=0.9)
+    args = parser.parse_args()
+
+    points = sweep_sim(args) if args.sim else sweep_net(args)
+
+    print('rate\tthroughput\tp50_ms\tp99_ms\tp999_ms')
+    for x in points:
+        p50, p99, p999 = (v * 1000 for _, v in x.latency.percentiles())
+        print(f'{x.rate:0.0f}\t{x.throughput:0.2f}\t{p50:0.2f}\t{p99:0.2f}\t{p999:0.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,123 +1,64 @@
-from itertools import count
-from typing import Dict, AnyStr
-
-from dsm.epaxos.channel import Channel, Receive, Send, Peer
-from dsm.epaxos.packet import ClientRequest
-from dsm.epaxos.replica import Replica, logger
-from dsm.epaxos.state import Command
-
-
-class ClientPeer(Peer):
-    def __init__(self, id):
-        self.id = id
-
-    def receive(self, event: Receive):
-        logger.warning(f'Client {self.id} received {event}')
-
-
-ch_w_11 = Channel()
-ch_w_12 = Channel()
-ch_w_101 = Channel()
-ch_w_102 = Channel()
-ch_w_103 = Channel()
-
-ch_r_11 = Channel()
-ch_r_12 = Channel()
-ch_r_101 = Channel()
-ch_r_102 = Channel()
-ch_r_103 = Channel()
-
-epoch = 0
-cl_11 = 11
-cl_12 = 12
-repl_1 = 101
-repl_2 = 102
-repl_3 = 103
-q = {repl_1, repl_2, repl_3}
-
-replica_1 = Replica(
-    ch_w_101,
-    epoch,
-    repl_1,
-    q,
-    q
-)
-
-replica_2 = Replica(
-    ch_w_102,
-    epoch,
-    repl_2,
-    q,
-    q,
-)
-
-replica_3 = Replica(
-    ch_w_103,
-    epoch,
-    repl_3,
-    q,
-    q,
-)
-
-client_11 = ClientPeer(cl_11)
-client_12 = ClientPeer(cl_12)
-
-comm_1 = Command(1001)
-comm_2 = Command(1002)
-comm_3 = Command(1003)
-comm_4 = Command(1004)
-comm_5 = Command(1005)
-
-channel_write_map = {
-    cl_11: ch_w_11,
-    cl_12: ch_w_12,
-    repl_1: ch_w_101,
-    repl_2: ch_w_102,
-    repl_3: ch_w_103,
-}
-
-channel_read_map = {
-    cl_11: ch_r_11,
-    cl_12: ch_r_12,
-    repl_1: ch_r_101,
-    repl_2: ch_r_102,
-    repl_3: ch_r_103,
-}
-
-client_map = {
-    cl_11: client_11,
-    cl_12: client_12,
-    repl_1: replica_1,
-    repl_2: replica_2,
-    repl_3: replica_3,
-}
-
-
-def plex(channel_write_map, channel_read_map):
-    for k, v in channel_write_map.items():
-        for item in v.pop_while():
-            if isinstance(item, Send):
-                print(f'{k}\t->\t{item.peer_id}\t{item.packet}')
-                channel_read_map[item.peer].notify(Receive(k, item.packet))
-
-
-def process(channel_map: Dict[AnyStr, Channel], client_map: Dict[AnyStr, Peer]):
-    r = 0
-    for k, v in channel_map.items():
-        for item in v.pop_while():
-            r += 1
-            client_map[k].receive(item)
-    return r
-
-
-ch_w_11.notify(Send(repl_1, ClientRequest(comm_1)))
-ch_w_12.notify(Send(repl_3, ClientRequest(comm_2)))
-ch_w_12.notify(Send(repl_2, ClientRequest(comm_3)))
-ch_w_12.notify(Send(repl_2, ClientRequest(comm_4)))
-ch_w_12.notify(Send(repl_2, ClientRequest(comm_5)))
-
-for i in count():
-    print(f'RTT: {i + 1}')
-    plex(channel_write_map, channel_read_map)
-    if process(channel_read_map, client_map) == 0:
-        break
+import argparse
+import logging
+
+from dsm.epaxos.net.impl.sim.cluster import SimCluster
+from dsm.epaxos.net.impl.sim.network import LinkConfig
+from dsm.epaxos.stats.trace import Level
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run replicas in-process on a simulated network')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replicas', type=int, default=5)
+    parser.add_argument('--commands', type=int, default=2000)
+    parser.add_argument('--per-tick', type=int, default=10)
+    parser.add_argument('--keys', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0005)
+    parser.add_argument('--jitter', type=float, default=0.0002)
+    parser.add_argument('--loss', type=float, default=0.)
+    parser.add_argument('--kill', type=int, default=None, help='kill the last replica at this tick')
+    parser.add_argument('--serialize', action='store_true', help='pass every packet through the wire format')
+    parser.add_argument('--spans', action='store_true', help='report the CPU time per phase of every replica')
+    parser.add_argument('--log-dir', default=None, help='write the traces of the replicas here')
+    parser.add_argument('--trace-level', default='INFO', choices=[x.name for x in Level])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+
+    cluster = SimCluster(
+        args.replicas,
+        args.seed,
+        LinkConfig(args.latency, args.jitter, args.loss),
+        serialize=args.serialize,
+        log_dir=args.log_dir,
+        trace_level=Level[args.trace_level],
+    )
+
+    for replica in cluster.replicas.values():
+        replica.spans.enabled = args.spans
+
+    sent = 0
+
+    while sent < args.commands or len(cluster.pending):
+        for _ in range(min(args.per_tick, args.commands - sent)):
+            cluster.request(cluster.command([cluster.random.randint(1, args.keys)]), client_id=100 + sent % 10)
+            sent += 1
+
+        if cluster.ticks == args.kill:
+            cluster.kill(args.replicas)
+
+        cluster.step()
+
+        if cluster.ticks > 100 * 33:
+            break
+
+    print(cluster.report())
+    print(f'Diverged={len(cluster.diverged())}')
+
+    if args.spans:
+        for replica_id, replica in cluster.replicas.items():
+            print(replica_id, replica.spans)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,25 +5,26 @@ from typing import List
 
 from dsm.epaxos.net.impl.generic.cli import replica_client, replica_server
 from dsm.epaxos.replica.quorum.ev import ReplicaAddress
-from dsm.epaxos.net.impl.udp.client import UDPReplicaClient
-from dsm.epaxos.net.impl.udp.server import UDPReplicaServer
-# from dsm.epaxos.net.impl.zeromq.client import ZMQReplicaClient
-# from dsm.epaxos.net.impl.zeromq.server import ZMQReplicaServer
+from dsm.epaxos.net.impl.zeromq.client import ZMQReplicaClient
+from dsm.epaxos.net.impl.zeromq.server import ZMQReplicaServer
 
 replicas = {
     i: ReplicaAddress(f'tcp://127.0.0.1:{60000 + i}', f'tcp://127.0.0.1:{61000+i}') for i in range(1, 6)
 }
 
+metrics = {
+    i: f'http://127.0.0.1:{62000 + i}' for i in replicas.keys()
+}
+
 clients = list(range(100, 110))
 
 
 def main():
-    # server_cls, client_cls = ZMQReplicaServer, ZMQReplicaClient
-    server_cls, client_cls = UDPReplicaServer, UDPReplicaClient
+    server_cls, client_cls = ZMQReplicaServer, ZMQReplicaClient
 
     ress = []  # type: List[Process]
     for replica_id in replicas.keys():
-        res = Process(target=replica_server, args=(server_cls, 0, replica_id, replicas),
+        res = Process(target=replica_server, args=(server_cls, 0, replica_id, replicas, metrics[replica_id]),
                       name=f'dsm-replica-{replica_id}')
         ress.append(res)
     for client_id in clients:
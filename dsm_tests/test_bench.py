@@ -0,0 +1,13 @@
+import random
+import unittest
+
+from dsm_tests.epaxos.bench import BENCHES
+
+
+class BenchTest(unittest.TestCase):
+    def test_run(self):
+        # keeps the benchmarks runnable, the timings are not checked
+        for b in BENCHES:
+            run, ops = b.fn(random.Random(0), b.params[0])
+            run()
+            self.assertGreater(ops, 0)
@@ -0,0 +1,95 @@
+import time
+import unittest
+from collections import deque
+
+from dsm.epaxos.cmd.state import Command, CommandID, Mutator
+from dsm.epaxos.net.impl.generic.client import ReplicaClient, RequestRejected
+from dsm.epaxos.net.impl.generic.load import LoadGenerator, Workload, open_loop
+from dsm.epaxos.net.packet import Packet, ClientResponse, ClientRejected, ClientRequest, ClientStarted
+from dsm.epaxos.replica.quorum.ev import ReplicaAddress
+
+REPLICAS = {i: ReplicaAddress(f'udp://127.0.0.1:{60000 + i}', f'udp://127.0.0.1:{61000 + i}') for i in range(1, 4)}
+
+
+class ScriptedClient(ReplicaClient):
+    """
+    Answers every request with the packets queued in `replies`.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.replies = deque()
+        self.inbox = deque()
+        self.sent = []
+
+    def poll(self, max_wait):
+        return len(self.inbox) > 0
+
+    def send_packet(self, replica_id, payload, group=0):
+        self.sent.append(payload)
+
+        if isinstance(payload, ClientRequest) and len(self.replies):
+            self.inbox.extend(Packet(replica_id, self.peer_id, x.__class__.__name__, x) for x in self.replies.popleft())
+
+    def recv(self):
+        return self.inbox.popleft()
+
+
+def _command():
+    return Command(CommandID.create(), Mutator('SET', [1]))
+
+
+class ClientTest(unittest.TestCase):
+    def test_late_replies(self):
+        client = ScriptedClient(100, REPLICAS)
+        earlier, command = _command(), _command()
+
+        client.replies.append([ClientResponse(earlier), ClientRejected(earlier, 'TOO_OLD'), ClientResponse(command)])
+
+        _, rtn = client.request(command)
+        self.assertEqual(rtn.payload, ClientResponse(command))
+
+    def test_rejected(self):
+        client = ScriptedClient(100, REPLICAS)
+        command = _command()
+
+        client.replies.append([ClientRejected(command, 'CROSS_SHARD')])
+
+        with self.assertRaises(RequestRejected) as e:
+            client.request(command)
+
+        self.assertEqual(e.exception.reason, 'CROSS_SHARD')
+
+    def test_started(self):
+        client = ScriptedClient(100, REPLICAS)
+        command = _command()
+        bound = command._replace(id=command.id.bind(2, 7))
+
+        client.replies.append([ClientStarted(bound)])
+        client.replies.append([ClientResponse(bound)])
+
+        client.request(command)
+
+        # resent with the ID bound to the slot
+        self.assertEqual([x.command for x in client.sent], [command, bound])
+
+    def test_open_loop_from_schedule(self):
+        class StalledClient(ScriptedClient):
+            stalled = False
+
+            def poll(self, max_wait):
+                # the client is stalled once for 50ms, while the commands keep arriving
+                if not self.stalled:
+                    self.stalled = True
+                    time.sleep(0.05)
+                return super().poll(max_wait)
+
+            def send_packet(self, replica_id, payload, group=0):
+                self.inbox.append(Packet(replica_id, self.peer_id, ClientResponse.__name__,
+                                         ClientResponse(payload.command)))
+
+        point = open_loop(StalledClient(100, REPLICAS), LoadGenerator(Workload(200, 'constant')), 0.1, ping_every=0)
+
+        self.assertEqual(point.done, point.sent)
+        # the first command was due after 5ms, and only sent after the stall
+        self.assertGreater(point.latency.max, 0.03)
@@ -0,0 +1,40 @@
+import random
+import unittest
+
+from dsm.epaxos.stats.histogram import Histogram
+
+
+class HistogramTest(unittest.TestCase):
+    def test_buckets(self):
+        h = Histogram()
+
+        for units in range(0, 1 << 16, 7):
+            idx = h.index(units)
+            self.assertLessEqual(h.lower(idx), units)
+            self.assertLessEqual(units, h.upper(idx))
+            self.assertLess(h.upper(idx) - h.lower(idx), max(units, 1) * 2 ** (1 - h.bits))
+
+    def test_percentiles(self):
+        rnd = random.Random(0)
+        xs = sorted(rnd.expovariate(100) for _ in range(10000))
+
+        h = Histogram()
+        for x in xs:
+            h.record(x)
+
+        for p in (0.5, 0.99, 0.999):
+            self.assertAlmostEqual(h.percentile(p), xs[int(p * len(xs)) - 1], delta=xs[int(p * len(xs))] / 32)
+
+        self.assertEqual(h.percentile(1.), xs[-1])
+
+    def test_merge(self):
+        a, b, c = Histogram(), Histogram(), Histogram()
+
+        for i in range(1000):
+            (a if i % 3 else b).record(i / 1000)
+            c.record(i / 1000)
+
+        m = Histogram.merged([a, b])
+        self.assertEqual(m.counts, c.counts)
+        self.assertEqual((m.count, m.min, m.max), (c.count, c.min, c.max))
+        self.assertEqual(m.percentile(0.99), c.percentile(0.99))
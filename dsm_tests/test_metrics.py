@@ -0,0 +1,123 @@
+import os
+import socket
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+
+from dsm.epaxos.stats.metrics import Registry, Registries
+from dsm.epaxos.stats.server import MetricsServer
+from dsm.epaxos.stats.trace import Tracer, Level, EXECUTE, READY, decode
+
+
+def _registry(replica_id='1'):
+    r = Registry(labels={'replica': replica_id})
+
+    r.counter('sent', 'Packets "sent"\nby type', ('type',)).labels('Ping\\Pong').inc(3)
+    r.gauge('waiting').set(2)
+
+    lat = r.summary('latency_seconds', 'Latency')
+    for x in range(1, 101):
+        lat.record(x / 1000)
+
+    return r
+
+
+def _unix_get(path: str, url: str) -> bytes:
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(path)
+    s.sendall(f'GET {url} HTTP/1.0\r\n\r\n'.encode())
+
+    r = b''
+    while True:
+        x = s.recv(4096)
+        if not len(x):
+            break
+        r += x
+
+    s.close()
+    return r
+
+
+class MetricsTest(unittest.TestCase):
+    def test_expose(self):
+        lines = _registry().expose().splitlines()
+
+        self.assertIn('# HELP epaxos_sent Packets \\"sent\\"\\nby type', lines)
+        self.assertIn('# TYPE epaxos_sent counter', lines)
+        self.assertIn('epaxos_sent{replica="1",type="Ping\\\\Pong"} 3', lines)
+
+        self.assertIn('# TYPE epaxos_waiting gauge', lines)
+        self.assertNotIn('# HELP epaxos_waiting ', lines)
+        self.assertIn('epaxos_waiting{replica="1"} 2', lines)
+
+        self.assertIn('# TYPE epaxos_latency_seconds summary', lines)
+        quantiles = [x for x in lines if x.startswith('epaxos_latency_seconds{quantile=')]
+        self.assertEqual(len(quantiles), 4)
+        self.assertTrue(quantiles[0].startswith('epaxos_latency_seconds{quantile="0.5",replica="1"} 0.05'))
+        self.assertIn('epaxos_latency_seconds_count{replica="1"} 100', lines)
+        self.assertTrue(any(x.startswith('epaxos_latency_seconds_sum{replica="1"} 5.05') for x in lines))
+
+    def test_registries(self):
+        text = Registries([_registry('1'), _registry('2')]).expose()
+
+        self.assertEqual(text.count('# TYPE epaxos_sent counter'), 1)
+        self.assertIn('epaxos_waiting{replica="1"} 2', text)
+        self.assertIn('epaxos_waiting{replica="2"} 2', text)
+
+    def test_http(self):
+        registry = _registry()
+
+        with MetricsServer(registry, 'http://127.0.0.1:0') as server:
+            port = server.server.server_address[1]
+
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as r:
+                self.assertEqual(r.status, 200)
+                self.assertEqual(r.read().decode(), registry.expose())
+
+            with self.assertRaises(urllib.error.HTTPError) as e:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/other')
+            self.assertEqual(e.exception.code, 404)
+
+    def test_unix(self):
+        registry = _registry()
+        path = os.path.join(tempfile.mkdtemp(), 'metrics.sock')
+
+        with MetricsServer(registry, f'unix://{path}'):
+            head, body = _unix_get(path, '/metrics').split(b'\r\n\r\n', 1)
+
+            self.assertTrue(head.startswith(b'HTTP/1.0 200'), head)
+            self.assertEqual(body.decode(), registry.expose())
+
+        self.assertFalse(os.path.exists(path))
+
+
+class TraceTest(unittest.TestCase):
+    def test_trace(self):
+        path = os.path.join(tempfile.mkdtemp(), 'replica-1.trace')
+        tracer = Tracer(path, Level.INFO, capacity=2, interval=60)
+
+        self.assertTrue(tracer.info)
+        self.assertFalse(tracer.debug)
+
+        tracer(READY, 1, 0, 0, 1, 0, 0)
+        for i in range(3):
+            tracer(EXECUTE, 1, i, 0, -i)
+        tracer.close()
+
+        with open(path, 'rb') as f:
+            records = [(name, fields) for _, name, fields in decode(f)]
+
+        self.assertEqual(records, [
+            ('EXECUTE', {'origin': 1, 'instance': 0, 'checkpoint': 0, 'commits': 0}),
+            ('EXECUTE', {'origin': 1, 'instance': 1, 'checkpoint': 0, 'commits': -1}),
+            ('DROPPED', {'count': 1}),
+        ])
+
+    def test_off(self):
+        tracer = Tracer(None, Level.DEBUG)
+
+        self.assertFalse(tracer.info)
+        tracer(EXECUTE, 1, 0, 0, 0)
+        self.assertEqual(len(tracer.records), 0)
+        tracer.close()
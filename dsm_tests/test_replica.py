@@ -0,0 +1,337 @@
+import unittest
+
+from dsm.epaxos.cmd.state import Command, CommandID, Mutator, Checkpoint, RangeMutator, KeyRange
+from dsm.epaxos.inst.deps.cache import KeyedDepsCache, RangeIndex, CacheState
+from dsm.epaxos.inst.state import Slot, Ballot, State, Stage
+from dsm.epaxos.inst.store import InstanceStoreState, SlotTooOld, SlotWindow
+from dsm.epaxos.net import packet
+from dsm.epaxos.replica.acceptor.sub import acceptor_commit_batch
+from dsm.epaxos.replica.acceptor.timeout import TimeoutEstimator
+from dsm.epaxos.replica.executor.flags import SlotFlags, COMMITTED, EXECUTED
+from dsm.epaxos.replica.executor.frontier import LowWaterMark
+from dsm.epaxos.replica.leader.batch import PrepareBatch
+from dsm.epaxos.replica.leader.ev import LeaderStop
+from dsm.epaxos.replica.leader.main import LeaderCoroutine
+from dsm.epaxos.replica.net.ev import Send
+from dsm.epaxos.replica.quorum.ev import Quorum, Configuration
+from dsm.epaxos.replica.state.ev import Load, Store
+
+QUORUM = Quorum([2, 3, 4, 5], 1, 0, {})
+
+
+def drive(corout, insts):
+    """
+    Run the requests of `corout` against the instances in `insts`, the way the `StateActor` would.
+
+    :return: every request made
+    """
+    reqs = []
+    rep, exc = None, None
+
+    while True:
+        try:
+            req = corout.throw(exc) if exc is not None else corout.send(rep)
+        except StopIteration:
+            return reqs
+
+        reqs.append(req)
+        rep, exc = None, None
+
+        if isinstance(req, Load):
+            if req.slot in insts:
+                rep = insts[req.slot]
+            else:
+                exc = SlotTooOld(req.slot, None, None)
+        elif isinstance(req, Store):
+            insts[req.slot] = rep = req.inst
+
+
+def _inst(stage, ballot=Ballot(0, 1, 1)):
+    return InstanceStoreState(ballot, State(stage, None, 0, []))
+
+
+class TimeoutTest(unittest.TestCase):
+    def test_backoff(self):
+        config = Configuration(timeout_range=0)
+        est = TimeoutEstimator(QUORUM, config)
+
+        base = est.ticks()
+
+        self.assertEqual(base, round(config.timeout))
+        self.assertEqual(est.ticks(1), 2 * base)
+        self.assertEqual(est.ticks(2), 4 * base)
+        self.assertEqual(est.ticks(10), config.timeout_max)
+        self.assertEqual(est.ticks(1000), config.timeout_max)
+
+        est = TimeoutEstimator(QUORUM, Configuration(timeout_range=3))
+
+        for attempt in range(20):
+            self.assertLessEqual(est.ticks(attempt), config.timeout_max + 3)
+
+    def test_quorum_rtt(self):
+        est = TimeoutEstimator(QUORUM, Configuration(timeout_range=0), keep_times=2)
+
+        est.peer_rtt(2, 0.3)
+        self.assertEqual(est.quorum_rtt(), None)
+
+        # the slowest of the fastest `slow_size - 1` peers, by the worst of their recent RTTs
+        est.peer_rtt(2, 0.01)
+        est.peer_rtt(2, 0.05)
+        est.peer_rtt(3, 0.02)
+        est.peer_rtt(4, 0.2)
+
+        self.assertEqual(est.quorum_rtt(), 0.05)
+        self.assertAlmostEqual(est.seconds(), 0.05 * Configuration().timeout_rtt_mult)
+
+        # a busy quorum commits slowly, which pushes the timeout beyond the RTTs
+        est.commit_latency(0.4)
+        self.assertAlmostEqual(est.seconds(), 0.4 + 4 * 0.2)
+
+
+class PrepareBatchTest(unittest.TestCase):
+    def _ack(self, slot, ballot, stage=Stage.PreAccepted):
+        return packet.PrepareResponseAck(slot, ballot, None, 0, [], stage)
+
+    def test_reply(self):
+        a, b, c = Slot(5, 0), Slot(5, 1), Slot(5, 2)
+        ballot = Ballot(0, 1, 1)
+
+        batch = PrepareBatch(0)
+        for slot in (a, b, c):
+            batch.add(1, slot, _inst(Stage.PreAccepted, ballot))
+
+        self.assertEqual(batch.request(), packet.PrepareBatchRequest(0, [a, b, c], [ballot] * 3))
+
+        dropped = batch.reply(2, packet.PrepareBatchResponse(
+            0,
+            # an ack for an older ballot of ours is not counted
+            [self._ack(a, ballot), self._ack(c, Ballot(0, 0, 5))],
+            [packet.PrepareResponseNack(b, Ballot(0, 2, 3))],
+            [c, Slot(5, 9)]
+        ))
+
+        self.assertEqual(dropped, [b, c])
+        self.assertEqual(sorted(batch.ballots), [a])
+        self.assertEqual([x.p for x in batch.replies[a]], [1, 2])
+
+        # a peer only counts once
+        self.assertEqual(batch.reply(2, packet.PrepareBatchResponse(0, [], [packet.PrepareResponseNack(a, ballot)], [])), [])
+        self.assertEqual(len(batch), 1)
+
+    def test_slow_quorum(self):
+        leader = LeaderCoroutine(QUORUM, Configuration())
+        slots = [Slot(5, 0), Slot(5, 1)]
+        insts = {x: _inst(Stage.Accepted, Ballot(0, 0, 5)) for x in slots}
+
+        drive(leader.prepare_batch(slots), insts)
+        [batch] = leader.batches.values()
+        ballot = batch.ballots[slots[0]]
+
+        def reply(peer):
+            rep = packet.PrepareBatchResponse(batch.id, [self._ack(x, ballot, Stage.Accepted) for x in slots], [], [])
+            return drive(leader.prepare_batch_reply(peer, rep), insts)
+
+        # us and a single peer are not a slow quorum of 5 replicas
+        self.assertEqual(reply(2), [])
+        self.assertIn(batch.id, leader.batches)
+
+        reqs = reply(3)
+
+        self.assertEqual(leader.batches, {})
+        self.assertEqual(leader.batch_of, {})
+        self.assertEqual(sorted(leader.subs), slots)
+        self.assertEqual(
+            sorted(x.payload.slot for x in reqs if isinstance(x, Send) and isinstance(x.payload, packet.AcceptRequest)),
+            sorted(slots * len(QUORUM.peers))
+        )
+
+        # too late to count
+        self.assertEqual(reply(4), [])
+
+
+class CommitBatchTest(unittest.TestCase):
+    def test_commit_batch(self):
+        ballot = Ballot(0, 1, 5)
+        ok, moved, committed, old = [Slot(5, x) for x in range(4)]
+
+        insts = {
+            ok: _inst(Stage.Accepted, ballot),
+            # prepared by someone else since, so our attributes may not be the ones that were committed
+            moved: _inst(Stage.PreAccepted, Ballot(0, 2, 3)),
+            committed: _inst(Stage.Committed, ballot),
+        }
+
+        commit = packet.CommitBatchRequest([ok, moved, committed, old], [ballot] * 4)
+        reqs = drive(acceptor_commit_batch(QUORUM, 5, commit), insts)
+
+        self.assertEqual([x for x in reqs if not isinstance(x, Load)], [
+            Store(ok, InstanceStoreState(ballot, State(Stage.Committed, None, 0, []))),
+            LeaderStop(ok, 'acceptor'),
+        ])
+        self.assertEqual(insts[moved], _inst(Stage.PreAccepted, Ballot(0, 2, 3)))
+        self.assertNotIn(old, insts)
+
+
+class SlotWindowTest(unittest.TestCase):
+    def test_window(self):
+        w = SlotWindow()
+
+        for i in (3, 5, 1):
+            w[Slot(1, i)] = i
+        w[Slot(2, 7)] = 7
+        del w[Slot(1, 3)]
+
+        self.assertEqual(len(w), 3)
+        self.assertEqual(sorted(w.items()), [(Slot(1, 1), 1), (Slot(1, 5), 5), (Slot(2, 7), 7)])
+        self.assertNotIn(Slot(1, 3), w)
+        self.assertEqual(w.pop(Slot(1, 4), None), None)
+
+        self.assertEqual(w.purge({1: Slot(1, 5), 2: Slot(2, 0), 3: Slot(3, 9)}), {1: [1]})
+        self.assertEqual(sorted(w), [Slot(1, 5), Slot(2, 7)])
+
+        w[Slot(1, 6)] = 6
+        self.assertEqual(w.purge({1: Slot(1, 10), 2: Slot(2, 8)}), {1: [5, 6], 2: [7]})
+        self.assertEqual(len(w), 0)
+
+
+    def test_far(self):
+        w = SlotWindow(max_gap=4)
+
+        for i in (10, 100, 2):
+            w[Slot(1, i)] = i
+
+        # neither is in the list, which only spans 10
+        self.assertEqual(len(w.lists[1]), 1)
+        self.assertEqual(len(w), 3)
+        self.assertEqual(sorted(w.items()), [(Slot(1, 2), 2), (Slot(1, 10), 10), (Slot(1, 100), 100)])
+        self.assertEqual(w[Slot(1, 100)], 100)
+
+        # the list grows down to 4 in steps within the gap
+        for i in (8, 6, 7, 4):
+            w[Slot(1, i)] = i
+
+        self.assertEqual(w.bases[1], 4)
+        self.assertEqual(w.far, {1: {2: 2, 100: 100}})
+
+        # and takes the slot it reaches
+        w[Slot(1, 2)] = 0
+
+        self.assertEqual(w.far, {1: {100: 100}})
+        self.assertEqual(len(w), 7)
+        self.assertEqual(w[Slot(1, 2)], 0)
+
+        self.assertEqual(w.pop(Slot(1, 100)), 100)
+        w[Slot(1, 50)] = 50
+
+        self.assertEqual(w.purge({1: Slot(1, 60)}), {1: [0, 4, 6, 7, 8, 10, 50]})
+        self.assertEqual((len(w), w.far), (0, {}))
+
+
+class SlotFlagsTest(unittest.TestCase):
+    def test_cut(self):
+        flags = SlotFlags()
+
+        for i in (0, 1, 2, 4):
+            flags.set(Slot(1, i), COMMITTED)
+
+        self.assertFalse(flags.set(Slot(1, 1), EXECUTED))
+        self.assertFalse(flags.set(Slot(1, 4), EXECUTED))
+        self.assertEqual(flags.cut(1), Slot(1, -1))
+
+        # up to the committed one that has not been executed
+        self.assertTrue(flags.set(Slot(1, 0), EXECUTED))
+        self.assertEqual(flags.cut(1), Slot(1, 1))
+        self.assertEqual(flags.get(Slot(1, 2)), COMMITTED)
+        self.assertEqual(flags.get(Slot(1, 3)), 0)
+
+        self.assertTrue(flags.set(Slot(1, 2), EXECUTED))
+        self.assertEqual(flags.cut(1), Slot(1, 2))
+
+        self.assertEqual(flags.get(Slot(1, 0)), COMMITTED | EXECUTED)
+        self.assertEqual(flags.get(Slot(2, 0)), 0)
+
+
+class LowWaterMarkTest(unittest.TestCase):
+    def test_mark(self):
+        marks = LowWaterMark(QUORUM)
+        ours = {1: Slot(1, 9), 2: Slot(2, 4)}
+
+        marks.update(2, {1: Slot(1, 7), 2: Slot(2, 4)})
+        marks.update(3, {1: Slot(1, 8)})
+        # not every live peer has sent its cut
+        self.assertEqual(marks.mark(ours), None)
+
+        # nobody knows if 3 has executed anything of 2
+        marks.update(4, {1: Slot(1, 12), 2: Slot(2, 6)})
+        marks.update(5, {1: Slot(1, 12), 2: Slot(2, 6)})
+        self.assertEqual(marks.mark(ours), {1: Slot(1, 8)})
+
+        # 2 is slow, and holds the mark at its cut however old it is
+        marks.update(3, {1: Slot(1, 9), 2: Slot(2, 1)})
+        self.assertEqual(marks.mark(ours), {1: Slot(1, 8), 2: Slot(2, 2)})
+
+        # until it is taken for dead
+        marks.alive(2, False)
+        self.assertEqual(marks.mark(ours), {1: Slot(1, 10), 2: Slot(2, 2)})
+
+        # and does not move the mark back once it is alive again
+        marks.alive(2, True)
+        marks.update(2, {1: Slot(1, 3), 2: Slot(2, 0)})
+        self.assertEqual(marks.mark(ours), {1: Slot(1, 10), 2: Slot(2, 2)})
+
+
+class DepsCacheTest(unittest.TestCase):
+    def test_checkpoint(self):
+        cache = KeyedDepsCache()
+
+        for i, keys in enumerate([[1, 2], [2, 3], [4], [1]]):
+            cache.xchange(Slot(i % 2 + 1, i), Command(CommandID.create(), Mutator('SET', keys)))
+
+        seq, deps = cache.xchange(Slot(1, 10), Command(CommandID.create(), Checkpoint(0)))
+
+        self.assertEqual((seq, deps), (2, [Slot(1, 2), Slot(2, 3)]))
+        self.assertEqual(cache.store, {})
+
+        # the next one depends on the previous checkpoint, and what came after it
+        cache.xchange(Slot(2, 11), Command(CommandID.create(), Mutator('SET', [5])))
+        seq, deps = cache.xchange(Slot(2, 12), Command(CommandID.create(), Checkpoint(1)))
+
+        self.assertEqual((seq, deps), (4, [Slot(1, 10), Slot(2, 11)]))
+
+    def test_ranges(self):
+        cache = KeyedDepsCache()
+
+        def xchange(slot, mut):
+            return cache.xchange(slot, Command(CommandID.create(), mut))
+
+        xchange(Slot(1, 0), Mutator('SET', [5, 50]))
+        xchange(Slot(1, 1), Mutator('SET', [7]))
+        self.assertEqual(xchange(Slot(1, 2), RangeMutator('DEL', [], [KeyRange(0, 10)])), (1, [Slot(1, 0), Slot(1, 1)]))
+
+        # a key within the range is ordered after it, one without is not
+        self.assertEqual(xchange(Slot(1, 3), Mutator('SET', [3])), (2, [Slot(1, 2)]))
+        self.assertEqual(xchange(Slot(1, 4), Mutator('SET', [10])), (0, []))
+
+        # ranges interfere with each other, and with the point writes since
+        self.assertEqual(
+            xchange(Slot(1, 5), RangeMutator('SCAN', [50], [KeyRange(9, 20)])),
+            (2, [Slot(1, 0), Slot(1, 2), Slot(1, 4)])
+        )
+
+    def test_range_index(self):
+        index = RangeIndex()
+        a, b, c = [CacheState(Slot(1, x), x) for x in range(3)]
+
+        index.paint(0, 10, b)
+        index.paint(5, 20, a)
+        index.paint(2, 6, c)
+
+        self.assertEqual(list(zip(index.starts, index.ends, index.states)), [
+            (0, 2, b), (2, 6, c), (6, 10, b), (10, 20, a),
+        ])
+        self.assertEqual(index.at(1), b)
+        self.assertEqual(index.at(20), None)
+        self.assertEqual(index.overlapping(5, 11), [c, b, a])
+
+        index.purge(lambda x: x < Slot(1, 1))
+        self.assertEqual(index.overlapping(0, 30), [b, c, b])
@@ -0,0 +1,66 @@
+import random
+import time
+import unittest
+from multiprocessing import Process
+
+from dsm.epaxos.net.impl.generic.ring import Ring
+
+N = 20000
+
+
+def _record(i: int, rnd: random.Random) -> bytes:
+    return i.to_bytes(4, 'little') + bytes([i % 256]) * rnd.randint(0, 200)
+
+
+def _produce(ring: Ring):
+    rnd = random.Random(0)
+    i = 0
+
+    while i < N:
+        # the record is drawn once, a push to a full ring is retried with the same one
+        x = _record(i, rnd)
+
+        while not ring.push(x):
+            ring.notify()
+
+        ring.notify()
+        i += 1
+
+
+class RingTest(unittest.TestCase):
+    def test_wrap(self):
+        ring = Ring(1024)
+        rnd = random.Random(0)
+        queued = []
+
+        for i in range(N):
+            if rnd.random() < 0.5:
+                x = _record(i, rnd)
+                if ring.push(x):
+                    queued.append(x)
+            else:
+                self.assertEqual(ring.pop(), queued.pop(0) if len(queued) else None)
+
+        self.assertGreater(ring.dropped, 0)
+        ring.close()
+
+    def test_processes(self):
+        ring = Ring(4096)
+        producer = Process(target=_produce, args=(ring,), daemon=True)
+        producer.start()
+
+        rnd = random.Random(0)
+        deadline = time.monotonic() + 30.
+
+        try:
+            for i in range(N):
+                while not ring.wait(1.):
+                    self.assertLess(time.monotonic(), deadline, i)
+                self.assertEqual(ring.pop(), _record(i, rnd))
+
+            producer.join(5.)
+            self.assertEqual(producer.exitcode, 0)
+        finally:
+            if producer.is_alive():
+                producer.terminate()
+            ring.close()
@@ -0,0 +1,72 @@
+import unittest
+
+from dsm.epaxos.cmd.state import Command, CommandID, Mutator, RangeMutator, KeyRange
+from dsm.epaxos.net.impl.generic.server import ReplicaServer
+from dsm.epaxos.net.packet import Packet, ClientRequest, ClientRejected
+from dsm.epaxos.net.shard import ShardMap
+from dsm.epaxos.replica.net.main import NetActor
+from dsm.epaxos.replica.quorum.ev import ReplicaAddress
+from dsm.serializer import serialize_json, deserialize_json
+
+REPLICAS = {i: ReplicaAddress(f'udp://127.0.0.1:{60000 + i}', f'udp://127.0.0.1:{61000 + i}') for i in range(1, 4)}
+
+
+class CapturingNetActor(NetActor):
+    def __init__(self, group):
+        super().__init__(group)
+        self.sent = []
+
+    def send(self, s):
+        self.sent.append(s)
+
+
+class CapturingServer(ReplicaServer):
+    def build_net_actor(self, group):
+        return CapturingNetActor(group)
+
+
+def _request(keys, group=0):
+    command = Command(CommandID.create(), Mutator('SET', keys))
+    return Packet(100, 1, ClientRequest.__name__, ClientRequest(command), group)
+
+
+class ShardTest(unittest.TestCase):
+    def test_route(self):
+        shards = ShardMap(4, 100)
+
+        self.assertEqual(shards.route(_request([5, 9]).payload.command), 1)
+        self.assertEqual(shards.route(_request([5, 6]).payload.command), None)
+        self.assertEqual(ShardMap().route(_request([5, 6]).payload.command), 0)
+
+        scan = Command(CommandID.create(), RangeMutator('SCAN', [5], [KeyRange(0, 10)]))
+        self.assertEqual(shards.route(scan), None)
+        self.assertEqual(ShardMap().route(scan), 0)
+
+        self.assertEqual(shards.addresses(REPLICAS, 2)[3], ReplicaAddress('udp://127.0.0.1:60203', 'udp://127.0.0.1:61203'))
+
+    def test_packet_group(self):
+        for group in (0, 3):
+            x = _request([1], group)
+            self.assertEqual(deserialize_json(Packet, serialize_json(x)), x)
+
+        scan = Command(CommandID.create(), RangeMutator('SCAN', [1], [KeyRange(0, 10), KeyRange(20, 30)]))
+        x = Packet(100, 1, ClientRequest.__name__, ClientRequest(scan), 0)
+        self.assertEqual(deserialize_json(Packet, serialize_json(x)), x)
+
+    def test_dispatch(self):
+        server = CapturingServer(0, 1, REPLICAS, ShardMap(2), log_dir=None)
+
+        # sent to the wrong group, handed to the right one
+        server.dispatch(_request([3], group=0))
+        self.assertEqual(len(server.replicas[0].main.clients.requests), 0)
+        self.assertEqual(len(server.replicas[1].main.clients.requests), 1)
+
+        server.dispatch(_request([3, 4]))
+        [x] = server.net_actors[0].sent
+        self.assertEqual(x.payload.reason, 'CROSS_SHARD')
+
+        worker = CapturingServer(0, 1, REPLICAS, ShardMap(2, 100), [0], log_dir=None)
+        worker.dispatch(_request([3]))
+        [x] = worker.net_actors[0].sent
+        self.assertIsInstance(x.payload, ClientRejected)
+        self.assertEqual(x.payload.reason, 'WRONG_GROUP')
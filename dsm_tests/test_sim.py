@@ -0,0 +1,158 @@
+import unittest
+from collections import Counter
+
+from dsm.epaxos.cmd.state import Command, CommandID, Mutator
+from dsm.epaxos.inst.state import Stage, Slot
+from dsm.epaxos.net.impl.sim.cluster import SimCluster, EPOCH
+from dsm.epaxos.net.impl.sim.network import LinkConfig
+from dsm.epaxos.replica.quorum.ev import Configuration
+
+
+def run(seed, loss=0.03, kill=20, config=Configuration()):
+    cluster = SimCluster(5, seed, LinkConfig(loss=loss), config, serialize=True)
+
+    for i in range(100):
+        cluster.request(cluster.command([cluster.random.randint(1, 5)]))
+        if i % 10 == 0:
+            cluster.step()
+
+    cluster.run(kill)
+    cluster.kill(5)
+    cluster.run_until(lambda: len(cluster.pending) == 0, 30 * 33)
+    return cluster
+
+
+class SimTest(unittest.TestCase):
+    def test_agreement(self):
+        cluster = run(1)
+
+        self.assertEqual(len(cluster.pending), 0)
+        self.assertEqual(len(cluster.latencies), 100)
+        self.assertEqual(cluster.diverged(), {})
+
+    def test_store_stats(self):
+        cluster = run(3)
+        # past a couple of checkpoints, so that some of the instances have been purged
+        cluster.run(3 * cluster.config.checkpoint_each)
+
+        for replica in cluster.replicas.values():
+            stats = replica.store.stats()
+            insts = replica.store.inst
+
+            self.assertEqual(stats.total, len(insts))
+            self.assertEqual(stats.stages, {k: sum(1 for x in insts.values() if x.state.stage == k) for k in Stage})
+            self.assertEqual(
+                {k: v for k, v in stats.origins.items() if v},
+                dict(Counter(x.replica_id for x in insts.keys()))
+            )
+
+    def test_command_ids(self):
+        cluster = run(4)
+        cluster.run(3 * cluster.config.checkpoint_each)
+
+        for replica in cluster.replicas.values():
+            for slot, inst in replica.store.inst.items():
+                if inst.state.command:
+                    self.assertEqual(Slot(*inst.state.command.id.slot), slot)
+                    self.assertEqual(replica.store.load_cmd_slot(inst.state.command.id), (slot, inst))
+
+        # allocated before the checkpoints, so nobody knows if it had been executed
+        old = Command(CommandID.create(at=EPOCH, nonce=1), Mutator('SET', [1]))
+        cluster.request(old)
+        cluster.run(5)
+
+        self.assertEqual(cluster.rejected, {old.id.request: 'TOO_OLD'})
+
+    def _resend(self, bound):
+        cluster = SimCluster(5, 0)
+        command = cluster.command([1])
+
+        cluster.request(command, replica_id=1)
+
+        if bound:
+            # the ID replica 1 has sent back in its `ClientStarted`
+            cluster.run(2)
+            command = command._replace(id=command.id.bind(1, 0))
+
+        # the client gave up on replica 1 and resent the command to replica 2
+        cluster.request(command, replica_id=2)
+        cluster.run_until(lambda: len(cluster.pending) == 0, 10 * 33)
+        cluster.run(5)
+
+        self.assertEqual(len(cluster.pending), 0)
+
+        slots = set()
+
+        for replica in cluster.replicas.values():
+            slots |= {
+                slot for slot, inst in replica.store.inst.items()
+                if inst.state.command and inst.state.command.id.request == command.id.request
+            }
+
+        duplicates = [x.main.executor.m_duplicates.value for x in cluster.replicas.values()]
+        return slots, duplicates
+
+    def test_resend_bound(self):
+        slots, duplicates = self._resend(True)
+
+        self.assertEqual(slots, {Slot(1, 0)})
+        self.assertEqual(duplicates, [0] * 5)
+
+    def test_resend_before_preaccept(self):
+        # replica 2 has not seen the PreAccept of replica 1, and starts the command again
+        slots, duplicates = self._resend(False)
+
+        self.assertEqual(slots, {Slot(1, 0), Slot(2, 0)})
+        # but executes it once
+        self.assertEqual(duplicates, [1] * 5)
+
+    def test_failover(self):
+        cluster = SimCluster(5, 0)
+        command = cluster.command([1])
+
+        cluster.request(command, replica_id=1)
+        # replica 1 has started the command, and dies before its PreAccepts arrive
+        cluster.advance(0.001)
+        cluster.kill(1)
+
+        cluster.run_until(lambda: len(cluster.pending) == 0, 30 * 33)
+        cluster.run(5)
+
+        self.assertEqual(len(cluster.pending), 0)
+
+        for replica_id in cluster.alive:
+            replica = cluster.replicas[replica_id]
+            slots = [
+                slot for slot, inst in replica.store.inst.items()
+                if inst.state.command and inst.state.command.id.request == command.id.request
+            ]
+
+            # the client failed over with the bound ID, and the slot of replica 1 was recovered
+            self.assertEqual(slots, [Slot(1, 0)])
+            self.assertEqual(replica.main.executor.m_duplicates.value, 0)
+
+    def test_low_water_mark(self):
+        for window in (True, False):
+            cluster = run(5, config=Configuration(checkpoint_window=window))
+            cluster.run(3 * cluster.config.checkpoint_each)
+
+            self.assertEqual(cluster.diverged(), {})
+
+            for replica_id in cluster.alive:
+                insts = cluster.replicas[replica_id].store.inst
+
+                if window:
+                    # everything has been executed by every live replica, so nothing is left
+                    self.assertEqual(len(insts), 0)
+                    # once the failure detector has left the killed one out
+                    self.assertEqual(cluster.replicas[replica_id].main.executor.marks.dead, {5})
+                else:
+                    # the last `Checkpoint` commands, and whatever came after the one before them
+                    self.assertGreater(len(insts), 0)
+
+    def test_reproducible(self):
+        a = run(2)
+        b = run(2)
+
+        self.assertEqual(a.latencies, b.latencies)
+        self.assertEqual(a.network.stats.send, b.network.stats.send)
@@ -0,0 +1,92 @@
+import os
+import socket
+import struct
+import tempfile
+import unittest
+
+from dsm.epaxos.net.impl.tcp.client import TCPReplicaClient
+from dsm.epaxos.net.impl.tcp.server import TCPReplicaServer
+from dsm.epaxos.net.impl.tcp.util import Connection
+from dsm.epaxos.net.impl.zeromq.client import ZMQReplicaClient
+from dsm.epaxos.net.impl.zeromq.server import ZMQReplicaServer
+from dsm.epaxos.net.packet import PingRequest, PongResponse
+from dsm.epaxos.replica.quorum.ev import ReplicaAddress
+
+
+def _replicas(scheme, port):
+    return {i: ReplicaAddress(f'{scheme}://127.0.0.1:{port + i}', f'{scheme}://127.0.0.1:{port + 100 + i}') for i in
+            range(1, 4)}
+
+
+def _pump(server, client, n):
+    """
+    Run the server until the client has received `n` packets.
+    """
+    r = []
+
+    for _ in range(200):
+        if server.poll(0.01):
+            for x in server.recv():
+                server.dispatch(x)
+
+        server.flush()
+        server.send()
+
+        while len(r) < n and client.poll(0.):
+            r.append(client.recv())
+
+        if len(r) == n:
+            return r
+
+    raise AssertionError(r)
+
+
+class TransportTest(unittest.TestCase):
+    def _ping(self, server_cls, client_cls, replicas):
+        with server_cls(0, 1, replicas, log_dir=None) as server, client_cls(100, replicas) as client:
+            # the pongs are sent together
+            client.send_packet(1, PingRequest(1))
+            client.send_packet(1, PingRequest(2))
+
+            r = _pump(server, client, 2)
+
+            self.assertEqual([x.payload for x in r], [PongResponse(1), PongResponse(2)])
+            self.assertEqual({x.origin for x in r}, {1})
+
+    def test_zmq(self):
+        self._ping(ZMQReplicaServer, ZMQReplicaClient, _replicas('tcp', 62300))
+
+    def test_tcp(self):
+        self._ping(TCPReplicaServer, TCPReplicaClient, _replicas('tcp', 62400))
+
+    def test_unix(self):
+        with tempfile.TemporaryDirectory() as path:
+            replicas = {
+                i: ReplicaAddress(f'unix://{path}/replica-{i}', f'unix://{path}/client-{i}') for i in range(1, 4)
+            }
+            self._ping(TCPReplicaServer, TCPReplicaClient, replicas)
+
+            # the socket file is removed by `close`
+            self.assertFalse(os.path.exists(f'{path}/replica-1'))
+
+    def test_tcp_frames(self):
+        a, b = socket.socketpair()
+        sender, receiver = Connection(a, 2), Connection(b, size=16)
+
+        bodies = [b'x' * 100000, b'y', b'']
+
+        sender.hello(1)
+        for x in bodies:
+            sender.push(struct.pack('I', len(x)) + x)
+
+        r = []
+        while len(r) < len(bodies):
+            sender.flush()
+            self.assertTrue(receiver.fill())
+            r.extend(bytes(x) for x in receiver.frames())
+
+        self.assertEqual(receiver.peer, 1)
+        self.assertEqual(r, bodies)
+
+        sender.close()
+        receiver.close()